@@ -3,26 +3,30 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 
+from app.config import get_config
+from app.storage import configure_storage, install_pragmas, ensure_indexes
+
 db = SQLAlchemy()
 migrate = Migrate()
 
 
-def create_app():
+def create_app(config_name=None):
     app = Flask(__name__)
     
-    # 基础配置
-    app.config['SECRET_KEY'] = 'your-secret-key-here-change-in-production'
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///annotation.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    # 加载配置（按 FLASK_ENV 选择，见 app/config.py）
+    app.config.from_object(get_config(config_name))
     
-    # 文件直接读取内容存入数据库，不需要保存到文件系统
-    app.config['ALLOWED_EXTENSIONS'] = {'txt', 'csv'}
+    # 存储方案：连接池设置需在创建引擎前写入配置
+    storage_profile = configure_storage(app)
     
     # 初始化扩展
     db.init_app(app)
     migrate.init_app(app, db)
     
+    # 每个新连接建立时设置 SQLite PRAGMA（WAL、忙等待超时等）
+    with app.app_context():
+        install_pragmas(db.engine, storage_profile)
+    
     # 注册蓝图
     from app.views import views_bp
     from app.api import api_bp
@@ -30,9 +34,37 @@ def create_app():
     app.register_blueprint(views_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
     
-    # 创建数据库表
+    from app.result_cache import result_cache
+    result_cache.configure(
+        memory_max_bytes=app.config['ANNOTATE_CACHE_MEMORY_MAX_BYTES'],
+        db_max_bytes=app.config['ANNOTATE_CACHE_DB_MAX_BYTES']
+    )
+    
+    from app.jobs import job_manager
+    job_manager.configure(
+        max_workers=app.config['JOB_MAX_WORKERS'],
+        import_workers=app.config['JOB_IMPORT_WORKERS'],
+        max_pending=app.config['JOB_MAX_PENDING'],
+        abandon_timeout=app.config['JOB_ABANDON_TIMEOUT'],
+        result_ttl=app.config['JOB_RESULT_TTL']
+    )
+    
+    from app.chunked_upload import upload_store
+    upload_store.configure(
+        root=app.config['CHUNKED_UPLOAD_DIR'],
+        chunk_bytes=app.config['CHUNKED_UPLOAD_CHUNK_BYTES'],
+        max_bytes=app.config['CHUNKED_UPLOAD_MAX_BYTES'],
+        ttl=app.config['CHUNKED_UPLOAD_TTL']
+    )
+    
+    # 创建数据库表（含全文检索的 FTS5 虚拟表）
+    from app.search_index import ensure_search_table
+    from app.knowledge_search import ensure_knowledge_index
     with app.app_context():
         db.create_all()
+        ensure_indexes(db.metadata, db.engine)
+        ensure_search_table(db.engine)
+        ensure_knowledge_index()
     
     # 错误处理
     @app.errorhandler(404)
@@ -0,0 +1,397 @@
+# app/annotation_store.py
+"""
+标注保存
+
+词语/实体标注按批次用 executemany 方式批量插入，不为每行创建 ORM 对象，
+整个保存过程在调用方的同一事务内完成（由调用方提交或回滚）。
+
+词语标注按 WORD_STORAGE 配置写入行存储或紧凑存储（见 app/token_store.py）。
+
+除整体替换外，还支持基于修订号的增量保存：客户端提交相对某个修订号的
+新增/删除/修改，只写变化的行；修订号不一致说明标注已被其他保存修改，
+此时拒绝增量保存，由调用方改为整体替换。
+词语以字符区间 (start_pos, end_pos) 标识、word_index 只表示位置（见 merge_word_patch），
+实体以 (start_pos, end_pos, text) 标识。
+"""
+from datetime import datetime
+
+from app import db
+from app.models import TextAnnotation, WordAnnotation, EntityAnnotation, KnowledgeEntity, AnnotationRevision
+from app.knowledge_cache import bump_knowledge_version
+from app.knowledge_search import index_entities
+from app.storage import upsert_insert
+from app.stats_store import track_annotation_counts
+from app.token_store import (
+    get_word_storage, load_word_annotations, write_pack, delete_word_annotations, has_pack
+)
+
+# 每条 INSERT 语句携带的行数
+SAVE_BATCH_SIZE = 5000
+
+
+def bulk_insert(model, rows, batch_size=SAVE_BATCH_SIZE):
+    """按批次批量插入字典行"""
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(db.insert(model), rows[i:i + batch_size])
+
+
+def build_word_row(file_id, word_index, word_data):
+    return {
+        'file_id': file_id,
+        'word_index': word_index,
+        'word': word_data.get('word', ''),
+        'pos': word_data.get('pos', 'n'),
+        'pos_cn': word_data.get('pos_cn', '名词'),
+        'start_pos': word_data.get('start_pos', 0),
+        'end_pos': word_data.get('end_pos', 0)
+    }
+
+
+def build_word_rows(file_id, word_annotations):
+    return [
+        build_word_row(file_id, idx, word_data)
+        for idx, word_data in enumerate(word_annotations)
+    ]
+
+
+def build_entity_rows(file_id, entity_annotations):
+    """返回 (实体行, 手动标注的 (text, label) 列表)，跳过缺少文本或类型的实体"""
+    rows, manual = [], []
+    for entity_data in entity_annotations:
+        entity_text = entity_data.get('text', '')
+        entity_label = entity_data.get('label', '')
+        if not entity_text or not entity_label:
+            continue
+        rows.append({
+            'file_id': file_id,
+            'text': entity_text,
+            'label': entity_label,
+            'start_pos': entity_data.get('start_pos', 0),
+            'end_pos': entity_data.get('end_pos', 0)
+        })
+        if entity_data.get('is_manual', False):
+            manual.append((entity_text, entity_label))
+    return rows, manual
+
+
+# ---------- 修订号 ----------
+
+def get_revision(file_id):
+    """文件当前的标注修订号（从未保存过为 0）"""
+    revision = db.session.scalar(
+        db.select(AnnotationRevision.revision).where(AnnotationRevision.file_id == file_id)
+    )
+    return revision or 0
+
+
+def advance_revision(file_id, base_revision=None):
+    """
+    修订号加一并返回新值
+    指定 base_revision 时只有当前修订号与之相同才加一（比较并更新为一条 UPDATE），否则返回 None
+    """
+    table = AnnotationRevision.__table__
+    stmt = db.update(table).where(table.c.file_id == file_id).values(
+        revision=table.c.revision + 1, update_time=datetime.utcnow()
+    )
+    if base_revision is not None:
+        stmt = stmt.where(table.c.revision == base_revision)
+
+    if db.session.execute(stmt).rowcount:
+        return get_revision(file_id)
+    if base_revision not in (None, 0):
+        return None
+
+    # 从未保存过：先插入修订号为 0 的行再重新比较并更新。并发的首次保存只有一方插入成功，
+    # 另一方的比较并更新失败（返回 None，由调用方按冲突处理），而不是插入时违反主键约束
+    insert = upsert_insert(db.session.get_bind().dialect.name)
+    if insert is not None:
+        db.session.execute(
+            insert(table).values(file_id=file_id, revision=0).on_conflict_do_nothing(index_elements=['file_id'])
+        )
+    elif db.session.scalar(db.select(table.c.file_id).where(table.c.file_id == file_id)) is None:
+        db.session.add(AnnotationRevision(file_id=file_id, revision=0))
+        db.session.flush()
+
+    if db.session.execute(stmt).rowcount:
+        return get_revision(file_id)
+    return None
+
+
+def aggregate_manual_entities(manual_entities):
+    """按文本聚合手动实体，返回 {text: (出现次数, 最后一次的类型)}，保持首次出现顺序"""
+    aggregated = {}
+    for entity_text, entity_label in manual_entities:
+        count = aggregated[entity_text][0] if entity_text in aggregated else 0
+        aggregated[entity_text] = (count + 1, entity_label)
+    return aggregated
+
+
+def update_knowledge(manual_entities):
+    """
+    手动标注的实体加入知识库：已存在则频次加上出现次数并更新类型，否则新增
+    同一文本出现多次时以最后一次的类型为准
+    返回 (新增数, 更新数)
+    """
+    aggregated = aggregate_manual_entities(manual_entities)
+    if not aggregated:
+        return 0, 0
+
+    table = KnowledgeEntity.__table__
+    texts = list(aggregated)
+    existing = set()
+    for i in range(0, len(texts), SAVE_BATCH_SIZE):
+        existing.update(db.session.scalars(
+            db.select(table.c.text).where(table.c.text.in_(texts[i:i + SAVE_BATCH_SIZE]))
+        ))
+
+    now = datetime.utcnow()
+    rows = [
+        {'text': text, 'label': label, 'source': 'manual', 'frequency': count,
+         'create_time': now, 'update_time': now}
+        for text, (count, label) in aggregated.items()
+    ]
+
+    insert = upsert_insert(db.session.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.text],
+            set_={
+                'frequency': table.c.frequency + stmt.excluded.frequency,
+                'label': stmt.excluded.label,
+                'update_time': stmt.excluded.update_time
+            }
+        )
+        for i in range(0, len(rows), SAVE_BATCH_SIZE):
+            db.session.execute(stmt, rows[i:i + SAVE_BATCH_SIZE])
+    else:
+        # 不支持 ON CONFLICT 的数据库：按查询结果分为批量更新和批量插入
+        updates = [
+            {'b_text': row['text'], 'b_count': row['frequency'],
+             'b_label': row['label'], 'b_time': now}
+            for row in rows if row['text'] in existing
+        ]
+        if updates:
+            db.session.execute(
+                db.update(table).where(table.c.text == db.bindparam('b_text')).values(
+                    frequency=table.c.frequency + db.bindparam('b_count'),
+                    label=db.bindparam('b_label'),
+                    update_time=db.bindparam('b_time')
+                ),
+                updates
+            )
+        bulk_insert(table, [row for row in rows if row['text'] not in existing])
+
+    # 批量插入不触发 ORM 事件，新实体在这里建立子串索引
+    index_entities(text for text in texts if text not in existing)
+    bump_knowledge_version()
+    return len(rows) - len(existing), len(existing)
+
+
+# ---------- 保存 ----------
+
+def replace_text_annotation(file_id, text_category, text_sentiment):
+    TextAnnotation.query.filter_by(file_id=file_id).delete()
+    if text_category or text_sentiment:
+        db.session.add(TextAnnotation(
+            file_id=file_id,
+            text_category=text_category,
+            text_sentiment=text_sentiment
+        ))
+
+
+def replace_words(file_id, word_annotations):
+    """按当前存储格式替换文件的全部词语标注，返回词语数"""
+    delete_word_annotations(file_id)
+    if get_word_storage() == 'packed':
+        return write_pack(file_id, word_annotations)
+    word_rows = build_word_rows(file_id, word_annotations)
+    bulk_insert(WordAnnotation, word_rows)
+    return len(word_rows)
+
+
+def _span(word_data):
+    return word_data.get('start_pos'), word_data.get('end_pos')
+
+
+def merge_word_patch(base_words, words):
+    """
+    把词语增量应用到原词语列表（按 word_index 排序），返回新的词语列表（按位置排序）
+    words: {'removed': [原 word_index], 'modified': [词语], 'added': [词语]}
+    modified 按字符区间 (start_pos, end_pos) 对应原词语，added 的 word_index 为该词在新列表中的位置；
+    其余原词语保持相对顺序，依次填入新增词语之间的位置（合并、拆分不会改动后面的词）
+    """
+    removed = {int(i) for i in words.get('removed', [])}
+    modified = {_span(word_data): word_data for word_data in words.get('modified', [])}
+
+    kept = []
+    for word_data in base_words:
+        if word_data['word_index'] in removed:
+            continue
+        changes = modified.get(_span(word_data))
+        kept.append(dict(word_data, **changes, modified=True) if changes else word_data)
+
+    merged = []
+    kept = iter(kept)
+    for word_data in sorted(words.get('added', []), key=lambda w: int(w['word_index'])):
+        while len(merged) < int(word_data['word_index']):
+            word = next(kept, None)
+            if word is None:
+                break
+            merged.append(word)
+        merged.append(dict(word_data, added=True))
+    merged.extend(kept)
+    return merged
+
+
+def patch_words(file_id, words):
+    """
+    增量修改词语标注（见 merge_word_patch），返回 (新增数, 删除数, 修改数)
+    行存储只删除、插入变化的词，并更新位置改变的行；紧凑存储（或需要转换格式时）整体重写该文件的一行
+    """
+    removed = [int(i) for i in words.get('removed', [])]
+    modified = words.get('modified', [])
+    added = words.get('added', [])
+
+    if get_word_storage() == 'packed' or has_pack(file_id):
+        replace_words(file_id, merge_word_patch(load_word_annotations(file_id), words))
+        return len(added), len(removed), len(modified)
+
+    # 行存储：只读取 id、位置和区间，按合并结果删除、修改、重新编号和新增
+    word_table = WordAnnotation.__table__
+    base = [
+        {'id': row_id, 'word_index': word_index, 'start_pos': start_pos, 'end_pos': end_pos}
+        for row_id, word_index, start_pos, end_pos in db.session.execute(
+            db.select(word_table.c.id, word_table.c.word_index, word_table.c.start_pos, word_table.c.end_pos)
+            .where(word_table.c.file_id == file_id).order_by(word_table.c.word_index)
+        )
+    ]
+    removed_set = set(removed)
+    removed_ids = [word['id'] for word in base if word['word_index'] in removed_set]
+    for i in range(0, len(removed_ids), SAVE_BATCH_SIZE):
+        db.session.execute(db.delete(word_table).where(word_table.c.id.in_(removed_ids[i:i + SAVE_BATCH_SIZE])))
+
+    # 参数中与列同名的键即为 SET 子句
+    modified_rows, moved_rows, added_rows = [], [], []
+    for position, word_data in enumerate(merge_word_patch(base, words)):
+        if word_data.get('added'):
+            added_rows.append(build_word_row(file_id, position, word_data))
+        elif word_data.get('modified'):
+            row = build_word_row(file_id, position, word_data)
+            row['b_id'] = word_data['id']
+            del row['file_id']
+            modified_rows.append(row)
+        elif word_data['word_index'] != position:
+            moved_rows.append({'b_id': word_data['id'], 'word_index': position})
+
+    for rows in (modified_rows, moved_rows):
+        for i in range(0, len(rows), SAVE_BATCH_SIZE):
+            db.session.execute(
+                db.update(word_table).where(word_table.c.id == db.bindparam('b_id')),
+                rows[i:i + SAVE_BATCH_SIZE]
+            )
+
+    bulk_insert(WordAnnotation, added_rows)
+    return len(added), len(removed), len(modified)
+
+
+def save_annotations(file_id, text_category, text_sentiment, word_annotations, entity_annotations):
+    """
+    替换文件的全部标注（不提交事务）
+    返回保存的词语数、实体数、手动标注实体数、知识库新增/更新数及新的修订号
+    """
+    # 1. 保存文本标注（分类和情感）
+    replace_text_annotation(file_id, text_category, text_sentiment)
+
+    with track_annotation_counts(file_id):
+        # 2. 替换词语标注
+        saved_words = replace_words(file_id, word_annotations)
+
+        # 3. 批量替换实体标注
+        EntityAnnotation.query.filter_by(file_id=file_id).delete()
+        entity_rows, manual_entities = build_entity_rows(file_id, entity_annotations)
+        bulk_insert(EntityAnnotation, entity_rows)
+
+    # 4. 只有手动标注的实体才更新知识库（按文本聚合后批量写入）
+    knowledge_added, knowledge_updated = update_knowledge(manual_entities)
+
+    return {
+        'saved_words': saved_words,
+        'saved_entities': len(entity_rows),
+        'manual_entities': len(manual_entities),
+        'knowledge_added': knowledge_added,
+        'knowledge_updated': knowledge_updated,
+        'revision': advance_revision(file_id)
+    }
+
+
+def apply_annotation_patch(file_id, base_revision, text_annotation=None, words=None, entities=None):
+    """
+    增量保存（不提交事务），只写入变化的行
+    text_annotation: {'text_category', 'text_sentiment'}，为 None 时不修改
+    words: {'added': [词语], 'removed': [原 word_index], 'modified': [词语]}，见 merge_word_patch
+    entities: {'added': [实体], 'removed': [实体], 'modified': [实体]}，实体以 (start_pos, end_pos, text) 定位
+    修订号与 base_revision 不一致时不做任何修改，返回 None
+    """
+    revision = advance_revision(file_id, base_revision)
+    if revision is None:
+        return None
+
+    words = words or {}
+    entities = entities or {}
+
+    if text_annotation is not None:
+        replace_text_annotation(
+            file_id,
+            text_annotation.get('text_category', ''),
+            text_annotation.get('text_sentiment', '')
+        )
+
+    with track_annotation_counts(file_id):
+        added_words, removed_words, modified_words = patch_words(file_id, words)
+
+        # 实体
+        entity_table = EntityAnnotation.__table__
+        span_match = (
+            entity_table.c.file_id == file_id,
+            entity_table.c.start_pos == db.bindparam('b_start'),
+            entity_table.c.end_pos == db.bindparam('b_end'),
+            entity_table.c.text == db.bindparam('b_text')
+        )
+
+        removed_entities = [
+            {'b_start': e.get('start_pos', 0), 'b_end': e.get('end_pos', 0), 'b_text': e.get('text', '')}
+            for e in entities.get('removed', [])
+        ]
+        if removed_entities:
+            db.session.execute(db.delete(entity_table).where(*span_match), removed_entities)
+
+        modified_rows, modified_manual = build_entity_rows(file_id, entities.get('modified', []))
+        if modified_rows:
+            db.session.execute(
+                db.update(entity_table).where(*span_match),
+                [
+                    {'b_start': row['start_pos'], 'b_end': row['end_pos'],
+                     'b_text': row['text'], 'label': row['label']}
+                    for row in modified_rows
+                ]
+            )
+
+        added_rows, added_manual = build_entity_rows(file_id, entities.get('added', []))
+        bulk_insert(EntityAnnotation, added_rows)
+
+    manual_entities = added_manual + modified_manual
+    knowledge_added, knowledge_updated = update_knowledge(manual_entities)
+
+    return {
+        'added_words': added_words,
+        'removed_words': removed_words,
+        'modified_words': modified_words,
+        'added_entities': len(added_rows),
+        'removed_entities': len(removed_entities),
+        'modified_entities': len(modified_rows),
+        'manual_entities': len(manual_entities),
+        'knowledge_added': knowledge_added,
+        'knowledge_updated': knowledge_updated,
+        'revision': revision
+    }
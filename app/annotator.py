@@ -0,0 +1,132 @@
+# app/annotator.py
+"""
+智能标注入口
+
+同步接口、异步任务和批量接口共用：先查结果缓存，未命中时按文本长度
+选择单进程或分块并行分析，并把结果写回缓存。需要在应用上下文中调用。
+"""
+import time
+
+from flask import current_app
+
+from app import db
+from app.content_store import get_contents
+from app.knowledge_cache import knowledge_cache
+from app.models import TextFile
+from app.parallel import analyze_content_parallel, analyze_documents_parallel
+from app.result_cache import result_cache, make_cache_key
+from app.utils import analyze_content
+
+# 批量标注时每次从数据库读取的文档数
+BATCH_LOAD_SIZE = 50
+
+
+def smart_annotate_content(content, parallel=None, progress=None):
+    """
+    返回 (result, cache_tier, parallel)
+    cache_tier 为 'memory' / 'database'，未命中缓存时为 None
+    parallel 为 None 时按 PARALLEL_ANNOTATE_THRESHOLD 自动选择
+    """
+    # 同一内容、同一知识库版本的结果直接取缓存；缓存键和分析用同一个知识库快照
+    knowledge = knowledge_cache.snapshot()
+    cache_key = make_cache_key(content, knowledge.version)
+    result, cache_tier = result_cache.get(cache_key)
+    if result is not None:
+        if progress:
+            progress(100, '完成（缓存）')
+        return result, cache_tier, False
+
+    # 长文本按句子切块后在进程池中并行分析，结果与单进程一致
+    if parallel is None:
+        parallel = len(content) >= current_app.config['PARALLEL_ANNOTATE_THRESHOLD']
+
+    if parallel:
+        result = analyze_content_parallel(
+            content,
+            chunk_size=current_app.config['PARALLEL_ANNOTATE_CHUNK_SIZE'],
+            workers=current_app.config['PARALLEL_ANNOTATE_WORKERS'],
+            knowledge_version=knowledge.version,
+            knowledge_entities=knowledge.entities,
+            progress=progress
+        )
+        result.pop('chunks', None)
+    else:
+        result = analyze_content(content, knowledge.matcher, progress=progress)
+
+    result_cache.put(cache_key, result)
+    return result, None, bool(parallel)
+
+
+def batch_smart_annotate(file_ids, include_annotations=True, workers=None):
+    """
+    批量智能标注，逐个产出每个文件的结果，最后产出汇总（含吞吐量）
+    
+    文档内容按 BATCH_LOAD_SIZE 分批读取，不会一次性载入内存。
+    每批中缓存命中的文件立即返回，其余文件在进程池中分析。
+    """
+    workers = workers or current_app.config['PARALLEL_ANNOTATE_WORKERS']
+    knowledge = knowledge_cache.snapshot()
+    
+    started = time.perf_counter()
+    summary = {'files': 0, 'chars': 0, 'cache_hits': 0, 'errors': 0}
+    keys = {}  # file_id -> (filename, cache_key, length)
+    
+    def make_line(file_id, result, cache_tier=None, error=None):
+        filename, _, length = keys.pop(file_id)
+        summary['files'] += 1
+        summary['chars'] += length
+        line = {'file_id': file_id, 'filename': filename, 'length': length}
+        if error is not None:
+            summary['errors'] += 1
+            line.update(status='error', message=str(error))
+            return line
+        line.update(
+            status='success',
+            from_cache=cache_tier is not None,
+            cache_tier=cache_tier,
+            word_count=len(result['word_annotations']),
+            entity_count=len(result['entity_annotations']),
+            text_annotation=result['text_annotation']
+        )
+        if include_annotations:
+            line.update(
+                word_annotations=result['word_annotations'],
+                entity_annotations=result['entity_annotations']
+            )
+        return line
+    
+    # 每批先逐个输出缓存命中的文件，再把未命中的交给进程池，全部命中时也能边读边输出
+    ids = list(file_ids)
+    for i in range(0, len(ids), BATCH_LOAD_SIZE):
+        batch = ids[i:i + BATCH_LOAD_SIZE]
+        filenames = dict(db.session.query(TextFile.id, TextFile.filename).filter(
+            TextFile.id.in_(batch)
+        ).all())
+        contents = get_contents(filenames)
+        misses = []
+        for file_id in sorted(filenames):
+            filename, content = filenames[file_id], contents.pop(file_id)
+            cache_key = make_cache_key(content, knowledge.version)
+            keys[file_id] = (filename, cache_key, len(content))
+            result, cache_tier = result_cache.get(cache_key)
+            if result is not None:
+                summary['cache_hits'] += 1
+                yield make_line(file_id, result, cache_tier)
+            else:
+                misses.append((file_id, content))
+        
+        if not misses:
+            continue
+        for file_id, result, error in analyze_documents_parallel(
+            misses, workers=workers,
+            knowledge_version=knowledge.version, knowledge_entities=knowledge.entities
+        ):
+            if error is None:
+                result_cache.put(keys[file_id][1], result)
+            yield make_line(file_id, result, error=error)
+    
+    elapsed = time.perf_counter() - started
+    summary['elapsed'] = round(elapsed, 3)
+    summary['docs_per_second'] = round(summary['files'] / elapsed, 2) if elapsed > 0 else 0
+    summary['chars_per_second'] = round(summary['chars'] / elapsed, 1) if elapsed > 0 else 0
+    yield {'summary': summary}
@@ -1,13 +1,37 @@
 # app/api.py
-from flask import Blueprint, request, jsonify, Response, make_response
+from flask import Blueprint, request, jsonify, Response, make_response, current_app, stream_with_context
 from app import db
-from app.models import TextFile, TextAnnotation, WordAnnotation, EntityAnnotation, KnowledgeEntity, FileStatus
-from app.utils import segment_text, get_text_category, get_sentiment, recognize_entities, POS_12
+from app.models import TextFile, TextAnnotation, EntityAnnotation, KnowledgeEntity, KnowledgeNgram, FileStatus
+from app.utils import POS_12
+from app.knowledge_cache import knowledge_cache, bump_knowledge_version
+from app.result_cache import result_cache
+from app.annotator import smart_annotate_content, batch_smart_annotate
+from app.jobs import job_manager, JobStatus, JobQueueFull, IMPORT_POOL
+from app.annotation_store import save_annotations, apply_annotation_patch, advance_revision, get_revision
+from app.token_store import delete_word_annotations
+from app.stats_store import track_annotation_counts, get_stats_summary
+from app.content_store import get_content, get_content_slice, get_summaries, get_content_hashes, release_unused_content
+from app.file_list import list_files, MAX_PAGE_SIZE, FILE_STATUSES
+from app.exporter import stream_export, EXPORT_MIMETYPES
+from app.text_decoding import decode_upload
+from app.ingest import safe_filename, import_csv_tasks, csv_task_options, ingest_text_files
+from app.chunked_upload import upload_store, UploadError
+from app.search_index import search_files, SearchUnavailable
+from app.knowledge_search import list_entities, count_entities, unindex_entities, MAX_PAGE_SIZE as KNOWLEDGE_PAGE_SIZE
 import json
+import os
+import tempfile
 from urllib.parse import quote
 
 api_bp = Blueprint('api', __name__)
 
+# 各类异步任务完成时的提示
+JOB_RESULT_MESSAGES = {
+    'smart_annotate': '智能标注完成（未保存，请点击保存按钮）',
+    'csv_import': 'CSV文件导入完成',
+    'archive_import': '压缩包导入完成',
+}
+
 
 # ==================== 文件管理 ====================
 
@@ -15,12 +39,240 @@ api_bp = Blueprint('api', __name__)
 def delete_file(file_id):
     """删除文件"""
     text_file = TextFile.query.get_or_404(file_id)
-    db.session.delete(text_file)
+    hashes = get_content_hashes([file_id])
+    with track_annotation_counts(file_id):
+        db.session.delete(text_file)
+    release_unused_content(hashes)
     db.session.commit()
     
     return jsonify({'status': 'success', 'message': '删除成功'})
 
 
+@api_bp.route('/upload_csv_tasks', methods=['POST'])
+def upload_csv_tasks():
+    """
+    CSV 按行拆分为任务（异步），立即返回任务ID，通过 /api/jobs/<job_id> 查询导入进度
+    表单参数：file, text_column（列名或列序号，为空时合并整行）, rows_per_task, has_header
+    """
+    file = request.files.get('file')
+    if file is None or not file.filename.endswith('.csv'):
+        return jsonify({'status': 'error', 'message': '请上传.csv文件'}), 400
+    
+    filename = safe_filename(file.filename)
+    options = csv_task_options(request.form)
+    text, encoding_info = decode_upload(file.stream, current_app.config['UPLOAD_ENCODING_SAMPLE_BYTES'])
+    
+    def run(job):
+        try:
+            imported = import_csv_tasks(text, filename, progress=job.report, **options)
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            raise
+        return dict(imported, **encoding_info)
+    
+    try:
+        job = job_manager.submit(current_app._get_current_object(), 'csv_import', run,
+                                 params={'filename': filename, **options}, pool=IMPORT_POOL)
+    except JobQueueFull:
+        return jsonify({'status': 'error', 'message': '任务队列已满，请稍后重试'}), 503
+    
+    return jsonify({'status': 'success', 'job_id': job.id, 'job': job.to_dict(), 'encoding': encoding_info}), 202
+
+
+@api_bp.route('/ingest_archive', methods=['POST'])
+def ingest_archive():
+    """
+    批量导入压缩包（zip / tar / tar.gz）中的 .txt 文件（异步），立即返回任务ID
+    通过 /api/jobs/<job_id> 查询进度，/api/jobs/<job_id>/result 获取导入统计
+    """
+    # 压缩包可超过普通上传的大小限制
+    request.max_content_length = current_app.config['INGEST_MAX_ARCHIVE_BYTES']
+    file = request.files.get('file')
+    if file is None or not file.filename:
+        return jsonify({'status': 'error', 'message': '未选择文件'}), 400
+    
+    # 请求结束后上传的文件流会被关闭，先保存到临时文件，由任务读取后删除
+    fd, path = tempfile.mkstemp(prefix='ingest_', suffix=os.path.splitext(file.filename)[1])
+    with os.fdopen(fd, 'wb') as f:
+        file.save(f)
+    
+    config = current_app.config
+    
+    def run(job):
+        try:
+            return ingest_text_files(
+                path, workers=config['INGEST_WORKERS'], executor=config['INGEST_EXECUTOR'],
+                sample_bytes=config['UPLOAD_ENCODING_SAMPLE_BYTES'],
+                max_entry_bytes=config['INGEST_MAX_ENTRY_BYTES'], progress=job.report
+            )
+        finally:
+            os.remove(path)
+    
+    # 导入任务不因无人轮询而取消：已提交的批次无法回滚，中途取消会留下导入了一部分的压缩包
+    try:
+        job = job_manager.submit(current_app._get_current_object(), 'archive_import', run,
+                                 params={'filename': file.filename}, pool=IMPORT_POOL)
+    except JobQueueFull:
+        os.remove(path)
+        return jsonify({'status': 'error', 'message': '任务队列已满，请稍后重试'}), 503
+    
+    return jsonify({'status': 'success', 'job_id': job.id, 'job': job.to_dict()}), 202
+
+
+# ==================== 分块断点续传上传 ====================
+
+@api_bp.route('/uploads', methods=['POST'])
+def create_upload():
+    """
+    登记分块上传，JSON 参数：filename, size（总字节数）, chunk_size（可选）
+    返回 upload_id 和块数，之后按序号 PUT 各块，全部到齐后提交
+    """
+    data = request.get_json(silent=True) or {}
+    filename = data.get('filename') or ''
+    if not filename.endswith('.txt'):
+        return jsonify({'status': 'error', 'message': '分块上传只支持.txt文件'}), 400
+    
+    try:
+        upload = upload_store.create(safe_filename(filename), data.get('size', 0), data.get('chunk_size'))
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'size 和 chunk_size 必须为整数'}), 400
+    
+    return jsonify({'status': 'success', 'upload': upload}), 201
+
+
+@api_bp.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_upload_chunk(upload_id, index):
+    """上传第 index 块（从 0 开始），请求体为原始字节，可选 X-Chunk-SHA256 头校验内容"""
+    try:
+        chunk = upload_store.put_chunk(upload_id, index, request.stream, request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    
+    return jsonify({'status': 'success', 'chunk': chunk})
+
+
+@api_bp.route('/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """查询上传状态（已收到和缺少的块），断线后只需补传 missing 中的块"""
+    try:
+        upload = upload_store.status(upload_id)
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    
+    return jsonify({'status': 'success', 'upload': upload})
+
+
+@api_bp.route('/uploads/<upload_id>/commit', methods=['POST'])
+def commit_upload(upload_id):
+    """所有块到齐后提交：识别编码并流式写入内容存储，新建文件"""
+    try:
+        text_file, encoding_info = upload_store.commit(
+            upload_id, current_app.config['UPLOAD_ENCODING_SAMPLE_BYTES'], status=FileStatus.PENDING
+        )
+        db.session.commit()
+    except UploadError as e:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    except BaseException:
+        db.session.rollback()
+        raise
+    
+    upload_store.discard(upload_id)
+    return jsonify({
+        'status': 'success',
+        'message': f'文件 {text_file.filename} 上传成功',
+        'file_id': text_file.id,
+        'encoding': encoding_info
+    })
+
+
+@api_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload(upload_id):
+    """取消上传，删除已上传的块"""
+    try:
+        existed = upload_store.discard(upload_id)
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    if not existed:
+        return jsonify({'status': 'error', 'message': '上传不存在或已过期'}), 404
+    
+    return jsonify({'status': 'success', 'message': '已取消上传'})
+
+
+@api_bp.route('/files', methods=['GET'])
+def list_files_api():
+    """
+    文件列表（按上传时间倒序游标分页）
+    参数：status 状态筛选，cursor 下一页游标，before 上一页游标，limit 每页条数
+    """
+    limit = min(max(1, request.args.get('limit', current_app.config['ITEMS_PER_PAGE'], type=int)), MAX_PAGE_SIZE)
+    
+    try:
+        page = list_files(
+            status=request.args.get('status') or None,
+            after=request.args.get('cursor') or None,
+            before=request.args.get('before') or None,
+            limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    summaries = get_summaries(f.id for f in page['files'])
+    return jsonify({
+        'status': 'success',
+        'files': [{**f.to_dict(), **summaries.get(f.id, {'preview': '', 'length': 0})} for f in page['files']],
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor']
+    })
+
+
+@api_bp.route('/search', methods=['GET'])
+def search_api():
+    """
+    全文检索文件正文（新写入的正文在前，游标分页）
+    参数：q（检索内容，空格分隔的多个词需出现在同一篇正文中）, status, limit（最多 100）,
+    after（上一页返回的 next_cursor，为 null 时没有更多结果；多个词很少同时出现时一页可能少于 limit 条）
+    每个结果带第一处匹配附近的摘要及匹配位置在正文中的字符偏移
+    """
+    query = request.args.get('q', '').strip()
+    status = request.args.get('status') or None
+    if status is not None and status not in FILE_STATUSES:
+        return jsonify({'status': 'error', 'message': f'未知的状态: {status}'}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_PAGE_SIZE)
+    
+    try:
+        page = search_files(query, status=status, after=request.args.get('after', type=int), limit=limit)
+    except SearchUnavailable as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 501
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    return jsonify({'status': 'success', 'query': query, **page})
+
+
+@api_bp.route('/files/<int:file_id>/content', methods=['GET'])
+def get_file_content(file_id):
+    """读取正文片段（?start=&end=，字符偏移），只读取覆盖该范围的数据块"""
+    TextFile.query.get_or_404(file_id)
+    start = max(0, request.args.get('start', 0, type=int))
+    end = request.args.get('end', type=int)
+    if end is not None and end < 0:
+        return jsonify({'status': 'error', 'message': '无效的结束位置'}), 400
+    
+    text, length = get_content_slice(file_id, start, end)
+    return jsonify({
+        'status': 'success',
+        'file_id': file_id,
+        'start': start,
+        'end': start + len(text),
+        'length': length,
+        'content': text
+    })
+
+
 @api_bp.route('/mark_complete/<int:file_id>', methods=['POST'])
 def mark_complete(file_id):
     """标记任务为已完成"""
@@ -31,37 +283,41 @@ def mark_complete(file_id):
     return jsonify({'status': 'success', 'message': '已标记为完成'})
 
 
+def export_response(fmt, download_name, **options):
+    """流式导出响应，fmt 不在 EXPORT_FORMATS 中时返回 400"""
+    if fmt not in current_app.config['EXPORT_FORMATS']:
+        return jsonify({'status': 'error', 'message': f'不支持的导出格式: {fmt}'}), 400
+    
+    chunks = stream_export(fmt, batch_size=current_app.config['EXPORT_BATCH_SIZE'], **options)
+    response = Response(stream_with_context(chunks), content_type=EXPORT_MIMETYPES[fmt])
+    # 使用 RFC 5987 编码处理中文文件名
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(f'{download_name}.{fmt}')}"
+    return response
+
+
 @api_bp.route('/export_annotations/<int:file_id>', methods=['GET'])
 def export_annotations(file_id):
-    """导出标注结果"""
+    """导出单个文件的标注结果（?format=json|jsonl|csv|conll，默认 json）"""
     text_file = TextFile.query.get_or_404(file_id)
     
-    # 获取所有标注数据
-    text_ann = TextAnnotation.query.filter_by(file_id=file_id).first()
-    word_anns = WordAnnotation.query.filter_by(file_id=file_id).order_by(WordAnnotation.word_index).all()
-    entity_anns = EntityAnnotation.query.filter_by(file_id=file_id).order_by(EntityAnnotation.start_pos).all()
-    
-    export_data = {
-        'file': {
-            'id': text_file.id,
-            'filename': text_file.filename,
-            'content': text_file.content
-        },
-        'text_annotation': text_ann.to_dict() if text_ann else None,
-        'word_annotations': [w.to_dict() for w in word_anns],
-        'entity_annotations': [e.to_dict() for e in entity_anns]
-    }
-    
     # 处理中文文件名
     filename = text_file.filename.replace('.txt', '').replace('.csv', '')
-    # 使用 RFC 5987 编码处理中文文件名
-    encoded_filename = quote(f'{filename}_标注结果.json')
-    
-    response = make_response(json.dumps(export_data, ensure_ascii=False, indent=2))
-    response.headers['Content-Type'] = 'application/json; charset=utf-8'
-    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{encoded_filename}"
+    return export_response(
+        request.args.get('format', 'json'), f'{filename}_标注结果',
+        file_ids=[file_id], single=True
+    )
+
+
+@api_bp.route('/export', methods=['GET'])
+def export_corpus():
+    """导出整个语料库的标注结果（?format=json|jsonl|csv|conll，?status= 按状态筛选）"""
+    status = request.args.get('status') or None
+    if status is not None and status not in FILE_STATUSES:
+        return jsonify({'status': 'error', 'message': f'未知的状态: {status}'}), 400
     
-    return response
+    return export_response(
+        request.args.get('format', 'jsonl'), f'语料库标注结果_{status or "all"}', status=status
+    )
 
 
 # ==================== 智能标注（只分析，不入库）====================
@@ -72,58 +328,130 @@ def smart_annotate(file_id):
     智能标注 - 只进行分析，不写入数据库
     数据保存在前端，用户点击"保存标注"后才入库
     """
-    text_file = TextFile.query.get_or_404(file_id)
-    content = text_file.content
+    TextFile.query.get_or_404(file_id)
+    content = get_content(file_id)
     
     try:
-        # 1. 文本分类和情感分析
-        category = get_text_category(content)
-        sentiment, sentiment_score = get_sentiment(content)
-        
-        text_annotation = {
-            'text_category': category,
-            'text_sentiment': sentiment,
-            'sentiment_score': sentiment_score
-        }
-        
-        # 2. 分词和词性标注（只返回结果，不入库）
-        segments = segment_text(content)
-        word_annotations = []
-        for idx, seg in enumerate(segments):
-            word_annotations.append({
-                'id': idx + 1,  # 临时ID，前端使用
-                'word_index': idx,
-                'word': seg['word'],
-                'pos': seg['pos'],
-                'pos_cn': seg['pos_cn'],
-                'start_pos': seg['start_pos'],
-                'end_pos': seg['end_pos']
-            })
-        
-        # 3. 实体识别（只返回结果，不入库）
-        entities = recognize_entities(content)
-        entity_annotations = []
-        for idx, entity in enumerate(entities):
-            entity_annotations.append({
-                'id': idx + 1,  # 临时ID，前端使用
-                'text': entity['text'],
-                'label': entity['label'],
-                'start_pos': entity['start_pos'],
-                'end_pos': entity['end_pos']
-            })
+        result, cache_tier, parallel = smart_annotate_content(
+            content, parallel=request.args.get('parallel', type=int)
+        )
         
         return jsonify({
             'status': 'success',
             'message': '智能标注完成（未保存，请点击保存按钮）',
-            'text_annotation': text_annotation,
-            'word_annotations': word_annotations,
-            'entity_annotations': entity_annotations
+            'text_annotation': result['text_annotation'],
+            'word_annotations': result['word_annotations'],
+            'entity_annotations': result['entity_annotations'],
+            'parallel': parallel,
+            'from_cache': cache_tier is not None,
+            'cache_tier': cache_tier
         })
         
     except Exception as e:
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+# ==================== 异步智能标注任务 ====================
+
+@api_bp.route('/jobs/smart_annotate/<int:file_id>', methods=['POST'])
+def submit_smart_annotate_job(file_id):
+    """提交智能标注任务，立即返回任务ID"""
+    TextFile.query.get_or_404(file_id)
+    parallel = request.args.get('parallel', type=int)
+    
+    def run(job):
+        if db.session.get(TextFile, file_id) is None:
+            raise ValueError('文件不存在')
+        job.report(0, '读取文件')
+        result, cache_tier, used_parallel = smart_annotate_content(
+            get_content(file_id), parallel=parallel, progress=job.report
+        )
+        return dict(result, parallel=used_parallel, from_cache=cache_tier is not None, cache_tier=cache_tier)
+    
+    try:
+        job = job_manager.submit(current_app._get_current_object(), 'smart_annotate', run,
+                                 params={'file_id': file_id})
+    except JobQueueFull:
+        return jsonify({'status': 'error', 'message': '任务队列已满，请稍后重试'}), 503
+    
+    return jsonify({'status': 'success', 'job_id': job.id, 'job': job.to_dict()}), 202
+
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态和进度"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': '任务不存在或已过期'}), 404
+    return jsonify({'status': 'success', 'job': job.to_dict()})
+
+
+@api_bp.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """获取任务结果（仅已成功的任务）"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': '任务不存在或已过期'}), 404
+    if job.status == JobStatus.FAILED:
+        return jsonify({'status': 'error', 'message': job.error, 'job': job.to_dict()}), 500
+    if job.status != JobStatus.SUCCEEDED:
+        return jsonify({'status': 'error', 'message': '任务尚未完成', 'job': job.to_dict()}), 409
+    
+    return jsonify(dict(job.result, status='success', message=JOB_RESULT_MESSAGES.get(job.kind, '任务完成'),
+                        job=job.to_dict()))
+
+
+@api_bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消任务（排队中的任务立即取消，运行中的任务在下一个阶段边界停止）"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': '任务不存在或已过期'}), 404
+    return jsonify({'status': 'success', 'message': '已请求取消', 'job': job.to_dict()})
+
+
+@api_bp.route('/jobs/stats', methods=['GET'])
+def job_stats():
+    """任务队列统计"""
+    job_manager.sweep()
+    return jsonify({'status': 'success', 'jobs': job_manager.stats()})
+
+
+# ==================== 批量智能标注 ====================
+
+@api_bp.route('/batch/smart_annotate', methods=['POST'])
+def batch_smart_annotate_files():
+    """
+    批量智能标注（只分析，不入库）
+    请求体: {"file_ids": [...]} 或 {"status": "pending"}，
+    可选 "summary_only": true 只返回统计不返回标注明细
+    以 NDJSON 流式返回，每行一个文件，最后一行为汇总
+    """
+    data = request.get_json(silent=True) or {}
+    file_ids = data.get('file_ids')
+    status = data.get('status')
+    
+    if file_ids is None and status is None:
+        return jsonify({'status': 'error', 'message': '缺少 file_ids 或 status'}), 400
+    if status is not None and status not in FILE_STATUSES:
+        return jsonify({'status': 'error', 'message': f'未知的状态: {status}'}), 400
+    
+    query = db.session.query(TextFile.id)
+    if file_ids is not None:
+        if not isinstance(file_ids, list):
+            return jsonify({'status': 'error', 'message': 'file_ids 必须是数组'}), 400
+        query = query.filter(TextFile.id.in_(file_ids))
+    if status is not None:
+        query = query.filter(TextFile.status == status)
+    ids = [row[0] for row in query.order_by(TextFile.id).all()]
+    
+    def generate():
+        for line in batch_smart_annotate(ids, include_annotations=not data.get('summary_only')):
+            yield json.dumps(line, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 # ==================== 保存标注（真正写入数据库）====================
 
 @api_bp.route('/save_all_annotations', methods=['POST'])
@@ -145,79 +473,79 @@ def save_all_annotations():
     text_file = TextFile.query.get_or_404(file_id)
     
     try:
-        # 1. 清除旧的标注数据
-        TextAnnotation.query.filter_by(file_id=file_id).delete()
-        WordAnnotation.query.filter_by(file_id=file_id).delete()
-        EntityAnnotation.query.filter_by(file_id=file_id).delete()
+        saved = save_annotations(
+            file_id, text_category, text_sentiment, word_annotations, entity_annotations
+        )
         
-        # 2. 保存文本标注（分类和情感）
-        if text_category or text_sentiment:
-            text_ann = TextAnnotation(
-                file_id=file_id,
-                text_category=text_category,
-                text_sentiment=text_sentiment
-            )
-            db.session.add(text_ann)
+        # 更新文件状态
+        text_file.status = FileStatus.PROCESSING
         
-        # 3. 保存词语标注
-        for idx, word_data in enumerate(word_annotations):
-            word_ann = WordAnnotation(
-                file_id=file_id,
-                word_index=idx,
-                word=word_data.get('word', ''),
-                pos=word_data.get('pos', 'n'),
-                pos_cn=word_data.get('pos_cn', '名词'),
-                start_pos=word_data.get('start_pos', 0),
-                end_pos=word_data.get('end_pos', 0)
-            )
-            db.session.add(word_ann)
+        db.session.commit()
         
-        # 4. 保存实体标注，只有手动标注的才更新知识库
-        manual_count = 0
-        for entity_data in entity_annotations:
-            entity_text = entity_data.get('text', '')
-            entity_label = entity_data.get('label', '')
-            is_manual = entity_data.get('is_manual', False)
-            
-            if not entity_text or not entity_label:
-                continue
+        return jsonify({
+            'status': 'success',
+            'message': f'标注已保存到数据库，{saved["manual_entities"]}个手动标注实体已加入知识库',
+            **saved
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+
+@api_bp.route('/save_annotations_patch', methods=['POST'])
+def save_annotations_patch():
+    """
+    增量保存标注 - 只写入相对 base_revision 变化的词语和实体
+    修订号不一致时：请求中带有完整的 word_annotations / entity_annotations 则整体替换，
+    否则返回 409，由前端改为调用 save_all_annotations
+    """
+    data = request.get_json()
+    file_id = data.get('file_id')
+    base_revision = data.get('base_revision')
+    
+    if not file_id or base_revision is None:
+        return jsonify({'status': 'error', 'message': '缺少文件ID或修订号'}), 400
+    
+    text_file = TextFile.query.get_or_404(file_id)
+    
+    text_annotation = None
+    if 'text_category' in data or 'text_sentiment' in data:
+        text_annotation = {
+            'text_category': data.get('text_category', ''),
+            'text_sentiment': data.get('text_sentiment', '')
+        }
+    
+    try:
+        saved = apply_annotation_patch(
+            file_id, base_revision, text_annotation,
+            words=data.get('words'), entities=data.get('entities')
+        )
+        mode = 'patch'
+        
+        if saved is None:
+            if 'word_annotations' not in data or 'entity_annotations' not in data:
+                db.session.rollback()
+                return jsonify({
+                    'status': 'error',
+                    'message': '标注已被修改，请重新保存全部标注',
+                    'revision': get_revision(file_id)
+                }), 409
             
-            entity_ann = EntityAnnotation(
-                file_id=file_id,
-                text=entity_text,
-                label=entity_label,
-                start_pos=entity_data.get('start_pos', 0),
-                end_pos=entity_data.get('end_pos', 0)
+            text_annotation = text_annotation or {}
+            saved = save_annotations(
+                file_id,
+                text_annotation.get('text_category', ''),
+                text_annotation.get('text_sentiment', ''),
+                data['word_annotations'],
+                data['entity_annotations']
             )
-            db.session.add(entity_ann)
-            
-            # 只有手动标注的实体才更新知识库
-            if is_manual:
-                manual_count += 1
-                existing = KnowledgeEntity.query.filter_by(text=entity_text).first()
-                if existing:
-                    existing.frequency += 1
-                    existing.label = entity_label  # 新增：更新为最新类型
-                else:
-                    ke = KnowledgeEntity(
-                        text=entity_text,
-                        label=entity_label,
-                        source='manual'
-                    )
-                    db.session.add(ke)
+            mode = 'full'
         
-        # 5. 更新文件状态
         text_file.status = FileStatus.PROCESSING
-        
         db.session.commit()
         
-        return jsonify({
-            'status': 'success',
-            'message': f'标注已保存到数据库，{manual_count}个手动标注实体已加入知识库',
-            'saved_words': len(word_annotations),
-            'saved_entities': len(entity_annotations),
-            'manual_entities': manual_count
-        })
+        return jsonify({'status': 'success', 'message': '标注已保存到数据库', 'mode': mode, **saved})
         
     except Exception as e:
         db.session.rollback()
@@ -233,24 +561,26 @@ def clear_annotations(file_id):
     
     # 删除所有相关标注
     TextAnnotation.query.filter_by(file_id=file_id).delete()
-    WordAnnotation.query.filter_by(file_id=file_id).delete()
-    EntityAnnotation.query.filter_by(file_id=file_id).delete()
+    with track_annotation_counts(file_id):
+        delete_word_annotations(file_id)
+        EntityAnnotation.query.filter_by(file_id=file_id).delete()
     
     # 重置状态
     text_file.status = FileStatus.PENDING
+    revision = advance_revision(file_id)
     
     db.session.commit()
     
-    return jsonify({'status': 'success', 'message': '已清空所有标注'})
+    return jsonify({'status': 'success', 'message': '已清空所有标注', 'revision': revision})
 
 
 # ==================== 词语标注管理（前端临时操作）====================
 
 @api_bp.route('/update_word_pos', methods=['POST'])
 def update_word_pos():
-    """更新词性标注（返回确认，实际保存在前端）"""
+    """更新词性标注（返回确认，实际保存在前端）；词语按 word_index 定位"""
     data = request.get_json()
-    word_id = data.get('id')
+    word_index = data.get('word_index')
     new_pos = data.get('pos')
     new_pos_cn = data.get('pos_cn')
     
@@ -261,6 +591,7 @@ def update_word_pos():
     return jsonify({
         'status': 'success',
         'message': '词性已更新（请保存以持久化）',
+        'word_index': word_index,
         'pos': new_pos,
         'pos_cn': new_pos_cn or POS_12.get(new_pos, '未知')
     })
@@ -268,19 +599,22 @@ def update_word_pos():
 
 @api_bp.route('/merge_words', methods=['POST'])
 def merge_words():
-    """合并词语（在前端处理，返回新的词语列表）"""
+    """
+    合并词语（在前端处理，返回新的词语列表）
+    词语按 word_index 定位：紧凑存储读出的词语没有行 id
+    """
     data = request.get_json()
-    word_ids = data.get('word_ids', [])
+    word_indexes = set(data.get('word_indexes', []))
     words_data = data.get('words_data', [])  # 前端传来的词语数据
     
-    if len(word_ids) < 2:
+    if len(word_indexes) < 2:
         return jsonify({'status': 'error', 'message': '至少需要选择2个词'}), 400
     
     if not words_data:
         return jsonify({'status': 'error', 'message': '缺少词语数据'}), 400
     
     # 找到要合并的词语
-    selected_words = [w for w in words_data if w.get('id') in word_ids]
+    selected_words = [w for w in words_data if w.get('word_index') in word_indexes]
     selected_words.sort(key=lambda x: x.get('word_index', 0))
     
     if len(selected_words) < 2:
@@ -298,16 +632,14 @@ def merge_words():
     
     # 构建新的词语列表
     new_words = []
-    merged_ids = set(word_ids)
     first_merged = True
     new_index = 0
     
     for w in sorted(words_data, key=lambda x: x.get('word_index', 0)):
-        if w.get('id') in merged_ids:
+        if w.get('word_index') in word_indexes:
             if first_merged:
                 # 添加合并后的词
                 new_words.append({
-                    'id': w.get('id'),  # 保留第一个词的ID
                     'word_index': new_index,
                     'word': merged_word,
                     'pos': 'n',
@@ -321,7 +653,6 @@ def merge_words():
         else:
             # 保留未合并的词，更新索引
             new_words.append({
-                'id': w.get('id'),
                 'word_index': new_index,
                 'word': w.get('word', ''),
                 'pos': w.get('pos', 'n'),
@@ -404,12 +735,29 @@ def delete_entity(entity_id):
 
 @api_bp.route('/knowledge/entities', methods=['GET'])
 def get_knowledge_entities():
-    """获取所有知识库实体"""
-    entities = KnowledgeEntity.query.order_by(KnowledgeEntity.frequency.desc()).all()
-    return jsonify({
+    """
+    知识库实体列表（按频次倒序游标分页）
+    参数：search（文本子串）, label, cursor（上一页返回的 next_cursor）, limit（最多 200）
+    第一页（不带 cursor）同时返回符合条件的实体总数 total
+    """
+    search = request.args.get('search', '').strip()
+    label = request.args.get('label', '').strip() or None
+    cursor = request.args.get('cursor') or None
+    limit = min(max(request.args.get('limit', 100, type=int), 1), KNOWLEDGE_PAGE_SIZE)
+    
+    try:
+        page = list_entities(search=search, label=label, after=cursor, limit=limit)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    
+    result = {
         'status': 'success',
-        'entities': [e.to_dict() for e in entities]
-    })
+        'entities': [e.to_dict() for e in page['entities']],
+        'next_cursor': page['next_cursor']
+    }
+    if cursor is None:
+        result['total'] = count_entities(search=search, label=label)
+    return jsonify(result)
 
 
 @api_bp.route('/knowledge/add', methods=['POST'])
@@ -432,6 +780,7 @@ def add_knowledge_entity():
     
     ke = KnowledgeEntity(text=text, label=label, source='manual')
     db.session.add(ke)
+    bump_knowledge_version()
     db.session.commit()
     
     return jsonify({'status': 'success', 'entity': ke.to_dict()})
@@ -442,6 +791,7 @@ def delete_knowledge_entity(entity_id):
     """删除知识库实体"""
     ke = KnowledgeEntity.query.get_or_404(entity_id)
     db.session.delete(ke)
+    bump_knowledge_version()
     db.session.commit()
     
     return jsonify({'status': 'success', 'message': '删除成功'})
@@ -457,11 +807,49 @@ def batch_delete_knowledge():
         return jsonify({'status': 'error', 'message': '未指定要删除的实体'}), 400
     
     KnowledgeEntity.query.filter(KnowledgeEntity.id.in_(entity_ids)).delete(synchronize_session=False)
+    unindex_entities(entity_ids)
+    bump_knowledge_version()
     db.session.commit()
     
     return jsonify({'status': 'success', 'message': f'已删除 {len(entity_ids)} 个实体'})
 
 
+@api_bp.route('/knowledge/clear', methods=['POST'])
+def clear_knowledge():
+    """清空知识库"""
+    count = KnowledgeEntity.query.delete(synchronize_session=False)
+    KnowledgeNgram.query.delete(synchronize_session=False)
+    bump_knowledge_version()
+    db.session.commit()
+    
+    return jsonify({'status': 'success', 'message': f'已删除 {count} 个实体'})
+
+
+@api_bp.route('/knowledge/cache_stats', methods=['GET'])
+def knowledge_cache_stats():
+    """知识库缓存命中统计"""
+    return jsonify({
+        'status': 'success',
+        'cache': knowledge_cache.stats()
+    })
+
+
+@api_bp.route('/annotate_cache/stats', methods=['GET'])
+def annotate_cache_stats():
+    """智能标注结果缓存统计"""
+    return jsonify({
+        'status': 'success',
+        'cache': result_cache.stats()
+    })
+
+
+@api_bp.route('/annotate_cache/clear', methods=['POST'])
+def clear_annotate_cache():
+    """清空智能标注结果缓存"""
+    result_cache.clear()
+    return jsonify({'status': 'success', 'message': '缓存已清空'})
+
+
 @api_bp.route('/knowledge/export', methods=['GET'])
 def export_knowledge():
     """导出知识库"""
@@ -483,33 +871,18 @@ def export_knowledge():
 
 @api_bp.route('/stats', methods=['GET'])
 def get_stats():
-    """获取统计信息"""
-    from sqlalchemy import func
-    
-    total_files = TextFile.query.count()
-    completed_files = TextFile.query.filter_by(status=FileStatus.COMPLETED).count()
-    total_words = WordAnnotation.query.count()
-    total_entities = EntityAnnotation.query.count()
-    total_knowledge = KnowledgeEntity.query.count()
-    
-    entity_distribution = db.session.query(
-        EntityAnnotation.label,
-        func.count(EntityAnnotation.id)
-    ).group_by(EntityAnnotation.label).all()
-    
-    pos_distribution = db.session.query(
-        WordAnnotation.pos_cn,
-        func.count(WordAnnotation.id)
-    ).group_by(WordAnnotation.pos_cn).all()
+    """获取统计信息（读取统计计数器）"""
+    summary = get_stats_summary()
     
     return jsonify({
-        'total_files': total_files,
-        'completed_files': completed_files,
-        'total_words': total_words,
-        'total_entities': total_entities,
-        'total_knowledge': total_knowledge,
-        'entity_distribution': dict(entity_distribution),
-        'pos_distribution': dict(pos_distribution)
+        'total_files': summary['total_files'],
+        'completed_files': summary['status_counts'][FileStatus.COMPLETED.value],
+        'status_counts': summary['status_counts'],
+        'total_words': summary['total_words'],
+        'total_entities': summary['total_entities'],
+        'total_knowledge': KnowledgeEntity.query.count(),
+        'entity_distribution': summary['entity_distribution'],
+        'pos_distribution': summary['pos_distribution']
     })
 
 
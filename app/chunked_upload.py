@@ -0,0 +1,229 @@
+# app/chunked_upload.py
+"""
+分块断点续传上传
+
+普通上传受 MAX_CONTENT_LENGTH（16MB）限制，且整个文件读入内存、断线后只能重传。
+分块上传把文件切成 chunk_size 字节的块逐个上传，每块是一个独立的小请求：
+
+1. POST /api/uploads: 登记文件名、总大小和块大小，返回 upload_id；
+2. PUT /api/uploads/<upload_id>/chunks/<index>: 上传第 index 块（请求体为原始字节），
+   可带 X-Chunk-SHA256 头校验内容，重复上传同一块会覆盖；
+3. GET /api/uploads/<upload_id>: 查询已收到和缺少的块，断线后据此只补传缺少的块；
+4. POST /api/uploads/<upload_id>/commit: 所有块到齐后按顺序拼接为一个文件，
+   识别编码并逐段解码写入内容存储（见 text_decoding.choose_encoding 和
+   content_store.create_text_file_from_stream），整篇正文不会读入内存。
+
+块先写入临时文件再改名，服务中途退出不会留下不完整的块。每个上传的数据放在
+CHUNKED_UPLOAD_DIR 下以 upload_id 命名的目录中，提交或取消后删除；
+超过 CHUNKED_UPLOAD_TTL 未更新的上传在登记新上传时清理。
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+from app.content_store import create_text_file_from_stream
+from app.text_decoding import choose_encoding, iter_decoded, DEFAULT_SAMPLE_BYTES
+
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+META_FILENAME = 'meta.json'
+ASSEMBLED_PREFIX = 'assembled_'
+
+
+class UploadError(ValueError):
+    """上传不存在或参数不合法"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ChunkedUploadStore:
+    """分块上传的本地暂存区"""
+
+    def __init__(self, root=None, chunk_bytes=4 * 1024 * 1024, max_bytes=1024 * 1024 * 1024, ttl=24 * 3600):
+        self.root = root or os.path.join(tempfile.gettempdir(), 'annotation_uploads')
+        self.chunk_bytes = chunk_bytes
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def configure(self, root=None, chunk_bytes=None, max_bytes=None, ttl=None):
+        if root is not None:
+            self.root = root
+        if chunk_bytes is not None:
+            self.chunk_bytes = chunk_bytes
+        if max_bytes is not None:
+            self.max_bytes = max_bytes
+        if ttl is not None:
+            self.ttl = ttl
+
+    # ---------- 路径与元数据 ----------
+
+    def _dir(self, upload_id):
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise UploadError('无效的上传ID', 404)
+        return os.path.join(self.root, upload_id)
+
+    def _chunk_path(self, upload_id, index):
+        return os.path.join(self._dir(upload_id), f'chunk_{index:06d}')
+
+    def _load_meta(self, upload_id):
+        try:
+            with open(os.path.join(self._dir(upload_id), META_FILENAME), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError('上传不存在或已过期', 404) from None
+
+    def _received(self, upload_id, meta):
+        upload_dir = self._dir(upload_id)
+        return [i for i in range(meta['chunk_count'])
+                if os.path.exists(os.path.join(upload_dir, f'chunk_{i:06d}'))]
+
+    def _expected_size(self, meta, index):
+        if index == meta['chunk_count'] - 1:
+            return meta['size'] - index * meta['chunk_size']
+        return meta['chunk_size']
+
+    # ---------- 协议步骤 ----------
+
+    def create(self, filename, size, chunk_size=None):
+        """登记新上传，返回状态（含 upload_id 和块数）"""
+        chunk_size = int(chunk_size or self.chunk_bytes)
+        size = int(size)
+        if size <= 0:
+            raise UploadError('文件为空')
+        if size > self.max_bytes:
+            raise UploadError(f'文件超过大小上限（{self.max_bytes // (1024 * 1024)}MB）', 413)
+        if not 0 < chunk_size <= self.chunk_bytes:
+            raise UploadError(f'块大小需在 1 到 {self.chunk_bytes} 字节之间')
+
+        self.sweep_expired()
+        upload_id = uuid.uuid4().hex
+        meta = {
+            'upload_id': upload_id,
+            'filename': filename,
+            'size': size,
+            'chunk_size': chunk_size,
+            'chunk_count': -(-size // chunk_size),
+            'created_at': time.time()
+        }
+        upload_dir = self._dir(upload_id)
+        os.makedirs(upload_dir)
+        with open(os.path.join(upload_dir, META_FILENAME), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        return self.status(upload_id)
+
+    def put_chunk(self, upload_id, index, stream, checksum=None):
+        """
+        从 stream 读取第 index 块写入暂存区（先写临时文件再改名）
+        长度与预期不符或 checksum（sha256 十六进制）不匹配时抛出 UploadError，已保存的块不受影响
+        """
+        meta = self._load_meta(upload_id)
+        if not 0 <= index < meta['chunk_count']:
+            raise UploadError(f'块序号超出范围（共 {meta["chunk_count"]} 块）')
+        expected = self._expected_size(meta, index)
+
+        path = self._chunk_path(upload_id, index)
+        part_path = f'{path}.{uuid.uuid4().hex}.part'
+        hasher = hashlib.sha256()
+        written = 0
+        try:
+            with open(part_path, 'wb') as f:
+                while written <= expected:
+                    data = stream.read(min(1024 * 1024, expected + 1 - written))
+                    if not data:
+                        break
+                    hasher.update(data)
+                    f.write(data)
+                    written += len(data)
+            if written != expected:
+                raise UploadError(f'第 {index} 块长度应为 {expected} 字节，实际收到 {written} 字节')
+            if checksum and checksum.lower() != hasher.hexdigest():
+                raise UploadError(f'第 {index} 块校验失败')
+            os.replace(part_path, path)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+        # 让过期清理以最后一次上传块的时间为准
+        os.utime(os.path.join(self._dir(upload_id), META_FILENAME))
+        return {'index': index, 'size': written, 'sha256': hasher.hexdigest()}
+
+    def status(self, upload_id):
+        """返回上传状态：已收到的块、缺少的块和已收到的字节数"""
+        meta = self._load_meta(upload_id)
+        received = self._received(upload_id, meta)
+        received_set = set(received)
+        return dict(
+            meta,
+            received=received,
+            missing=[i for i in range(meta['chunk_count']) if i not in received_set],
+            received_bytes=sum(self._expected_size(meta, i) for i in received),
+            complete=len(received) == meta['chunk_count']
+        )
+
+    def commit(self, upload_id, sample_bytes=DEFAULT_SAMPLE_BYTES, **fields):
+        """
+        拼接所有块，识别编码并流式写入内容存储，返回 (TextFile, 编码信息)（不提交事务）
+        调用方提交事务后应调用 discard 删除暂存数据
+        """
+        meta = self._load_meta(upload_id)
+        missing = self.status(upload_id)['missing']
+        if missing:
+            raise UploadError(f'还有 {len(missing)} 个块未上传', 409)
+
+        # 拼接到临时文件（编码识别和解码需要可 seek 的完整文件流），用完即删
+        assembled = os.path.join(self._dir(upload_id), f'{ASSEMBLED_PREFIX}{uuid.uuid4().hex}')
+        try:
+            with open(assembled, 'w+b') as stream:
+                for index in range(meta['chunk_count']):
+                    with open(self._chunk_path(upload_id, index), 'rb') as chunk:
+                        shutil.copyfileobj(chunk, stream)
+
+                encoding_info = choose_encoding(stream, sample_bytes)
+                text_file = create_text_file_from_stream(
+                    meta['filename'], lambda: iter_decoded(stream, encoding_info['encoding']), **fields
+                )
+        finally:
+            if os.path.exists(assembled):
+                os.remove(assembled)
+
+        if encoding_info['encoding'] == 'utf-8-sig':
+            encoding_info['encoding'] = 'utf-8'
+        return text_file, encoding_info
+
+    def discard(self, upload_id):
+        """删除上传的暂存数据，返回是否存在"""
+        upload_dir = self._dir(upload_id)
+        if not os.path.isdir(upload_dir):
+            return False
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        return True
+
+    def sweep_expired(self):
+        """删除超过 ttl 未更新的上传，返回删除数"""
+        if not os.path.isdir(self.root):
+            return 0
+        deadline = time.time() - self.ttl
+        removed = 0
+        for name in os.listdir(self.root):
+            if not UPLOAD_ID_PATTERN.match(name):
+                continue
+            upload_dir = os.path.join(self.root, name)
+            meta_path = os.path.join(upload_dir, META_FILENAME)
+            try:
+                updated = os.path.getmtime(meta_path if os.path.exists(meta_path) else upload_dir)
+            except OSError:
+                continue
+            if updated < deadline:
+                shutil.rmtree(upload_dir, ignore_errors=True)
+                removed += 1
+        return removed
+
+
+upload_store = ChunkedUploadStore()
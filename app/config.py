@@ -10,14 +10,50 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///annotation.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
-    # 上传配置
+    # 存储方案（见 app/storage.py）：concurrent 为 WAL 等并发友好设置，legacy 为 SQLite 默认行为
+    STORAGE_PROFILE = os.environ.get('STORAGE_PROFILE') or 'concurrent'
+    STORAGE_OPTIONS = {}  # 覆盖方案中的单项设置，如 {'busy_timeout': 10000}
+    
+    # 词语标注存储格式：packed 为每个文件一行的紧凑存储，rows 为每个词一行（见 app/token_store.py）
+    WORD_STORAGE = os.environ.get('WORD_STORAGE') or 'packed'
+    
+    # 上传配置（文件直接读取内容存入数据库，不保存到文件系统）
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
     UPLOAD_FOLDER = 'uploads'
     ALLOWED_EXTENSIONS = {'txt', 'csv'}
+    UPLOAD_ENCODING_SAMPLE_BYTES = 64 * 1024  # 非 UTF-8 文件检测编码时最多读取的字节数（见 app/text_decoding.py）
+    
+    # 压缩包批量导入（见 app/ingest.py）
+    INGEST_MAX_ARCHIVE_BYTES = 512 * 1024 * 1024  # 上传压缩包的大小上限
+    INGEST_MAX_ENTRY_BYTES = 64 * 1024 * 1024  # 压缩包中单个文件解压后的大小上限，超过的文件跳过
+    INGEST_WORKERS = None  # 解码并行数，None 表示使用全部 CPU 核心
+    INGEST_EXECUTOR = 'thread'  # thread 或 process
+    
+    # 分块断点续传上传（见 app/chunked_upload.py），不受 MAX_CONTENT_LENGTH 限制
+    CHUNKED_UPLOAD_DIR = os.environ.get('CHUNKED_UPLOAD_DIR')  # None 表示系统临时目录下的 annotation_uploads
+    CHUNKED_UPLOAD_CHUNK_BYTES = 4 * 1024 * 1024  # 单块大小上限（需小于 MAX_CONTENT_LENGTH）
+    CHUNKED_UPLOAD_MAX_BYTES = 1024 * 1024 * 1024  # 单个文件的大小上限
+    CHUNKED_UPLOAD_TTL = 24 * 3600  # 秒，超过此时间未更新的上传会被清理
     
     # 分页配置
     ITEMS_PER_PAGE = 20
     
+    # 智能标注并行配置：超过阈值的长文本切块后在进程池中分析
+    PARALLEL_ANNOTATE_THRESHOLD = 200000  # 字符数
+    PARALLEL_ANNOTATE_CHUNK_SIZE = 50000
+    PARALLEL_ANNOTATE_WORKERS = None  # None 表示使用全部 CPU 核心
+    
+    # 智能标注结果缓存（内存 LRU + 数据库两级，按字节数限制大小）
+    ANNOTATE_CACHE_MEMORY_MAX_BYTES = 64 * 1024 * 1024
+    ANNOTATE_CACHE_DB_MAX_BYTES = 512 * 1024 * 1024
+    
+    # 异步任务（本地线程池，见 app/jobs.py）：智能标注和导入（CSV、压缩包）使用各自的线程池
+    JOB_MAX_WORKERS = 2  # 智能标注任务的线程数
+    JOB_IMPORT_WORKERS = 1  # 导入任务的线程数
+    JOB_MAX_PENDING = 32  # 所有未完成任务的总数上限
+    JOB_ABANDON_TIMEOUT = 120  # 秒，智能标注任务超过此时间无人轮询则自动取消（导入任务不会）
+    JOB_RESULT_TTL = 600  # 秒，已完成任务的保留时间
+    
     # 词性标注映射（jieba词性 -> 中文名称和颜色）
     POS_MAPPING = {
         # 名词类
@@ -165,8 +201,9 @@ class Config:
     KNOWLEDGE_BASE_AUTO_LEARN = True  # 是否自动学习到知识库
     KNOWLEDGE_BASE_MIN_FREQUENCY = 2  # 最小出现频率才加入知识库
     
-    # 导出配置
-    EXPORT_FORMATS = ['json', 'csv', 'txt']
+    # 导出配置（流式导出，见 app/exporter.py）
+    EXPORT_FORMATS = ['json', 'jsonl', 'csv', 'conll']
+    EXPORT_BATCH_SIZE = 1000  # 每批从数据库读取的行数
     
     # 日志配置
     LOG_LEVEL = 'INFO'
@@ -0,0 +1,384 @@
+# app/content_store.py
+"""
+文档正文存储
+
+正文不再放在 text_files 表中，而是：
+
+- 按 UTF-8 内容的 sha256 去重，相同正文只存一份（ContentBlob）；
+- 按 CONTENT_CHUNK_CHARS 个字符分块，每块单独 zlib 压缩（ContentChunk），
+  读取片段时只解压覆盖该范围的块；
+- 文件通过 TextFileContent 关联正文，ContentBlob 中保存长度和开头预览，
+  文件列表只读这两项，不读正文。
+
+迁移前的旧文件正文仍在 TextFile.content 列中，读取时自动回退，
+可用 flask migrate-content-store 迁移到内容存储。
+
+写入和删除正文时同步维护全文索引（见 app/search_index.py）。
+"""
+import hashlib
+import zlib
+from datetime import datetime
+
+from app import db
+from app.models import TextFile, FileStatus, ContentBlob, ContentChunk, TextFileContent
+from app.search_index import index_contents, remove_contents
+from app.storage import upsert_insert
+
+# 每块字符数
+CONTENT_CHUNK_CHARS = 64 * 1024
+
+# 列表预览的字符数
+PREVIEW_CHARS = 150
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+# ---------- 写入 ----------
+
+def split_chunks(content):
+    return [content[i:i + CONTENT_CHUNK_CHARS] for i in range(0, len(content), CONTENT_CHUNK_CHARS)]
+
+
+def build_content_rows(content, digest=None):
+    """正文的 ContentBlob 行和 ContentChunk 行（字典形式，供批量插入）"""
+    digest = digest or content_hash(content)
+    chunks = split_chunks(content)
+    blob_row = {
+        'content_hash': digest,
+        'char_length': len(content),
+        'chunk_chars': CONTENT_CHUNK_CHARS,
+        'chunk_count': len(chunks),
+        'preview': content[:PREVIEW_CHARS]
+    }
+    chunk_rows = [
+        {'content_hash': digest, 'seq': seq, 'data': zlib.compress(chunk.encode('utf-8'))}
+        for seq, chunk in enumerate(chunks)
+    ]
+    return blob_row, chunk_rows
+
+
+def _insert_blob(blob_row):
+    """
+    插入 ContentBlob 行，返回是否插入
+    两个请求同时上传相同的新正文时都会通过存在检查，这里用 ON CONFLICT DO NOTHING，
+    后插入的一方返回 False，不再写入正文块和索引
+    """
+    insert = upsert_insert(db.session.get_bind().dialect.name)
+    if insert is None:
+        db.session.add(ContentBlob(**blob_row))
+        db.session.flush()
+        return True
+    result = db.session.execute(
+        insert(ContentBlob).values(**blob_row).on_conflict_do_nothing(index_elements=['content_hash'])
+    )
+    return result.rowcount > 0
+
+
+def store_content(content):
+    """保存正文（已存在则复用），返回内容哈希"""
+    digest = content_hash(content)
+    if db.session.get(ContentBlob, digest) is not None:
+        return digest
+
+    blob_row, chunk_rows = build_content_rows(content, digest)
+    if not _insert_blob(blob_row):
+        return digest
+    if chunk_rows:
+        db.session.execute(db.insert(ContentChunk), chunk_rows)
+    index_contents([(digest, split_chunks(content))])
+    return digest
+
+
+def store_contents(contents):
+    """批量保存正文（一次查询已存在的哈希，新正文批量插入），返回与 contents 对应的哈希列表"""
+    digests = [content_hash(content) for content in contents]
+    existing = set(db.session.scalars(
+        db.select(ContentBlob.content_hash).where(ContentBlob.content_hash.in_(set(digests)))
+    ))
+
+    chunk_rows, new_contents = [], []
+    for digest, content in zip(digests, contents):
+        if digest in existing:
+            continue
+        existing.add(digest)
+        blob_row, rows = build_content_rows(content, digest)
+        if not _insert_blob(blob_row):
+            continue
+        chunk_rows.extend(rows)
+        new_contents.append((digest, content))
+
+    if chunk_rows:
+        db.session.execute(db.insert(ContentChunk), chunk_rows)
+    index_contents((digest, split_chunks(content)) for digest, content in new_contents)
+    return digests
+
+
+def _rechunk(pieces, size=CONTENT_CHUNK_CHARS):
+    """把任意长度的文本片段重新切成 size 个字符一块"""
+    buffer = ''
+    for piece in pieces:
+        buffer += piece
+        full = len(buffer) - len(buffer) % size
+        for start in range(0, full, size):
+            yield buffer[start:start + size]
+        buffer = buffer[full:]
+    if buffer:
+        yield buffer
+
+
+def store_content_stream(open_pieces, batch_chunks=16):
+    """
+    流式保存正文（已存在则复用），返回 (内容哈希, 字符数)
+    open_pieces: 无参函数，每次调用返回正文片段的新迭代器（会调用三次：
+    第一遍计算哈希、长度和预览，第二遍分块压缩写入，第三遍建立全文索引），
+    整篇正文不会读入内存
+    """
+    hasher = hashlib.sha256()
+    length, preview = 0, ''
+    for piece in open_pieces():
+        hasher.update(piece.encode('utf-8'))
+        length += len(piece)
+        if len(preview) < PREVIEW_CHARS:
+            preview += piece[:PREVIEW_CHARS - len(preview)]
+    digest = hasher.hexdigest()
+    if db.session.get(ContentBlob, digest) is not None:
+        return digest, length
+
+    inserted = _insert_blob({
+        'content_hash': digest,
+        'char_length': length,
+        'chunk_chars': CONTENT_CHUNK_CHARS,
+        'chunk_count': -(-length // CONTENT_CHUNK_CHARS),
+        'preview': preview
+    })
+    if not inserted:
+        return digest, length
+
+    rows = []
+    for seq, chunk in enumerate(_rechunk(open_pieces())):
+        rows.append({'content_hash': digest, 'seq': seq, 'data': zlib.compress(chunk.encode('utf-8'))})
+        if len(rows) >= batch_chunks:
+            db.session.execute(db.insert(ContentChunk), rows)
+            rows = []
+    if rows:
+        db.session.execute(db.insert(ContentChunk), rows)
+    index_contents([(digest, _rechunk(open_pieces()))])
+    return digest, length
+
+
+def create_text_file(filename, content, **fields):
+    """新建文件并把正文写入内容存储（不提交事务）"""
+    text_file = TextFile(filename=filename, content='', **fields)
+    db.session.add(text_file)
+    db.session.flush()
+    db.session.add(TextFileContent(file_id=text_file.id, content_hash=store_content(content)))
+    return text_file
+
+
+def create_text_file_from_stream(filename, open_pieces, **fields):
+    """新建文件并流式写入正文（不提交事务），open_pieces 见 store_content_stream"""
+    digest, _ = store_content_stream(open_pieces)
+    text_file = TextFile(filename=filename, content='', **fields)
+    db.session.add(text_file)
+    db.session.flush()
+    db.session.add(TextFileContent(file_id=text_file.id, content_hash=digest))
+    return text_file
+
+
+def create_text_files(items, status=FileStatus.PENDING):
+    """
+    批量新建文件（不提交事务），items 为 [(文件名, 正文), ...]，返回新文件的 id 列表
+    不经过 ORM 对象，因此在这里同步更新文件状态计数器
+    """
+    # 延迟导入：stats_store 依赖 token_store，后者依赖本模块
+    from app.stats_store import adjust_counters, FILE_STATUS
+
+    if not items:
+        return []
+
+    digests = store_contents([content for _, content in items])
+    now = datetime.utcnow()
+    status = getattr(status, 'value', status)
+    file_ids = list(db.session.scalars(
+        db.insert(TextFile).returning(TextFile.id, sort_by_parameter_order=True),
+        [{'filename': filename, 'content': '', 'upload_time': now, 'status': status} for filename, _ in items]
+    ))
+    db.session.execute(db.insert(TextFileContent), [
+        {'file_id': file_id, 'content_hash': digest} for file_id, digest in zip(file_ids, digests)
+    ])
+    adjust_counters({(FILE_STATUS, status): len(file_ids)})
+    return file_ids
+
+
+def get_content_hashes(file_ids):
+    """这些文件使用的正文哈希（删除文件前取出，供 release_unused_content 使用）"""
+    return set(db.session.scalars(
+        db.select(TextFileContent.content_hash).where(TextFileContent.file_id.in_(list(file_ids)))
+    ))
+
+
+def release_unused_content(hashes):
+    """
+    删除这些正文中不再被任何文件引用的，返回删除数（删除文件后调用）
+    只逐个检查给定的哈希是否仍被引用，耗时与正文库大小无关
+    """
+    unused = [
+        digest for digest in set(hashes)
+        if not db.session.scalar(db.select(db.exists().where(TextFileContent.content_hash == digest)))
+    ]
+    if unused:
+        remove_contents(unused)
+        ContentChunk.query.filter(ContentChunk.content_hash.in_(unused)).delete(synchronize_session=False)
+        ContentBlob.query.filter(ContentBlob.content_hash.in_(unused)).delete(synchronize_session=False)
+    return len(unused)
+
+
+# ---------- 读取 ----------
+
+def _get_blob(file_id):
+    return db.session.execute(
+        db.select(ContentBlob).join(
+            TextFileContent, TextFileContent.content_hash == ContentBlob.content_hash
+        ).where(TextFileContent.file_id == file_id)
+    ).scalar_one_or_none()
+
+
+def _read_chunks(digest, first=None, last=None):
+    query = db.select(ContentChunk.data).where(ContentChunk.content_hash == digest)
+    if first is not None:
+        query = query.where(ContentChunk.seq.between(first, last))
+    return ''.join(
+        zlib.decompress(data).decode('utf-8')
+        for data in db.session.scalars(query.order_by(ContentChunk.seq))
+    )
+
+
+def iter_chunk_texts(digest, batch_size=16):
+    """按顺序逐块产出正文（每次只读取 batch_size 块）"""
+    query = db.select(ContentChunk.data).where(ContentChunk.content_hash == digest).order_by(ContentChunk.seq)
+    for data in db.session.scalars(query.execution_options(yield_per=batch_size)):
+        yield zlib.decompress(data).decode('utf-8')
+
+
+def _inline_content(file_id):
+    return db.session.scalar(db.select(TextFile.content).where(TextFile.id == file_id)) or ''
+
+
+def get_content(file_id):
+    """读取文件的完整正文"""
+    digest = db.session.scalar(
+        db.select(TextFileContent.content_hash).where(TextFileContent.file_id == file_id)
+    )
+    if digest is None:
+        return _inline_content(file_id)
+    return _read_chunks(digest)
+
+
+def get_content_slice(file_id, start=0, end=None):
+    """
+    读取正文片段 content[start:end]（start/end 为非负字符偏移）
+    返回 (片段, 正文总长度)，只解压覆盖该范围的块
+    """
+    blob = _get_blob(file_id)
+    if blob is None:
+        # 旧数据：在数据库中截取，不把整篇正文读入内存
+        count = 2 ** 31 if end is None else max(0, end - start)
+        length, text = db.session.execute(
+            db.select(
+                db.func.length(TextFile.content),
+                db.func.substr(TextFile.content, start + 1, count)
+            ).where(TextFile.id == file_id)
+        ).one()
+        return text or '', length or 0
+
+    end = blob.char_length if end is None else min(end, blob.char_length)
+    if start >= end:
+        return '', blob.char_length
+
+    first = start // blob.chunk_chars
+    last = (end - 1) // blob.chunk_chars
+    text = _read_chunks(blob.content_hash, first, last)
+    offset = first * blob.chunk_chars
+    return text[start - offset:end - offset], blob.char_length
+
+
+def get_contents(file_ids):
+    """批量读取正文，返回 {file_id: 正文}"""
+    file_ids = list(file_ids)
+    links = dict(db.session.execute(
+        db.select(TextFileContent.file_id, TextFileContent.content_hash).where(
+            TextFileContent.file_id.in_(file_ids)
+        )
+    ).all())
+
+    parts = {}
+    if links:
+        for digest, data in db.session.execute(
+            db.select(ContentChunk.content_hash, ContentChunk.data).where(
+                ContentChunk.content_hash.in_(set(links.values()))
+            ).order_by(ContentChunk.content_hash, ContentChunk.seq)
+        ):
+            parts.setdefault(digest, []).append(zlib.decompress(data).decode('utf-8'))
+
+    contents = {file_id: ''.join(parts.get(digest, [])) for file_id, digest in links.items()}
+
+    inline_ids = [file_id for file_id in file_ids if file_id not in links]
+    if inline_ids:
+        contents.update(db.session.execute(
+            db.select(TextFile.id, TextFile.content).where(TextFile.id.in_(inline_ids))
+        ).all())
+    return contents
+
+
+def get_summaries(file_ids):
+    """
+    文件列表用的正文摘要，返回 {file_id: {'preview': 开头若干字, 'length': 总字数}}
+    只读取预览和长度，不读取正文
+    """
+    file_ids = list(file_ids)
+    summaries = {
+        file_id: {'preview': preview, 'length': length}
+        for file_id, preview, length in db.session.execute(
+            db.select(TextFileContent.file_id, ContentBlob.preview, ContentBlob.char_length).join(
+                ContentBlob, ContentBlob.content_hash == TextFileContent.content_hash
+            ).where(TextFileContent.file_id.in_(file_ids))
+        )
+    }
+
+    inline_ids = [file_id for file_id in file_ids if file_id not in summaries]
+    if inline_ids:
+        for file_id, preview, length in db.session.execute(
+            db.select(
+                TextFile.id,
+                db.func.substr(TextFile.content, 1, PREVIEW_CHARS),
+                db.func.length(TextFile.content)
+            ).where(TextFile.id.in_(inline_ids))
+        ):
+            summaries[file_id] = {'preview': preview or '', 'length': length or 0}
+    return summaries
+
+
+# ---------- 迁移 ----------
+
+def migrate_inline_contents(batch_size=50):
+    """
+    把旧文件的正文从 text_files.content 移入内容存储，每 batch_size 个文件提交一次
+    返回 (迁移的文件数, 新增的正文数)
+    """
+    linked = db.select(TextFileContent.file_id)
+    file_ids = list(db.session.scalars(
+        db.select(TextFile.id).where(~TextFile.id.in_(linked)).order_by(TextFile.id)
+    ))
+    blobs_before = ContentBlob.query.count()
+
+    for i, file_id in enumerate(file_ids, 1):
+        digest = store_content(_inline_content(file_id))
+        db.session.add(TextFileContent(file_id=file_id, content_hash=digest))
+        db.session.execute(db.update(TextFile).where(TextFile.id == file_id).values(content=''))
+        if i % batch_size == 0:
+            db.session.commit()
+
+    db.session.commit()
+    return len(file_ids), ContentBlob.query.count() - blobs_before
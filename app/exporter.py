@@ -0,0 +1,213 @@
+# app/exporter.py
+"""
+标注结果的流式导出
+
+单个文件和整个语料库都以生成器的形式逐段输出，不在内存中拼出完整的导出内容：
+文件列表、实体和行存储的词语都按 EXPORT_BATCH_SIZE 用 yield_per 分批读取，
+内存占用只与单个文件的大小有关，与语料库规模无关。
+
+支持的格式：
+
+- json: 单个文件为 {"file", "text_annotation", "word_annotations", "entity_annotations"}，
+  语料库为 {"files": [...]}；
+- jsonl: 每行一个文件，结构同 json；
+- csv: 每行一个词，带词性、偏移量和实体 BIO 标签；
+- conll: 每行 "词\\t词性\\tBIO标签"，句末标点和换行处空一行，文件之间以 # 注释行分隔。
+
+BIO 标签按词对齐：词与实体重叠时，包含实体起点的词为 B-类型，其后的词为 I-类型。
+"""
+import csv
+import io
+import json
+
+from app import db
+from app.models import TextFile, TextAnnotation, EntityAnnotation
+from app.content_store import get_content
+from app.token_store import iter_word_annotations
+
+EXPORT_MIMETYPES = {
+    'json': 'application/json; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'conll': 'text/plain; charset=utf-8',
+}
+
+CSV_COLUMNS = ('file_id', 'filename', 'word_index', 'word', 'pos', 'pos_cn', 'start_pos', 'end_pos', 'entity_tag')
+
+# CoNLL 格式中在其后断句的词
+SENTENCE_END = set('。！？!?')
+
+# 输出缓冲区大小（字符），攒够后再交给响应，避免逐词写出
+FLUSH_CHARS = 64 * 1024
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _buffered(chunks, size=FLUSH_CHARS):
+    buffer, length = [], 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+# ---------- 读取 ----------
+
+def iter_export_files(file_ids=None, status=None, batch_size=1000):
+    """按 id 顺序分批读取要导出的文件（不读取正文），在开始迭代时才执行查询"""
+    query = db.select(TextFile).order_by(TextFile.id).execution_options(yield_per=batch_size)
+    if file_ids is not None:
+        query = query.where(TextFile.id.in_(list(file_ids)))
+    if status is not None:
+        query = query.where(TextFile.status == status)
+    yield from db.session.scalars(query)
+
+
+def iter_entities(file_id, batch_size=1000):
+    query = db.select(EntityAnnotation).where(EntityAnnotation.file_id == file_id).order_by(
+        EntityAnnotation.start_pos, EntityAnnotation.id
+    ).execution_options(yield_per=batch_size)
+    for entity in db.session.scalars(query):
+        yield entity.to_dict()
+
+
+def _text_annotation(file_id):
+    text_ann = TextAnnotation.query.filter_by(file_id=file_id).first()
+    return text_ann.to_dict() if text_ann else None
+
+
+def tag_words(words, entities):
+    """
+    按偏移量合并词语和实体（二者都按起始位置排序），逐个产出 (词语, BIO 标签)
+    重叠的实体以起始位置靠前的为准
+    """
+    entities = iter(entities)
+    current = next(entities, None)
+
+    for word in words:
+        start, end = word['start_pos'], word['end_pos']
+        while current is not None and current['end_pos'] <= start:
+            current = next(entities, None)
+
+        if current is None or current['start_pos'] >= end:
+            tag = 'O'
+        elif start <= current['start_pos']:
+            tag = f'B-{current["label"]}'
+        else:
+            tag = f'I-{current["label"]}'
+        yield word, tag
+
+
+# ---------- 各格式 ----------
+
+def _json_document(text_file, batch_size):
+    content = get_content(text_file.id)
+    yield '{"file": ' + _dumps({'id': text_file.id, 'filename': text_file.filename, 'content': content})
+    yield ', "text_annotation": ' + _dumps(_text_annotation(text_file.id))
+
+    yield ', "word_annotations": ['
+    for i, word in enumerate(iter_word_annotations(text_file.id, content, batch_size)):
+        yield (', ' if i else '') + _dumps(word)
+
+    yield '], "entity_annotations": ['
+    for i, entity in enumerate(iter_entities(text_file.id, batch_size)):
+        yield (', ' if i else '') + _dumps(entity)
+    yield ']}'
+
+
+def _export_json(files, batch_size, single):
+    if single:
+        for text_file in files:
+            yield from _json_document(text_file, batch_size)
+        return
+
+    yield '{"files": [\n'
+    for i, text_file in enumerate(files):
+        if i:
+            yield ',\n'
+        yield from _json_document(text_file, batch_size)
+    yield '\n]}\n'
+
+
+def _export_jsonl(files, batch_size, single):
+    for text_file in files:
+        yield from _json_document(text_file, batch_size)
+        yield '\n'
+
+
+def _export_csv(files, batch_size, single):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def drain():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow(CSV_COLUMNS)
+    yield drain()
+
+    for text_file in files:
+        content = get_content(text_file.id)
+        words = iter_word_annotations(text_file.id, content, batch_size)
+        for word, tag in tag_words(words, iter_entities(text_file.id, batch_size)):
+            writer.writerow((
+                text_file.id, text_file.filename, word['word_index'], word['word'],
+                word['pos'], word['pos_cn'], word['start_pos'], word['end_pos'], tag
+            ))
+            yield drain()
+
+
+def _export_conll(files, batch_size, single):
+    for i, text_file in enumerate(files):
+        if i:
+            yield '\n'
+        yield f'# file_id = {text_file.id}\n# filename = {text_file.filename}\n'
+
+        content = get_content(text_file.id)
+        words = iter_word_annotations(text_file.id, content, batch_size)
+        in_sentence = False
+        for word, tag in tag_words(words, iter_entities(text_file.id, batch_size)):
+            token = word['word']
+            if not token.strip():
+                # 空白不作为词输出，换行处断句
+                if '\n' in token and in_sentence:
+                    yield '\n'
+                    in_sentence = False
+                continue
+
+            yield f'{token}\t{word["pos"]}\t{tag}\n'
+            in_sentence = True
+            if token in SENTENCE_END:
+                yield '\n'
+                in_sentence = False
+
+        if in_sentence:
+            yield '\n'
+
+
+EXPORTERS = {
+    'json': _export_json,
+    'jsonl': _export_jsonl,
+    'csv': _export_csv,
+    'conll': _export_conll,
+}
+
+
+def stream_export(fmt, file_ids=None, status=None, batch_size=1000, single=False):
+    """
+    返回导出内容的生成器（逐段产出字符串）
+    file_ids / status: 限定导出的文件，均为 None 时导出全部文件
+    single: 导出单个文件（json 格式不套 {"files": [...]}）
+    """
+    if fmt not in EXPORTERS:
+        raise ValueError(f'不支持的导出格式: {fmt}')
+    files = iter_export_files(file_ids, status, batch_size)
+    return _buffered(EXPORTERS[fmt](files, batch_size, single))
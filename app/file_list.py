@@ -0,0 +1,79 @@
+# app/file_list.py
+"""
+文件列表的游标（keyset）分页
+
+列表按 (upload_time, id) 倒序排列。OFFSET 分页翻到第 N 页时数据库要先扫描并丢弃
+前面所有行，这里改为记住上一页最后一行的 (upload_time, id)，下一页直接从索引中
+该位置之后开始读取，任意深度的翻页代价都相同：
+
+- 不筛选状态时使用 idx_file_upload_time；
+- 按状态筛选时使用 idx_file_status_time（status, upload_time）。
+
+游标是 (upload_time, id) 的 URL 安全 base64 编码，对客户端不透明。
+"""
+import base64
+from datetime import datetime
+
+from app import db
+from app.models import TextFile, FileStatus
+
+# 每页最多条数（JSON 接口）
+MAX_PAGE_SIZE = 100
+
+FILE_STATUSES = tuple(status.value for status in FileStatus)
+
+
+def encode_cursor(text_file):
+    raw = f'{text_file.upload_time.isoformat()}|{text_file.id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """返回 (upload_time, id)，游标无效时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        upload_time, file_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(upload_time), int(file_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'无效的游标: {cursor}') from e
+
+
+def list_files(status=None, after=None, before=None, limit=10):
+    """
+    按上传时间倒序列出文件（只读取元数据）
+    status: 只列出该状态的文件，为 None 时不筛选
+    after: 下一页游标，返回该行之后（更早上传）的文件
+    before: 上一页游标，返回该行之前（更晚上传）的文件
+    返回 {'files': [TextFile], 'next_cursor': 游标或 None, 'prev_cursor': 游标或 None}
+    """
+    if status is not None and status not in FILE_STATUSES:
+        raise ValueError(f'未知的状态: {status}')
+
+    key = db.tuple_(TextFile.upload_time, TextFile.id)
+    query = db.select(TextFile)
+    if status is not None:
+        query = query.where(TextFile.status == status)
+
+    if before is not None:
+        # 向前翻页：按升序取紧邻游标的 limit 行，再倒回降序
+        query = query.where(key > decode_cursor(before)).order_by(TextFile.upload_time, TextFile.id)
+    else:
+        if after is not None:
+            query = query.where(key < decode_cursor(after))
+        query = query.order_by(TextFile.upload_time.desc(), TextFile.id.desc())
+
+    files = list(db.session.scalars(query.limit(limit + 1)))
+    has_more = len(files) > limit
+    files = files[:limit]
+
+    if before is not None:
+        files.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, after is not None
+
+    return {
+        'files': files,
+        'next_cursor': encode_cursor(files[-1]) if files and has_next else None,
+        'prev_cursor': encode_cursor(files[0]) if files and has_prev else None
+    }
@@ -0,0 +1,306 @@
+# app/ingest.py
+"""
+批量导入任务
+
+CSV 按行拆分：逐行读取（不把全部行读入列表），每 rows_per_task 行生成一个任务，
+每 INGEST_BATCH_SIZE 个任务用 create_text_files 批量插入一次。
+整个导入在调用方的同一事务内完成，失败或取消时由调用方回滚，不会留下一半的任务。
+
+压缩包/目录导入：按顺序读取其中的 .txt 文件（zip、tar 不支持多线程读取），
+在线程池或进程池中识别编码并解码，每批（INGEST_BATCH_SIZE 个文件或
+INGEST_BATCH_BYTES 字节）插入并提交一次，中途失败或取消时已提交的批次保留。
+解压后超过 max_entry_bytes 的文件在读取前按条目记录的大小跳过，读取时也最多只读
+max_entry_bytes + 1 字节，压缩包中的超大文件或压缩炸弹不会耗尽内存。
+"""
+import csv
+import io
+import os
+import re
+import tarfile
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+
+from app import db
+from app.content_store import create_text_files
+from app.text_decoding import decode_upload, DEFAULT_SAMPLE_BYTES
+
+# 每批插入的任务数
+INGEST_BATCH_SIZE = 1000
+
+# 压缩包导入每批读取的最大字节数
+INGEST_BATCH_BYTES = 32 * 1024 * 1024
+
+# 单个文件（解压后）的默认大小上限
+DEFAULT_MAX_ENTRY_BYTES = 64 * 1024 * 1024
+
+# 导入统计中列出的超大文件名的最大个数
+OVERSIZED_LIST_LIMIT = 100
+
+# 压缩包/目录中导入的文件扩展名
+INGEST_EXTENSIONS = ('.txt',)
+
+
+def safe_filename(filename):
+    """安全处理文件名，保留中文"""
+    # 移除路径分隔符和空字符
+    filename = filename.replace('/', '_').replace('\\', '_').replace('\x00', '')
+    # 移除其他危险字符但保留中文、字母、数字、下划线、点、横线
+    filename = re.sub(r'[<>:"|?*]', '_', filename)
+    # 确保文件名不为空
+    if not filename or filename.strip() == '' or filename in ['.txt', '.csv']:
+        filename = f'未命名_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
+    return filename.strip()
+
+
+def csv_task_options(form):
+    """从上传表单中读取按行拆分的参数"""
+    return {
+        'text_column': form.get('text_column', ''),
+        'rows_per_task': max(1, form.get('rows_per_task', 1, type=int) or 1),
+        'has_header': form.get('has_header', 'on') not in ('', '0', 'off', 'false')
+    }
+
+
+def resolve_text_column(header, text_column):
+    """
+    把列名或从 0 开始的列序号解析为列下标，text_column 为空时返回 None（合并整行）
+    找不到该列时抛出 ValueError
+    """
+    text_column = (text_column or '').strip()
+    if not text_column:
+        return None
+    if header and text_column in header:
+        return header.index(text_column)
+    if text_column.isdigit():
+        return int(text_column)
+    raise ValueError(f'CSV 中没有名为 "{text_column}" 的列')
+
+
+def iter_csv_tasks(text, filename, text_column=None, rows_per_task=1, has_header=True):
+    """
+    逐个产出 (任务文件名, 正文, 本任务的行数)
+    文本列为空的行跳过；任务文件名为 "原文件名_行号.txt"（多行为起止行号，行号从 1 开始、不含表头）
+    """
+    reader = csv.reader(io.StringIO(text))
+    header = next(reader, None) if has_header else None
+    column = resolve_text_column(header, text_column)
+    stem = os.path.splitext(filename)[0]
+    rows_per_task = max(1, int(rows_per_task))
+
+    lines, first_row = [], None
+    row_number = 0
+    for row in reader:
+        row_number += 1
+        if column is None:
+            value = ' '.join(row)
+        else:
+            value = row[column] if column < len(row) else ''
+        if not value.strip():
+            continue
+
+        if first_row is None:
+            first_row = row_number
+        lines.append(value)
+        if len(lines) == rows_per_task:
+            yield _task_name(stem, first_row, row_number), '\n'.join(lines), len(lines)
+            lines, first_row = [], None
+
+    if lines:
+        yield _task_name(stem, first_row, row_number), '\n'.join(lines), len(lines)
+
+
+def _task_name(stem, first_row, last_row):
+    if first_row == last_row:
+        return f'{stem}_{first_row}.txt'
+    return f'{stem}_{first_row}-{last_row}.txt'
+
+
+def import_csv_tasks(text, filename, text_column=None, rows_per_task=1, has_header=True, progress=None):
+    """
+    把 CSV 按行拆分为任务并批量插入（不提交事务）
+    progress(percent, stage): 每插入一批调用一次，抛出异常时中止导入
+    返回 {'tasks': 任务数, 'rows': 导入的行数}
+    """
+    report = progress or (lambda percent, stage: None)
+    total_lines = max(1, text.count('\n'))
+    tasks = rows = 0
+    batch = []
+
+    def flush():
+        nonlocal tasks
+        create_text_files(batch)
+        tasks += len(batch)
+        batch.clear()
+
+    reader = iter_csv_tasks(text, filename, text_column, rows_per_task, has_header)
+    for task_filename, content, row_count in reader:
+        batch.append((task_filename, content))
+        rows += row_count
+        if len(batch) >= INGEST_BATCH_SIZE:
+            flush()
+            report(min(99, 100 * rows // total_lines), f'已导入 {rows} 行，{tasks} 个任务')
+
+    if batch:
+        flush()
+    report(100, f'已导入 {rows} 行，{tasks} 个任务')
+    return {'tasks': tasks, 'rows': rows}
+
+
+# ---------- 压缩包/目录 ----------
+
+def _is_text_entry(name):
+    parts = name.replace('\\', '/').split('/')
+    # 跳过 macOS 生成的 __MACOSX 目录和隐藏文件
+    if '__MACOSX' in parts or parts[-1].startswith('.'):
+        return False
+    return parts[-1].lower().endswith(INGEST_EXTENSIONS)
+
+
+def _zip_entry_name(info):
+    """zip 未标记 UTF-8 的文件名按 cp437 解出，Windows 下打包的中文文件名实际为 GBK"""
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('gbk')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+def _read_path(path, limit):
+    with open(path, 'rb') as f:
+        return f.read(limit)
+
+
+def _read_zip_entry(archive, info, limit):
+    with archive.open(info) as f:
+        return f.read(limit)
+
+
+def _read_tar_member(tar, member, limit):
+    return tar.extractfile(member).read(limit)
+
+
+@contextmanager
+def open_text_entries(path):
+    """
+    打开压缩包（zip、tar、tar.gz 等）或目录，产出 [(条目名, 记录的大小, 读取函数), ...]
+    读取函数 read(limit) 返回条目开头最多 limit 字节，需在 with 块内按顺序调用
+    """
+    if os.path.isdir(path):
+        entries = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                full_path = os.path.join(root, name)
+                rel_path = os.path.relpath(full_path, path)
+                if _is_text_entry(rel_path):
+                    entries.append((rel_path, os.path.getsize(full_path), partial(_read_path, full_path)))
+        yield entries
+    elif zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            yield [
+                (_zip_entry_name(info), info.file_size, partial(_read_zip_entry, archive, info))
+                for info in archive.infolist()
+                if not info.is_dir() and _is_text_entry(_zip_entry_name(info))
+            ]
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as archive:
+            yield [
+                (member.name, member.size, partial(_read_tar_member, archive, member))
+                for member in archive.getmembers()
+                if member.isfile() and _is_text_entry(member.name)
+            ]
+    else:
+        raise ValueError('不支持的文件格式（支持 zip、tar、tar.gz 压缩包或目录）')
+
+
+def _decode_entry(data, sample_bytes):
+    """在工作线程/进程中执行，返回 (正文, 编码信息)"""
+    return decode_upload(io.BytesIO(data), sample_bytes)
+
+
+def _iter_batches(entries, batch_size, batch_bytes, max_entry_bytes, oversized):
+    """
+    按条目数和字节数分批读取，产出 [(条目名, 字节内容), ...]
+    超过 max_entry_bytes 的条目不读取（或读到上限即停止），条目名追加到 oversized
+    """
+    batch, size = [], 0
+    for name, entry_size, read in entries:
+        if entry_size > max_entry_bytes:
+            oversized.append(name)
+            continue
+        data = read(max_entry_bytes + 1)
+        if len(data) > max_entry_bytes:
+            oversized.append(name)
+            continue
+        batch.append((name, data))
+        size += len(data)
+        if len(batch) >= batch_size or size >= batch_bytes:
+            yield batch
+            batch, size = [], 0
+    if batch:
+        yield batch
+
+
+def ingest_text_files(path, workers=None, executor='thread', sample_bytes=DEFAULT_SAMPLE_BYTES,
+                      batch_size=INGEST_BATCH_SIZE, batch_bytes=INGEST_BATCH_BYTES,
+                      max_entry_bytes=DEFAULT_MAX_ENTRY_BYTES, progress=None):
+    """
+    导入压缩包或目录中的 .txt 文件，每批插入后提交
+    executor: 'thread' 或 'process'，解码（含编码检测）在其中并行执行
+    max_entry_bytes: 单个文件解压后的大小上限，超过的文件跳过
+    progress(percent, stage): 每提交一批调用一次，抛出异常时回滚当前批次并中止
+    返回导入统计（文件数、跳过的空文件数、超过大小上限的文件数和文件名、字节数、字符数、
+    编码分布、耗时、每秒文件数）
+    """
+    report = progress or (lambda percent, stage: None)
+    pool_class = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}.get(executor)
+    if pool_class is None:
+        raise ValueError(f'未知的执行方式: {executor}')
+
+    started = time.perf_counter()
+    summary = {'files': 0, 'skipped': 0, 'bytes': 0, 'chars': 0, 'batches': 0}
+    encodings = Counter()
+    oversized = []
+
+    with open_text_entries(path) as entries, pool_class(max_workers=workers or os.cpu_count() or 1) as pool:
+        total = len(entries)
+        report(0, f'共 {total} 个文件')
+        for batch in _iter_batches(entries, batch_size, batch_bytes, max_entry_bytes, oversized):
+            decoded = pool.map(_decode_entry, [data for _, data in batch], [sample_bytes] * len(batch))
+
+            items = []
+            for (name, data), (content, info) in zip(batch, decoded):
+                if not content.strip():
+                    summary['skipped'] += 1
+                    continue
+                items.append((safe_filename(name), content))
+                encodings[info['encoding']] += 1
+                summary['bytes'] += len(data)
+                summary['chars'] += len(content)
+
+            try:
+                create_text_files(items)
+                done = summary['files'] + summary['skipped'] + len(oversized) + len(items)
+                report(100 * done // max(1, total), f'已导入 {summary["files"] + len(items)}/{total} 个文件')
+                db.session.commit()
+            except BaseException:
+                db.session.rollback()
+                raise
+            summary['files'] += len(items)
+            summary['batches'] += 1
+
+    elapsed = time.perf_counter() - started
+    summary.update({
+        'oversized': len(oversized),
+        'oversized_files': oversized[:OVERSIZED_LIST_LIMIT],
+        'encodings': dict(encodings),
+        'elapsed': round(elapsed, 3),
+        'files_per_second': round(summary['files'] / elapsed, 1) if elapsed > 0 else 0
+    })
+    return summary
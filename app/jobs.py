@@ -0,0 +1,209 @@
+# app/jobs.py
+"""
+异步任务（智能标注、CSV 导入等）
+
+提交后立即返回任务ID，任务在本地有界线程池中执行，无需外部消息队列。
+前端轮询状态/进度，完成后取结果；任务可随时取消。
+
+任务按类型使用不同的线程池：
+
+- annotate: 智能标注，只分析不入库，长时间无人轮询的任务视为被放弃，自动取消；
+- import: CSV、压缩包导入，会写入数据库，关闭页面或轮询较慢时不取消，
+  只能显式取消；使用独立的线程池，长时间的导入不会占满智能标注的线程。
+
+任务保存在进程内存中，多 worker 部署时需保证同一任务的请求落在同一进程。
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+ANNOTATE_POOL = 'annotate'
+IMPORT_POOL = 'import'
+
+# 各线程池中的任务无人轮询时是否自动取消
+POOL_ABANDONABLE = {ANNOTATE_POOL: True, IMPORT_POOL: False}
+
+
+class JobStatus:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    FINISHED = {SUCCEEDED, FAILED, CANCELLED}
+
+
+class JobCancelled(Exception):
+    """任务被取消（由进度回调抛出以中止分析）"""
+
+
+class JobQueueFull(Exception):
+    """排队任务数已达上限"""
+
+
+class Job:
+    def __init__(self, kind, params=None, pool=ANNOTATE_POOL):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.pool = pool
+        self.abandonable = POOL_ABANDONABLE[pool]
+        self.status = JobStatus.QUEUED
+        self.progress = 0
+        self.stage = '排队中'
+        self.result = None
+        self.error = None
+        self.create_time = time.time()
+        self.finish_time = None
+        self.last_poll = self.create_time
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in JobStatus.FINISHED
+
+    def report(self, percent, stage):
+        """进度回调：更新进度，若已请求取消则抛出 JobCancelled"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+        self.progress = max(self.progress, int(percent))
+        self.stage = stage
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'pool': self.pool,
+            'params': self.params,
+            'status': self.status,
+            'progress': self.progress,
+            'stage': self.stage,
+            'error': self.error,
+            'create_time': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.create_time)),
+            'elapsed': round((self.finish_time or time.time()) - self.create_time, 3)
+        }
+
+
+class JobManager:
+    """进程内任务管理器（线程安全）"""
+
+    def __init__(self, max_workers=2, import_workers=1, max_pending=32, abandon_timeout=120, result_ttl=600):
+        self.max_workers = max_workers
+        self.import_workers = import_workers
+        self.max_pending = max_pending
+        self.abandon_timeout = abandon_timeout
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executors = {}
+
+    def configure(self, max_workers=None, import_workers=None, max_pending=None, abandon_timeout=None,
+                  result_ttl=None):
+        if max_workers is not None:
+            self.max_workers = max_workers
+        if import_workers is not None:
+            self.import_workers = import_workers
+        if max_pending is not None:
+            self.max_pending = max_pending
+        if abandon_timeout is not None:
+            self.abandon_timeout = abandon_timeout
+        if result_ttl is not None:
+            self.result_ttl = result_ttl
+
+    def _get_executor(self, pool):
+        if pool not in self._executors:
+            workers = self.import_workers if pool == IMPORT_POOL else self.max_workers
+            self._executors[pool] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=f'{pool}-job'
+            )
+        return self._executors[pool]
+
+    def submit(self, app, kind, func, params=None, pool=ANNOTATE_POOL):
+        """
+        提交任务，func(job) 在应用上下文中执行，返回值作为任务结果
+        func 应定期调用 job.report(percent, stage) 以报告进度并响应取消
+        pool: ANNOTATE_POOL 或 IMPORT_POOL（写入数据库的任务，不因无人轮询而取消）
+        """
+        self.sweep()
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if not j.finished)
+            if pending >= self.max_pending:
+                raise JobQueueFull()
+            job = Job(kind, params, pool)
+            self._jobs[job.id] = job
+            self._get_executor(pool).submit(self._run, app, job, func)
+        return job
+
+    def _run(self, app, job, func):
+        if job.cancel_event.is_set():
+            self._finish(job, JobStatus.CANCELLED)
+            return
+
+        job.status = JobStatus.RUNNING
+        job.stage = '开始'
+        with app.app_context():
+            try:
+                job.result = func(job)
+                job.progress = 100
+                job.stage = '完成'
+                self._finish(job, JobStatus.SUCCEEDED)
+            except JobCancelled:
+                self._finish(job, JobStatus.CANCELLED)
+            except Exception as e:
+                job.error = str(e)
+                self._finish(job, JobStatus.FAILED)
+
+    def _finish(self, job, status):
+        job.status = status
+        if status == JobStatus.CANCELLED:
+            job.stage = '已取消'
+        job.finish_time = time.time()
+
+    def get(self, job_id, poll=True):
+        """获取任务；poll 为 True 时刷新心跳（用于判断任务是否被放弃）"""
+        job = self._jobs.get(job_id)
+        if job is not None and poll:
+            job.last_poll = time.time()
+            self.sweep()
+        return job
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if not job.finished:
+            job.cancel_event.set()
+            if job.status == JobStatus.QUEUED:
+                self._finish(job, JobStatus.CANCELLED)
+        return job
+
+    def sweep(self):
+        """取消无人轮询的任务（导入任务除外），清理过期的已完成任务"""
+        now = time.time()
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.finished:
+                    if now - job.finish_time > self.result_ttl:
+                        del self._jobs[job_id]
+                elif job.abandonable and now - job.last_poll > self.abandon_timeout:
+                    job.cancel_event.set()
+                    if job.status == JobStatus.QUEUED:
+                        self._finish(job, JobStatus.CANCELLED)
+
+    def stats(self):
+        counts = {}
+        for job in list(self._jobs.values()):
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            'max_workers': self.max_workers,
+            'import_workers': self.import_workers,
+            'max_pending': self.max_pending,
+            'jobs': counts
+        }
+
+
+# 进程级单例
+job_manager = JobManager()
@@ -0,0 +1,121 @@
+# app/knowledge_cache.py
+"""
+知识库进程级缓存
+
+同一进程内所有请求共享一份知识库快照及其匹配自动机，
+仅当数据库中的知识库版本号变化时才重新加载，
+多个 gunicorn worker 通过同一个版本号保持一致。
+
+版本号、实体列表和自动机作为一个不可变快照整体替换，调用方应通过 snapshot()
+一次取得，用快照的版本号作为结果缓存的键、用快照的自动机分析，
+避免结果被缓存到并非用来计算它的知识库版本下。
+"""
+import threading
+import time
+from collections import namedtuple
+
+from app import db
+from app.models import KnowledgeEntity, KnowledgeVersion
+from app.storage import upsert_insert
+
+KnowledgeSnapshot = namedtuple('KnowledgeSnapshot', ['version', 'entities', 'matcher'])
+
+
+def get_knowledge_version():
+    """读取数据库中的知识库版本号（每次都查询，不使用会话中已加载的对象）"""
+    version = db.session.scalar(db.select(KnowledgeVersion.version).where(KnowledgeVersion.id == 1))
+    return version or 0
+
+
+def bump_knowledge_version():
+    """
+    知识库版本号加一（在调用方的事务中执行，随调用方一起提交）
+    知识库发生任何变更后都必须调用
+    """
+    table = KnowledgeVersion.__table__
+    insert = upsert_insert(db.session.get_bind().dialect.name)
+    if insert is not None:
+        # 首次使用时两个写入者可能同时插入 id=1 的行，ON CONFLICT 时改为加一
+        stmt = insert(table).values(id=1, version=1)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.id], set_={'version': table.c.version + 1}
+        ))
+        return
+
+    updated = KnowledgeVersion.query.filter_by(id=1).update(
+        {KnowledgeVersion.version: KnowledgeVersion.version + 1},
+        synchronize_session=False
+    )
+    if not updated:
+        db.session.add(KnowledgeVersion(id=1, version=1))
+
+
+class KnowledgeBaseCache:
+    """知识库快照缓存（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.last_rebuild_time = 0.0
+        self.total_rebuild_time = 0.0
+
+    def snapshot(self):
+        """
+        返回与数据库当前版本号一致的快照 KnowledgeSnapshot(version, entities, matcher)
+        版本号变化时重新加载；计数和快照的读取、替换都在锁内完成
+        """
+        version = get_knowledge_version()
+        with self._lock:
+            # 等锁期间可能已被其他线程重建
+            if self._snapshot is not None and self._snapshot.version == version:
+                self.hits += 1
+                return self._snapshot
+
+            self.misses += 1
+            t0 = time.perf_counter()
+
+            from app.utils import build_knowledge_matcher
+            rows = db.session.query(
+                KnowledgeEntity.text, KnowledgeEntity.label
+            ).order_by(KnowledgeEntity.id).all()
+            entities = [(text, label) for text, label in rows]
+            self._snapshot = KnowledgeSnapshot(version, entities, build_knowledge_matcher(entities))
+
+            elapsed = time.perf_counter() - t0
+            self.rebuilds += 1
+            self.last_rebuild_time = elapsed
+            self.total_rebuild_time += elapsed
+            return self._snapshot
+
+    def get_matcher(self):
+        """获取与当前知识库版本一致的匹配自动机（需要版本号时使用 snapshot）"""
+        return self.snapshot().matcher
+
+    def get_entities(self):
+        """获取知识库快照 [(text, label), ...]（需要版本号时使用 snapshot）"""
+        return self.snapshot().entities
+
+    def invalidate(self):
+        """强制下次访问时重新加载"""
+        with self._lock:
+            self._snapshot = None
+
+    def stats(self):
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                'version': snapshot.version if snapshot else None,
+                'size': len(snapshot.entities) if snapshot else 0,
+                'hits': self.hits,
+                'misses': self.misses,
+                'rebuilds': self.rebuilds,
+                'last_rebuild_time': round(self.last_rebuild_time, 4),
+                'total_rebuild_time': round(self.total_rebuild_time, 4)
+            }
+
+
+# 进程级单例
+knowledge_cache = KnowledgeBaseCache()
@@ -0,0 +1,187 @@
+# app/knowledge_search.py
+"""
+知识库实体的子串检索与游标分页
+
+知识库页原来用 text LIKE '%关键词%' 全表扫描，并一次读出全部实体。这里：
+
+- 子串检索使用二元字符索引 knowledge_ngrams：实体文本（小写）中每对相邻的两字为一项，
+  最后一个字单独一项。单字查询按前缀范围查找（该字在任意位置都对应以它开头的一项）；
+  多字查询要求实体包含查询的全部二元组，再用 LIKE 去掉二元组都出现但不相邻的实体，
+  LIKE 只作用于索引筛出的少量候选；
+- 列表按 (frequency, id) 倒序游标分页：不筛选类型时使用 idx_knowledge_frequency，
+  按类型筛选时使用 idx_knowledge_label_frequency，任意深度的翻页代价都相同。
+
+索引由 KnowledgeEntity 的插入/修改/删除事件维护，与实体在同一事务中写入；
+不经过 ORM 对象的批量写入（annotation_store.update_knowledge、批量删除）
+需调用 index_entities / unindex_entities。
+索引为空而知识库不为空时（升级前的数据），应用启动时自动重建。
+"""
+import base64
+
+from sqlalchemy import event, inspect
+
+from app import db
+from app.models import KnowledgeEntity, KnowledgeNgram
+
+# 每页最多条数（JSON 接口）
+MAX_PAGE_SIZE = 200
+
+# 批量维护索引时每批的实体数
+INDEX_BATCH_SIZE = 500
+
+# 单字查询的前缀范围上界
+MAX_CHAR = '\U0010ffff'
+
+
+def entity_grams(text):
+    """实体文本的二元组集合（小写，含最后一个字）"""
+    text = text.lower()
+    return {text[i:i + 2] for i in range(len(text))}
+
+
+# ---------- 索引维护 ----------
+
+def _insert_grams(connection, entities):
+    rows = [
+        {'gram': gram, 'entity_id': entity_id}
+        for entity_id, text in entities for gram in entity_grams(text)
+    ]
+    if rows:
+        connection.execute(db.insert(KnowledgeNgram), rows)
+
+
+def _delete_grams(connection, entity_ids):
+    connection.execute(db.delete(KnowledgeNgram).where(KnowledgeNgram.entity_id.in_(entity_ids)))
+
+
+@event.listens_for(KnowledgeEntity, 'after_insert')
+def _index_inserted_entity(mapper, connection, target):
+    _insert_grams(connection, [(target.id, target.text)])
+
+
+@event.listens_for(KnowledgeEntity, 'after_update')
+def _reindex_updated_entity(mapper, connection, target):
+    if not inspect(target).attrs.text.history.has_changes():
+        return
+    _delete_grams(connection, [target.id])
+    _insert_grams(connection, [(target.id, target.text)])
+
+
+@event.listens_for(KnowledgeEntity, 'after_delete')
+def _unindex_deleted_entity(mapper, connection, target):
+    _delete_grams(connection, [target.id])
+
+
+def index_entities(texts):
+    """为这些文本的实体（重新）建立索引（不提交事务），用于不经过 ORM 的批量插入"""
+    texts = list(texts)
+    connection = db.session.connection()
+    for i in range(0, len(texts), INDEX_BATCH_SIZE):
+        entities = db.session.execute(
+            db.select(KnowledgeEntity.id, KnowledgeEntity.text).where(
+                KnowledgeEntity.text.in_(texts[i:i + INDEX_BATCH_SIZE])
+            )
+        ).all()
+        if entities:
+            _delete_grams(connection, [entity_id for entity_id, _ in entities])
+            _insert_grams(connection, entities)
+
+
+def unindex_entities(entity_ids):
+    """删除这些实体的索引（不提交事务），用于不经过 ORM 的批量删除"""
+    entity_ids = list(entity_ids)
+    connection = db.session.connection()
+    for i in range(0, len(entity_ids), INDEX_BATCH_SIZE):
+        _delete_grams(connection, entity_ids[i:i + INDEX_BATCH_SIZE])
+
+
+def rebuild_knowledge_index():
+    """清空并重建全部实体的索引（不提交事务），返回实体数"""
+    connection = db.session.connection()
+    connection.execute(db.delete(KnowledgeNgram))
+
+    count = 0
+    batch = []
+    query = db.select(KnowledgeEntity.id, KnowledgeEntity.text).order_by(KnowledgeEntity.id)
+    for entity in db.session.execute(query.execution_options(yield_per=INDEX_BATCH_SIZE)):
+        batch.append(entity)
+        if len(batch) >= INDEX_BATCH_SIZE:
+            _insert_grams(connection, batch)
+            count += len(batch)
+            batch = []
+    _insert_grams(connection, batch)
+    return count + len(batch)
+
+
+def ensure_knowledge_index():
+    """索引为空而知识库不为空时重建索引并提交（应用启动时调用）"""
+    has_grams = db.session.scalar(db.select(KnowledgeNgram.entity_id).limit(1)) is not None
+    has_entities = db.session.scalar(db.select(KnowledgeEntity.id).limit(1)) is not None
+    if has_entities and not has_grams:
+        rebuild_knowledge_index()
+        db.session.commit()
+
+
+# ---------- 检索与分页 ----------
+
+def encode_cursor(entity):
+    raw = f'{entity.frequency}|{entity.id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """返回 (frequency, id)，游标无效时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        frequency, entity_id = raw.split('|')
+        return int(frequency), int(entity_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'无效的游标: {cursor}') from e
+
+
+def _filtered(query, search=None, label=None):
+    if label:
+        query = query.where(KnowledgeEntity.label == label)
+
+    search = (search or '').strip().lower()
+    if not search:
+        return query
+    if len(search) == 1:
+        candidates = db.select(KnowledgeNgram.entity_id).where(
+            KnowledgeNgram.gram.between(search, search + MAX_CHAR)
+        )
+        return query.where(KnowledgeEntity.id.in_(candidates))
+
+    grams = {search[i:i + 2] for i in range(len(search) - 1)}
+    candidates = db.select(KnowledgeNgram.entity_id).where(
+        KnowledgeNgram.gram.in_(grams)
+    ).group_by(KnowledgeNgram.entity_id).having(db.func.count() == len(grams))
+    return query.where(
+        KnowledgeEntity.id.in_(candidates),
+        db.func.lower(KnowledgeEntity.text).contains(search, autoescape=True)
+    )
+
+
+def count_entities(search=None, label=None):
+    return db.session.scalar(_filtered(db.select(db.func.count(KnowledgeEntity.id)), search, label))
+
+
+def list_entities(search=None, label=None, after=None, limit=60):
+    """
+    按频次倒序列出实体
+    search: 文本中包含该子串（不区分大小写），label: 只列出该类型
+    after: 下一页游标
+    返回 {'entities': [KnowledgeEntity], 'next_cursor': 游标或 None}
+    """
+    query = _filtered(db.select(KnowledgeEntity), search, label)
+    if after is not None:
+        query = query.where(db.tuple_(KnowledgeEntity.frequency, KnowledgeEntity.id) < decode_cursor(after))
+    query = query.order_by(KnowledgeEntity.frequency.desc(), KnowledgeEntity.id.desc())
+
+    entities = list(db.session.scalars(query.limit(limit + 1)))
+    has_more = len(entities) > limit
+    entities = entities[:limit]
+    return {
+        'entities': entities,
+        'next_cursor': encode_cursor(entities[-1]) if entities and has_more else None
+    }
@@ -0,0 +1,169 @@
+# app/matcher.py
+"""
+多模式字符串匹配
+
+AhoCorasick 自动机：一次扫描文本即可找出所有词条的出现位置，
+用于知识库实体匹配等需要同时查找大量词条的场景。
+PrefixTrie 前缀树：判断文本是否以某个词条开头。
+"""
+from collections import deque
+
+
+class AhoCorasick:
+    """Aho-Corasick 多模式匹配自动机"""
+
+    def __init__(self, patterns=None):
+        # 每个节点：子节点字典、失败指针、输出（词条编号列表）
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._words = []
+        self._payloads = []
+        self._built = False
+
+        if patterns:
+            for word, payload in patterns:
+                self.add(word, payload)
+            self.build()
+
+    def __len__(self):
+        return len(self._words)
+
+    def add(self, word, payload=None):
+        """添加词条，返回词条编号（按添加顺序递增）"""
+        if not word:
+            return None
+
+        node = 0
+        for ch in word:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+
+        index = len(self._words)
+        self._words.append(word)
+        self._payloads.append(payload)
+        self._out[node].append(index)
+        self._built = False
+        return index
+
+    def build(self):
+        """构建失败指针（BFS）"""
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = deque()
+
+        for nxt in goto[0].values():
+            fail[nxt] = 0
+            queue.append(nxt)
+
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in goto[node].items():
+                queue.append(nxt)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                if out[fail[nxt]]:
+                    out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._built = True
+        return self
+
+    def word(self, index):
+        return self._words[index]
+
+    def payload(self, index):
+        return self._payloads[index]
+
+    def iter_matches(self, text):
+        """
+        单次扫描文本，产出所有匹配 (start, end, index)
+        包含互相重叠的匹配，按结束位置递增产出
+        """
+        if not self._built:
+            self.build()
+
+        goto, fail, out, words = self._goto, self._fail, self._out, self._words
+        node = 0
+
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                end = i + 1
+                for index in out[node]:
+                    yield end - len(words[index]), end, index
+
+    def find_all(self, text):
+        """
+        查找所有匹配，同一词条内部不重叠（与 re.finditer 逐词扫描的结果一致）
+        返回按 (词条编号, 起始位置) 排序的 (start, end, index) 列表
+        """
+        last_end = {}
+        matches = []
+
+        for start, end, index in self.iter_matches(text):
+            if start < last_end.get(index, 0):
+                continue
+            last_end[index] = end
+            matches.append((start, end, index))
+
+        matches.sort(key=lambda m: (m[2], m[0]))
+        return matches
+
+
+class PrefixTrie:
+    """前缀树：判断文本是否以某个词条开头，复杂度 O(len(text))"""
+
+    _END = object()
+
+    def __init__(self, words=None):
+        self._root = {}
+        self._size = 0
+        if words:
+            for word in words:
+                self.add(word)
+
+    def __len__(self):
+        return self._size
+
+    def add(self, word):
+        if not word:
+            return
+        node = self._root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        if self._END not in node:
+            node[self._END] = word
+            self._size += 1
+
+    def longest_prefix(self, text):
+        """返回作为 text 前缀的最长词条，没有则返回 None"""
+        node = self._root
+        found = None
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            if self._END in node:
+                found = node[self._END]
+        return found
+
+    def has_prefix(self, text):
+        """text 是否以某个词条开头"""
+        node = self._root
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                return False
+            if self._END in node:
+                return True
+        return False
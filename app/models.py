@@ -15,24 +15,77 @@ class TextFile(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    # 旧数据的正文；新文件正文保存在内容存储中（见 app/content_store.py），此列为空串
+    # 延迟加载：列表、状态修改等只读元数据的查询不会读取正文
+    content = db.deferred(db.Column(db.Text, nullable=False, default=''))
     upload_time = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default=FileStatus.PENDING)
     
     text_annotations = db.relationship('TextAnnotation', backref='file', lazy='dynamic', cascade='all, delete-orphan')
     word_annotations = db.relationship('WordAnnotation', backref='file', lazy='dynamic', cascade='all, delete-orphan')
     entity_annotations = db.relationship('EntityAnnotation', backref='file', lazy='dynamic', cascade='all, delete-orphan')
+    annotation_revision = db.relationship('AnnotationRevision', uselist=False, cascade='all, delete-orphan')
+    word_annotation_pack = db.relationship('WordAnnotationPack', uselist=False, cascade='all, delete-orphan')
+    content_ref = db.relationship('TextFileContent', uselist=False, cascade='all, delete-orphan')
+    
+    # 文件列表按上传时间倒序游标分页，可按状态筛选（见 app/file_list.py）
+    __table_args__ = (
+        db.Index('idx_file_upload_time', 'upload_time'),
+        db.Index('idx_file_status_time', 'status', 'upload_time'),
+    )
+    
+    @classmethod
+    def count(cls, *criteria):
+        """按条件计数（只查主键，不读取正文）"""
+        return db.session.scalar(db.select(db.func.count(cls.id)).where(*criteria))
     
     def to_dict(self):
+        """文件元数据（不含正文，正文通过 content_store 读取）"""
         return {
             'id': self.id,
             'filename': self.filename,
-            'content': self.content,
             'upload_time': self.upload_time.strftime('%Y-%m-%d %H:%M:%S'),
             'status': self.status
         }
 
 
+class ContentBlob(db.Model):
+    """文档正文（按内容哈希去重），正文分块压缩保存在 ContentChunk 中"""
+    __tablename__ = 'content_blobs'
+    
+    content_hash = db.Column(db.String(64), primary_key=True)  # 正文 UTF-8 的 sha256
+    char_length = db.Column(db.Integer, nullable=False)
+    chunk_chars = db.Column(db.Integer, nullable=False)  # 每块字符数（最后一块可能更短）
+    chunk_count = db.Column(db.Integer, nullable=False)
+    preview = db.Column(db.Text, nullable=False, default='')  # 开头一段，供列表显示
+    create_time = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ContentChunk(db.Model):
+    __tablename__ = 'content_chunks'
+    
+    content_hash = db.Column(db.String(64), db.ForeignKey('content_blobs.content_hash'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)  # zlib 压缩的 UTF-8 文本
+
+
+class TextFileContent(db.Model):
+    """文件与正文的对应关系（多个文件可共享同一正文）"""
+    __tablename__ = 'text_file_contents'
+    
+    file_id = db.Column(db.Integer, db.ForeignKey('text_files.id'), primary_key=True)
+    content_hash = db.Column(db.String(64), db.ForeignKey('content_blobs.content_hash'), nullable=False, index=True)
+
+
+class SearchSegment(db.Model):
+    """全文索引的分段（正文的每一块一段），id 即 FTS5 表 content_search 的 rowid，见 app/search_index.py"""
+    __tablename__ = 'search_segments'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)
+    seq = db.Column(db.Integer, nullable=False)
+
+
 class TextAnnotation(db.Model):
     __tablename__ = 'text_annotations'
     
@@ -81,6 +134,22 @@ class WordAnnotation(db.Model):
         }
 
 
+class WordAnnotationPack(db.Model):
+    """
+    分词和词性标注的紧凑存储：每个文件一行，偏移量和词性编码打包为数组
+    编解码见 app/token_store.py
+    """
+    __tablename__ = 'word_annotation_packs'
+    
+    file_id = db.Column(db.Integer, db.ForeignKey('text_files.id'), primary_key=True)
+    token_count = db.Column(db.Integer, nullable=False, default=0)
+    offsets = db.Column(db.LargeBinary, nullable=False)    # zlib 压缩的 int32 数组 [start, end, ...]
+    pos_codes = db.Column(db.LargeBinary, nullable=False)  # zlib 压缩的词性编码数组
+    pos_vocab = db.Column(db.Text, nullable=False)         # JSON：[[pos, pos_cn], ...]，编码即下标
+    word_overrides = db.Column(db.Text)                    # JSON：{序号: 词}，仅记录与原文切片不一致的词
+    update_time = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class EntityAnnotation(db.Model):
     """命名实体标注（独立于分词）"""
     __tablename__ = 'entity_annotations'
@@ -106,6 +175,15 @@ class EntityAnnotation(db.Model):
         }
 
 
+class AnnotationRevision(db.Model):
+    """文件标注修订号，每次保存加一，增量保存时用于检测标注是否已被修改"""
+    __tablename__ = 'annotation_revisions'
+    
+    file_id = db.Column(db.Integer, db.ForeignKey('text_files.id'), primary_key=True)
+    revision = db.Column(db.Integer, nullable=False, default=0)
+    update_time = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class KnowledgeEntity(db.Model):
     __tablename__ = 'knowledge_entities'
     
@@ -117,7 +195,12 @@ class KnowledgeEntity(db.Model):
     create_time = db.Column(db.DateTime, default=datetime.utcnow)
     update_time = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    __table_args__ = (db.Index('idx_text', 'text'),)
+    # 知识库列表按频次倒序游标分页，可按类型筛选（见 app/knowledge_search.py）
+    __table_args__ = (
+        db.Index('idx_text', 'text'),
+        db.Index('idx_knowledge_frequency', 'frequency'),
+        db.Index('idx_knowledge_label_frequency', 'label', 'frequency'),
+    )
     
     def to_dict(self):
         return {
@@ -125,4 +208,44 @@ class KnowledgeEntity(db.Model):
             'text': self.text,
             'label': self.label,
             'frequency': self.frequency
-        }
\ No newline at end of file
+        }
+
+
+class KnowledgeNgram(db.Model):
+    """知识库实体文本的二元字符索引（子串检索），见 app/knowledge_search.py"""
+    __tablename__ = 'knowledge_ngrams'
+    
+    gram = db.Column(db.String(2), primary_key=True)  # 相邻两字（小写），文本最后一个字单独一项
+    entity_id = db.Column(db.Integer, primary_key=True)
+
+
+class StatCounter(db.Model):
+    """统计计数（按 scope 分组的计数器），随保存/清空/删除在同一事务中增减，见 app/stats_store.py"""
+    __tablename__ = 'stat_counters'
+    
+    scope = db.Column(db.String(20), primary_key=True)  # file_status / entity_label / word_pos / meta
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class KnowledgeVersion(db.Model):
+    """知识库版本号（单行表），知识库每次变更加一，用于各进程缓存失效"""
+    __tablename__ = 'knowledge_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class AnnotationResultCache(db.Model):
+    """智能标注结果缓存（持久层），键由内容哈希、知识库版本和分析器版本组成"""
+    __tablename__ = 'annotation_result_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cache_key = db.Column(db.String(128), unique=True, nullable=False)
+    result = db.Column(db.LargeBinary, nullable=False)  # zlib 压缩的 JSON
+    size = db.Column(db.Integer, nullable=False)
+    hits = db.Column(db.Integer, default=0)
+    create_time = db.Column(db.DateTime, default=datetime.utcnow)
+    access_time = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('idx_cache_access', 'access_time'),)
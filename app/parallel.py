@@ -0,0 +1,219 @@
+# app/parallel.py
+"""
+长文本并行智能标注
+
+按句子/段落边界把文本切块，在进程池中分别完成分词和实体识别，
+再按全局偏移量拼接，结果与单进程 analyze_content 完全一致：
+
+- 切分点只选在句末标点或换行之后，jieba 的切分不会跨越这些字符，
+  因此分块分词与整篇分词结果相同；
+- 实体识别时每块左右各带 CHUNK_CONTEXT 个字符的上下文，
+  只保留起始位置落在本块内的实体，跨块实体由其起始块完整识别。
+"""
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from app.utils import (
+    Segment, iter_segments, recognize_entities, build_knowledge_matcher, analyze_content,
+    build_word_annotations, build_entity_annotations,
+    get_text_category, get_sentiment
+)
+
+# 实体识别的上下文长度（需覆盖最长实体及边界检查的前后文）
+CHUNK_CONTEXT = 256
+
+# 可作为切分点的字符（切分点位于其后）
+CHUNK_BOUNDARY = re.compile(r'[\n。！？]')
+
+# ---------- 工作进程 ----------
+
+_worker_matcher = None
+
+
+def _init_worker(knowledge_entities):
+    """工作进程初始化：构建知识库匹配自动机（每个进程只构建一次）"""
+    global _worker_matcher
+    _worker_matcher = build_knowledge_matcher(knowledge_entities)
+
+
+def _annotate_chunk(content, window_start, chunk_start, chunk_end):
+    """
+    分析一个文本块
+    content: 带上下文的窗口文本，window_start 为其在全文中的偏移
+    返回本块内的分词和实体（全局偏移）
+    """
+    lo = chunk_start - window_start
+    hi = chunk_end - window_start
+
+    segments = [
+        Segment(seg.word, seg.pos, seg.pos_cn, seg.start_pos + chunk_start, seg.end_pos + chunk_start)
+        for seg in iter_segments(content[lo:hi])
+    ]
+
+    entities = []
+    for entity in recognize_entities(content, _worker_matcher):
+        if lo <= entity['start_pos'] < hi:
+            entity['start_pos'] += window_start
+            entity['end_pos'] += window_start
+            entities.append(entity)
+
+    return segments, entities
+
+
+def _annotate_document(content):
+    """整篇分析一个文档（批量标注用），使用工作进程的知识库自动机"""
+    return analyze_content(content, _worker_matcher)
+
+
+# ---------- 进程池管理 ----------
+
+_pool = None
+_pool_key = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(knowledge_version, knowledge_entities, workers=None):
+    """获取进程池；知识库版本变化时重建，使工作进程持有最新的知识库"""
+    global _pool, _pool_key
+    workers = workers or os.cpu_count() or 1
+    key = (knowledge_version, workers)
+
+    with _pool_lock:
+        if _pool is None or _pool_key != key:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(knowledge_entities,)
+            )
+            _pool_key = key
+        return _pool
+
+
+def shutdown_pool():
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+        _pool = None
+        _pool_key = None
+
+
+# ---------- 切块与拼接 ----------
+
+def split_chunks(content, chunk_size):
+    """在句末标点或换行之后切分，返回 [(start, end), ...]"""
+    chunks = []
+    start = 0
+    length = len(content)
+
+    while start < length:
+        if length - start <= chunk_size:
+            chunks.append((start, length))
+            break
+        match = CHUNK_BOUNDARY.search(content, start + chunk_size)
+        end = match.end() if match else length
+        chunks.append((start, end))
+        start = end
+
+    return chunks
+
+
+def analyze_content_parallel(content, chunk_size=50000, workers=None,
+                             knowledge_version=None, knowledge_entities=None, progress=None):
+    """
+    并行版 analyze_content，返回结构与其相同
+    knowledge_version / knowledge_entities 为空时取进程级知识库缓存
+    progress: 同 analyze_content，每完成一个分块调用一次；回调抛出异常时取消未开始的分块
+    """
+    report = progress or (lambda percent, stage: None)
+
+    if knowledge_entities is None:
+        from app.knowledge_cache import knowledge_cache
+        knowledge_version, knowledge_entities, _ = knowledge_cache.snapshot()
+
+    chunks = split_chunks(content, chunk_size)
+    pool = get_pool(knowledge_version, knowledge_entities, workers)
+
+    # 情感分析无法分块，作为独立任务与分块任务并行
+    sentiment_future = pool.submit(get_sentiment, content)
+
+    futures = []
+    for chunk_start, chunk_end in chunks:
+        window_start = max(0, chunk_start - CHUNK_CONTEXT)
+        window_end = min(len(content), chunk_end + CHUNK_CONTEXT)
+        futures.append(pool.submit(
+            _annotate_chunk, content[window_start:window_end],
+            window_start, chunk_start, chunk_end
+        ))
+
+    category = get_text_category(content)
+
+    segments, entities = [], []
+    try:
+        for done, future in enumerate(futures, 1):
+            chunk_segments, chunk_entities = future.result()
+            segments.extend(chunk_segments)
+            entities.extend(chunk_entities)
+            report(int(95 * done / len(futures)), f'分块 {done}/{len(futures)}')
+
+        sentiment, sentiment_score = sentiment_future.result()
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        sentiment_future.cancel()
+        raise
+    report(100, '完成')
+
+    return {
+        'text_annotation': {
+            'text_category': category,
+            'text_sentiment': sentiment,
+            'sentiment_score': sentiment_score
+        },
+        'word_annotations': build_word_annotations(segments),
+        'entity_annotations': build_entity_annotations(entities),
+        'chunks': len(chunks)
+    }
+
+
+def analyze_documents_parallel(documents, workers=None, knowledge_version=None,
+                               knowledge_entities=None, max_in_flight=None):
+    """
+    批量分析多个文档，所有工作进程共享同一份知识库自动机
+    documents: 可迭代的 (key, content)，按需读取
+    按完成顺序产出 (key, result, error)，同时在途的文档数不超过 max_in_flight
+    """
+    if knowledge_entities is None:
+        from app.knowledge_cache import knowledge_cache
+        knowledge_version, knowledge_entities, _ = knowledge_cache.snapshot()
+
+    pool = get_pool(knowledge_version, knowledge_entities, workers)
+    max_in_flight = max_in_flight or 2 * (workers or os.cpu_count() or 1)
+    pending = {}
+    documents = iter(documents)
+
+    try:
+        while True:
+            for key, content in documents:
+                pending[pool.submit(_annotate_document, content)] = key
+                if len(pending) >= max_in_flight:
+                    break
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                try:
+                    yield key, future.result(), None
+                except Exception as e:
+                    yield key, None, e
+    finally:
+        # 客户端中断时取消尚未开始的文档
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,244 @@
+# app/result_cache.py
+"""
+智能标注结果缓存
+
+两级缓存：进程内 LRU（内存层）+ 数据库表（持久层，重启后仍有效）。
+缓存键 = 内容哈希 + 知识库版本 + 分析器版本，任一变化即视为未命中。
+两层都保存压缩后的结果并按其字节数限制大小，超出时淘汰最久未访问的条目。
+持久层的读写使用独立连接，不影响调用方会话中的事务。
+"""
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+from app import db
+from app.models import AnnotationResultCache
+from app.utils import ANALYZER_VERSION
+
+# 持久层命中后不立即更新访问时间，攒够条数或间隔秒数后批量写回
+TOUCH_BATCH_SIZE = 64
+TOUCH_INTERVAL = 30
+
+# 持久层超出容量时淘汰到容量的这个比例，每批删除的最多条数
+EVICT_TARGET_RATIO = 0.9
+EVICT_BATCH_SIZE = 200
+
+
+def make_cache_key(content, knowledge_version):
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    return f'{digest}:{knowledge_version}:{ANALYZER_VERSION}'
+
+
+def encode_result(result):
+    return zlib.compress(json.dumps(result, ensure_ascii=False).encode('utf-8'))
+
+
+def decode_result(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class SmartAnnotateCache:
+    """智能标注结果两级缓存（线程安全）"""
+
+    def __init__(self, memory_max_bytes=64 * 1024 * 1024, db_max_bytes=512 * 1024 * 1024):
+        self.memory_max_bytes = memory_max_bytes
+        self.db_max_bytes = db_max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> 压缩后的结果
+        self._memory_bytes = 0
+        self._db_bytes = None  # 持久层总字节数（估计值，淘汰后按 SUM 重新校准）
+        self._touched = {}  # key -> 未写回的命中次数
+        self._touched_at = time.monotonic()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def configure(self, memory_max_bytes=None, db_max_bytes=None):
+        if memory_max_bytes is not None:
+            self.memory_max_bytes = memory_max_bytes
+        if db_max_bytes is not None:
+            self.db_max_bytes = db_max_bytes
+
+    # ---------- 内存层 ----------
+    # 保存压缩后的结果，命中时解码：按实际占用计算大小，每个调用方拿到独立的副本
+
+    def _memory_get(self, key):
+        with self._lock:
+            blob = self._memory.get(key)
+            if blob is None:
+                return None
+            self._memory.move_to_end(key)
+            return blob
+
+    def _memory_put(self, key, blob):
+        size = len(blob)
+        if size > self.memory_max_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= len(old)
+            self._memory[key] = blob
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    # ---------- 持久层 ----------
+    # 使用独立连接和事务，不提交也不回滚调用方会话中的改动
+
+    def _db_get(self, key):
+        with db.engine.connect() as conn:
+            return conn.scalar(
+                db.select(AnnotationResultCache.result).where(AnnotationResultCache.cache_key == key)
+            )
+
+    def _touch(self, key):
+        """记录一次持久层命中，攒够 TOUCH_BATCH_SIZE 条或超过 TOUCH_INTERVAL 秒后批量写回访问时间"""
+        with self._lock:
+            self._touched[key] = self._touched.get(key, 0) + 1
+            due = (len(self._touched) >= TOUCH_BATCH_SIZE
+                   or time.monotonic() - self._touched_at >= TOUCH_INTERVAL)
+        if due:
+            with db.engine.begin() as conn:
+                self._flush_touched(conn)
+
+    def _flush_touched(self, conn):
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._touched_at = time.monotonic()
+        if not touched:
+            return
+        table = AnnotationResultCache.__table__
+        conn.execute(
+            table.update().where(table.c.cache_key == bindparam('key')).values(
+                hits=db.func.coalesce(table.c.hits, 0) + bindparam('count'),
+                access_time=datetime.utcnow()
+            ),
+            [{'key': key, 'count': count} for key, count in touched.items()]
+        )
+
+    def _db_total(self, conn):
+        return conn.scalar(db.select(db.func.coalesce(db.func.sum(AnnotationResultCache.size), 0)))
+
+    def _db_put(self, key, blob):
+        size = len(blob)
+        if size > self.db_max_bytes:
+            return
+
+        table = AnnotationResultCache.__table__
+        with db.engine.begin() as conn:
+            self._flush_touched(conn)
+            if self._db_bytes is None:
+                self._db_bytes = self._db_total(conn)
+
+            old_size = conn.scalar(db.select(table.c.size).where(table.c.cache_key == key))
+            now = datetime.utcnow()
+            if old_size is None:
+                conn.execute(table.insert().values(
+                    cache_key=key, result=blob, size=size, hits=0, create_time=now, access_time=now
+                ))
+            else:
+                conn.execute(table.update().where(table.c.cache_key == key).values(
+                    result=blob, size=size, access_time=now
+                ))
+            self._db_bytes += size - (old_size or 0)
+
+            # 超出容量时按访问时间淘汰到 EVICT_TARGET_RATIO，避免之后每次写入都要淘汰
+            if self._db_bytes > self.db_max_bytes:
+                self._evict(conn, key, int(self.db_max_bytes * EVICT_TARGET_RATIO))
+
+    def _evict(self, conn, keep_key, target):
+        """按访问时间从旧到新分批删除，直到总字节数不超过 target（keep_key 不删除）"""
+        table = AnnotationResultCache.__table__
+        total = self._db_total(conn)
+        while total > target:
+            oldest = conn.execute(
+                db.select(table.c.id, table.c.size).where(table.c.cache_key != keep_key)
+                .order_by(table.c.access_time).limit(EVICT_BATCH_SIZE)
+            ).all()
+            if not oldest:
+                break
+            evict_ids = []
+            for row_id, row_size in oldest:
+                if total <= target:
+                    break
+                evict_ids.append(row_id)
+                total -= row_size
+            conn.execute(table.delete().where(table.c.id.in_(evict_ids)))
+        self._db_bytes = total
+
+    # ---------- 对外接口 ----------
+
+    def get(self, key):
+        """
+        查询缓存，返回 (result, tier)
+        tier 为 'memory' / 'database'，未命中时返回 (None, None)
+        result 每次重新解码，调用方可以随意修改
+        """
+        blob = self._memory_get(key)
+        if blob is not None:
+            self.memory_hits += 1
+            return decode_result(blob), 'memory'
+
+        try:
+            blob = self._db_get(key)
+        except Exception:
+            blob = None
+
+        if blob is not None:
+            self.db_hits += 1
+            self._memory_put(key, blob)
+            try:
+                self._touch(key)
+            except Exception:
+                pass
+            return decode_result(blob), 'database'
+
+        self.misses += 1
+        return None, None
+
+    def put(self, key, result):
+        blob = encode_result(result)
+        self._memory_put(key, blob)
+        try:
+            self._db_put(key, blob)
+        except Exception:
+            # 缓存写入失败不影响标注结果；总字节数可能已不准确，下次写入时重新统计
+            self._db_bytes = None
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._touched = {}
+        with db.engine.begin() as conn:
+            conn.execute(db.delete(AnnotationResultCache))
+        self._db_bytes = 0
+
+    def stats(self):
+        db_rows, db_bytes = db.session.query(
+            db.func.count(AnnotationResultCache.id),
+            db.func.coalesce(db.func.sum(AnnotationResultCache.size), 0)
+        ).one()
+        return {
+            'memory_items': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+            'memory_max_bytes': self.memory_max_bytes,
+            'db_items': db_rows,
+            'db_bytes': db_bytes,
+            'db_max_bytes': self.db_max_bytes,
+            'memory_hits': self.memory_hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses
+        }
+
+
+# 进程级单例
+result_cache = SmartAnnotateCache()
@@ -0,0 +1,359 @@
+# app/search_index.py
+"""
+正文全文检索（SQLite FTS5）
+
+索引建在内容存储上：正文的每一块（CONTENT_CHUNK_CHARS 个字符）为一段，
+段末附带下一块开头 SEGMENT_OVERLAP 个字符，跨块的短语也能匹配。
+相同正文只索引一次，检索结果通过 text_file_contents 对应到文件。
+FTS5 表不保存词元原文（content=''），只保存倒排索引，删除时从正文块重新生成词元。
+
+中文没有空格分词，这里不依赖分词词典，而是把文本转换成 FTS5 unicode61 分词器
+能直接处理的词元：
+
+- 连续的中日韩字符按相邻两字切分（"北京大学" -> 北京 京大 大学 学），
+  每段连续字符的最后一个字单独保留，单字查询用前缀匹配即可找到任意位置；
+- 其他字母数字按单词索引（不区分大小写）。
+
+查询时按同样规则把每段连续字符转换为相邻两字的短语，空格和标点分隔的部分
+需出现在同一篇正文中（可以在不同的段，见 search_files）。结果按段 id 倒序游标分页，
+同一正文的段 id 连续，新写入的正文在前。写入正文时同步建立索引（content_store），
+删除正文时同步删除（release_unused_content），都在调用方的事务中完成。
+
+升级前已有的正文需执行 flask rebuild-search-index 建立索引，仍在 text_files.content
+中的旧正文需先执行 flask migrate-content-store。非 SQLite 数据库不支持全文检索。
+"""
+import re
+
+from sqlalchemy import text
+
+from app import db
+from app.models import TextFile, TextFileContent, ContentBlob, SearchSegment
+
+SEARCH_TABLE = 'content_search'
+
+# 每段附带的下一块开头字符数（跨块匹配的最大查询长度）
+SEGMENT_OVERLAP = 32
+
+# 每次批量写入的段数
+SEGMENT_BATCH_SIZE = 64
+
+# 检索时每次从 FTS5 读取的匹配段数，每页最多检查的正文数
+SCAN_BATCH_SIZE = 100
+MAX_SCAN_CONTENTS = 1000
+
+# 游标初始值（大于任何段 id）
+MAX_ROWID = 2 ** 63 - 1
+
+# 摘要中匹配位置前后的字符数
+SNIPPET_CONTEXT = 40
+
+# 中日韩字符：汉字（含扩展 A、兼容汉字）、日文假名、韩文音节
+CJK_CHARS = r'\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff'
+RUN_PATTERN = re.compile(f'([{CJK_CHARS}]+)|([^\\W_{CJK_CHARS}]+)')
+
+
+class SearchUnavailable(RuntimeError):
+    """当前数据库不支持全文检索"""
+
+
+def is_available(connection=None):
+    conn = connection if connection is not None else db.session.connection()
+    return conn.dialect.name == 'sqlite'
+
+
+def ensure_search_table(engine):
+    """创建 FTS5 虚拟表（非 SQLite 数据库跳过）"""
+    if engine.dialect.name != 'sqlite':
+        return
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(tokens, content='')"
+        )
+
+
+def drop_search_table(engine):
+    """
+    删除 FTS5 虚拟表（非 SQLite 数据库跳过）
+    db.drop_all 不会删除它，重置数据库时需一并删除，否则旧的 rowid 会对应到新的段
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+# ---------- 词元 ----------
+
+def _iter_runs(value):
+    """产出 (连续字符, 是否为中日韩字符)"""
+    for match in RUN_PATTERN.finditer(value):
+        cjk, word = match.groups()
+        yield (cjk, True) if cjk else (word, False)
+
+
+def index_tokens(value):
+    """把文本转换为索引用的词元串（空格分隔）"""
+    tokens = []
+    for run, cjk in _iter_runs(value):
+        if cjk:
+            tokens.extend(run[i:i + 2] for i in range(len(run)))
+        else:
+            tokens.append(run)
+    return ' '.join(tokens)
+
+
+def query_terms(query):
+    """查询中需同时出现的各段连续字符（去掉标点和空白）"""
+    return [run for run, _ in _iter_runs(query)]
+
+
+def match_clauses(query):
+    """
+    把用户输入转换为 FTS5 MATCH 表达式，每段连续字符一个，没有可检索的字符时抛出 ValueError
+    各表达式需出现在同一篇正文中，但可以在不同的段，由 search_files 分别检查
+    """
+    clauses = []
+    for run, cjk in _iter_runs(query):
+        if not cjk:
+            clauses.append(f'"{run}"')
+        elif len(run) == 1:
+            # 单字：以该字开头的两字词元或段末的单字
+            clauses.append(f'"{run}"*')
+        else:
+            clauses.append('"' + ' '.join(run[i:i + 2] for i in range(len(run) - 1)) + '"')
+    if not clauses:
+        raise ValueError('请输入要检索的文字')
+    return clauses
+
+
+# ---------- 写入 ----------
+
+def _iter_segments(chunks):
+    """产出 (seq, 段文本)，段文本为当前块加下一块开头 SEGMENT_OVERLAP 个字符"""
+    previous = None
+    for seq, chunk in enumerate(chunks):
+        if previous is not None:
+            yield seq - 1, previous + chunk[:SEGMENT_OVERLAP]
+        previous = chunk
+    if previous is not None:
+        yield seq, previous
+
+
+def _write_segments(rows):
+    segment_ids = list(db.session.scalars(
+        db.insert(SearchSegment).returning(SearchSegment.id, sort_by_parameter_order=True),
+        [{'content_hash': digest, 'seq': seq} for digest, seq, _ in rows]
+    ))
+    db.session.execute(
+        text(f'INSERT INTO {SEARCH_TABLE} (rowid, tokens) VALUES (:rowid, :tokens)'),
+        [{'rowid': segment_id, 'tokens': index_tokens(segment)}
+         for segment_id, (_, _, segment) in zip(segment_ids, rows)]
+    )
+
+
+def index_contents(items):
+    """
+    为正文建立索引（不提交事务），items 为 [(内容哈希, 按顺序的块文本), ...]
+    数据库不支持全文检索时直接返回
+    """
+    if not is_available():
+        return
+    rows = []
+    for digest, chunks in items:
+        for seq, segment in _iter_segments(chunks):
+            rows.append((digest, seq, segment))
+            if len(rows) >= SEGMENT_BATCH_SIZE:
+                _write_segments(rows)
+                rows = []
+    if rows:
+        _write_segments(rows)
+
+
+def remove_contents(hashes):
+    """
+    删除这些正文的索引（不提交事务，需在删除正文块之前调用）
+    无内容的 FTS5 表删除时要提供原词元，这里从正文块重新生成
+    """
+    from app.content_store import iter_chunk_texts
+
+    hashes = list(hashes)
+    if not hashes or not is_available():
+        return
+    delete = text(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, tokens) VALUES ('delete', :rowid, :tokens)")
+    for digest in hashes:
+        segment_ids = dict(db.session.execute(
+            db.select(SearchSegment.seq, SearchSegment.id).where(SearchSegment.content_hash == digest)
+        ).all())
+        rows = [
+            {'rowid': segment_ids[seq], 'tokens': index_tokens(segment)}
+            for seq, segment in _iter_segments(iter_chunk_texts(digest)) if seq in segment_ids
+        ]
+        if rows:
+            db.session.execute(delete, rows)
+    SearchSegment.query.filter(SearchSegment.content_hash.in_(hashes)).delete(synchronize_session=False)
+
+
+def rebuild_search_index(batch_size=50, progress=None):
+    """
+    清空并重建全部正文的索引，每 batch_size 个正文提交一次
+    返回 (正文数, 段数)
+    """
+    # 延迟导入：content_store 写入正文时会调用本模块
+    from app.content_store import iter_chunk_texts
+
+    if not is_available():
+        raise SearchUnavailable('当前数据库不支持全文检索（需要 SQLite FTS5）')
+
+    db.session.execute(text(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('delete-all')"))
+    SearchSegment.query.delete()
+    db.session.commit()
+
+    # 按使用该正文的最新文件排序，重建后新文件的正文仍在检索结果前面
+    hashes = list(db.session.scalars(
+        db.select(ContentBlob.content_hash)
+        .outerjoin(TextFileContent, TextFileContent.content_hash == ContentBlob.content_hash)
+        .group_by(ContentBlob.content_hash)
+        .order_by(db.func.max(TextFileContent.file_id), ContentBlob.content_hash)
+    ))
+    for i in range(0, len(hashes), batch_size):
+        batch = hashes[i:i + batch_size]
+        index_contents((digest, iter_chunk_texts(digest)) for digest in batch)
+        db.session.commit()
+        if progress:
+            progress(i + len(batch), len(hashes))
+    return len(hashes), SearchSegment.query.count()
+
+
+# ---------- 检索 ----------
+
+def _find_matches(window, terms):
+    """在窗口文本中查找各检索词，返回按位置排序的 [(起点, 终点)]（窗口内偏移）"""
+    matches = []
+    for term in terms:
+        matches.extend(m.span() for m in re.finditer(re.escape(term), window, re.IGNORECASE))
+    return sorted(matches)
+
+
+def _snippet(file_id, seq, chunk_chars, terms):
+    """
+    文件中第一处匹配附近的摘要：{'text', 'start', 'end', 'highlights': [[起点, 终点], ...]}
+    偏移均为在整篇正文中的字符偏移
+    """
+    from app.content_store import get_content_slice
+
+    base = seq * chunk_chars
+    window, _ = get_content_slice(file_id, base, base + chunk_chars + SEGMENT_OVERLAP)
+    matches = _find_matches(window, terms)
+    first = matches[0][0] if matches else 0
+    start = max(0, first - SNIPPET_CONTEXT)
+    end = min(len(window), (matches[0][1] if matches else 0) + SNIPPET_CONTEXT)
+    return {
+        'text': window[start:end],
+        'start': base + start,
+        'end': base + end,
+        'highlights': [[base + s, base + e] for s, e in matches if s >= start and e <= end]
+    }
+
+
+def _match_rows(match, before, limit, lowest=None):
+    """匹配 match 且 rowid 在 [lowest, before) 内的段 id，从大到小"""
+    sql = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match AND rowid < :before'
+    params = {'match': match, 'before': before, 'limit': limit}
+    if lowest is not None:
+        sql += ' AND rowid >= :lowest'
+        params['lowest'] = lowest
+    return db.session.scalars(text(sql + ' ORDER BY rowid DESC LIMIT :limit'), params).all()
+
+
+def _first_match(match, lowest, highest):
+    """rowid 在 [lowest, highest] 内的第一个匹配段 id"""
+    return db.session.scalar(text(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :match '
+        'AND rowid >= :lowest AND rowid <= :highest ORDER BY rowid LIMIT 1'
+    ), {'match': match, 'lowest': lowest, 'highest': highest})
+
+
+def _scan_order(clauses, cursor):
+    """
+    多个部分时，从游标处各读取最多 SCAN_BATCH_SIZE 个匹配段，匹配最少的排在最前（用于扫描）
+    都读满时取最长的部分
+    """
+    if len(clauses) == 1:
+        return clauses
+    counts = {clause: len(_match_rows(clause, cursor, SCAN_BATCH_SIZE)) for clause in clauses}
+    return sorted(clauses, key=lambda clause: (counts[clause], -len(clause)))
+
+
+def _segment_range(content_hash):
+    """正文的 (最小段 id, 最大段 id)，同一正文的段是一次连续写入的"""
+    return db.session.execute(
+        db.select(db.func.min(SearchSegment.id), db.func.max(SearchSegment.id))
+        .where(SearchSegment.content_hash == content_hash)
+    ).one()
+
+
+def search_files(query, status=None, after=None, limit=20):
+    """
+    检索正文包含查询内容的文件，按正文建立索引的顺序倒序（新写入的在前）游标分页
+    查询中空格、标点分隔的各部分需出现在同一篇正文中（可以在不同的段）。
+    after: 上一页返回的 next_cursor
+    返回 {'results': [{'file': 文件元数据, 'snippet': 摘要}], 'next_cursor': 游标或 None}
+
+    按匹配最少的一部分在 FTS5 中从游标处倒序扫描匹配的段（只读取本页需要的部分），
+    每遇到一篇新的正文，在它的段范围内检查其余部分是否都出现，再列出共享该正文的文件。
+    其余部分很少同时出现时，一页最多检查 MAX_SCAN_CONTENTS 篇正文，结果可能少于 limit 条，
+    此时 next_cursor 不为 None，可继续翻页。
+    """
+    if not is_available():
+        raise SearchUnavailable('当前数据库不支持全文检索（需要 SQLite FTS5）')
+    cursor = int(after) if after is not None else MAX_ROWID
+    clauses = _scan_order(match_clauses(query), cursor)
+    terms = query_terms(query)
+
+    results = []
+    scanned = 0
+    while len(results) < limit and scanned < MAX_SCAN_CONTENTS:
+        segment_ids = _match_rows(clauses[0], cursor, SCAN_BATCH_SIZE)
+        if not segment_ids:
+            cursor = None
+            break
+        hashes = dict(db.session.execute(
+            db.select(SearchSegment.id, SearchSegment.content_hash).where(SearchSegment.id.in_(segment_ids))
+        ).all())
+        for segment_id in segment_ids:
+            # 跳过已检查过的正文的其他段
+            if segment_id >= cursor:
+                continue
+            cursor = segment_id
+            if segment_id not in hashes:
+                continue
+            lowest, highest = _segment_range(hashes[segment_id])
+            cursor = lowest
+            scanned += 1
+            if all(_match_rows(clause, highest + 1, 1, lowest) for clause in clauses[1:]):
+                results.extend(_content_results(hashes[segment_id], lowest, highest, clauses, terms, status))
+            if len(results) >= limit or scanned >= MAX_SCAN_CONTENTS:
+                break
+
+    return {'results': results, 'next_cursor': cursor}
+
+
+def _content_results(content_hash, lowest, highest, clauses, terms, status=None):
+    """共享这篇正文的文件（按状态筛选，id 倒序），摘要取第一处匹配所在的段"""
+    query = db.select(TextFile).join(TextFileContent, TextFileContent.file_id == TextFile.id).where(
+        TextFileContent.content_hash == content_hash
+    )
+    if status is not None:
+        query = query.where(TextFile.status == status)
+    files = db.session.scalars(query.order_by(TextFile.id.desc())).all()
+    if not files:
+        return []
+
+    # 只有一段的正文（绝大多数）不用再查
+    first = lowest if lowest == highest else min(_first_match(clause, lowest, highest) for clause in clauses)
+    seq, chunk_chars = db.session.execute(
+        db.select(SearchSegment.seq, ContentBlob.chunk_chars)
+        .join(ContentBlob, ContentBlob.content_hash == SearchSegment.content_hash)
+        .where(SearchSegment.id == first)
+    ).one()
+    return [{'file': f.to_dict(), 'snippet': _snippet(f.id, seq, chunk_chars, terms)} for f in files]
@@ -0,0 +1,105 @@
+# app/spans.py
+"""
+实体区间集合
+
+按起始位置有序保存实体，重叠查询通过二分查找定位候选区间，
+替代逐个遍历实体列表的线性重叠检查。
+"""
+import bisect
+
+
+class SpanSet:
+    """
+    实体区间集合（元素为包含 start_pos / end_pos / text 的实体字典）
+
+    重叠判定与原先的线性扫描保持一致：存在多个重叠实体时，
+    以最早加入的那个为准。
+    """
+
+    def __init__(self, entities=None):
+        self._keys = []      # (start_pos, seq)，按起始位置有序
+        self._items = {}     # seq -> entity
+        self._seq_of = {}    # id(entity) -> seq
+        self._next_seq = 0
+        self._max_span = 0
+
+        if entities:
+            for entity in entities:
+                self.add(entity)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        """按 (起始位置, 加入顺序) 遍历"""
+        for _, seq in self._keys:
+            yield self._items[seq]
+
+    def to_list(self):
+        return list(self)
+
+    def add(self, entity):
+        """无条件加入实体"""
+        seq = self._next_seq
+        self._next_seq += 1
+        bisect.insort(self._keys, (entity['start_pos'], seq))
+        self._items[seq] = entity
+        self._seq_of[id(entity)] = seq
+        self._max_span = max(self._max_span, entity['end_pos'] - entity['start_pos'])
+
+    def remove(self, entity):
+        seq = self._seq_of.pop(id(entity))
+        key = (entity['start_pos'], seq)
+        del self._keys[bisect.bisect_left(self._keys, key)]
+        del self._items[seq]
+
+    def overlapping(self, start, end):
+        """返回与 [start, end) 重叠的所有实体，按加入顺序排列"""
+        keys = self._keys
+        # 实体长度不超过 max_span，起始位置更早的实体不可能与之重叠
+        lo = bisect.bisect_left(keys, (start - self._max_span + 1, -1))
+        hi = bisect.bisect_left(keys, (end, -1))
+        found = [
+            (seq, self._items[seq])
+            for _, seq in keys[lo:hi]
+            if self._items[seq]['end_pos'] > start
+        ]
+        found.sort(key=lambda item: item[0])
+        return [entity for _, entity in found]
+
+    def first_overlap(self, start, end):
+        """返回最早加入的重叠实体，没有则返回 None"""
+        keys = self._keys
+        lo = bisect.bisect_left(keys, (start - self._max_span + 1, -1))
+        hi = bisect.bisect_left(keys, (end, -1))
+        first_seq = None
+        for _, seq in keys[lo:hi]:
+            if self._items[seq]['end_pos'] > start and (first_seq is None or seq < first_seq):
+                first_seq = seq
+        return None if first_seq is None else self._items[first_seq]
+
+    def overlaps(self, start, end):
+        """是否存在与 [start, end) 重叠的实体"""
+        return self.first_overlap(start, end) is not None
+
+    def add_if_no_overlap(self, entity):
+        """如果不重叠则加入实体"""
+        if self.overlaps(entity['start_pos'], entity['end_pos']):
+            return False
+        self.add(entity)
+        return True
+
+    def replace_if_longer(self, entity):
+        """
+        不重叠则加入；与已有实体重叠时，新实体更长则替换之，否则丢弃
+        返回是否加入了新实体
+        """
+        existing = self.first_overlap(entity['start_pos'], entity['end_pos'])
+        if existing is None:
+            self.add(entity)
+            return True
+        if len(entity['text']) > len(existing['text']):
+            self.remove(existing)
+            self.add(entity)
+            return True
+        return False
@@ -0,0 +1,180 @@
+# app/stats_store.py
+"""
+统计计数器
+
+统计页、/api/stats 和 flask show-stats 不再对标注表做 COUNT / GROUP BY，
+而是读取 stat_counters 表中维护好的计数（行数只与状态、实体类型、词性的种类数有关）：
+
+- file_status: 各状态的文件数，由 TextFile 的插入/状态修改/删除事件维护；
+- entity_label: 各类型的实体数；
+- word_pos: 各词性（中文名）的词语数。
+
+实体和词语计数由 track_annotation_counts 维护：修改某个文件的标注前后各统计一次
+该文件的分布，把差值加到计数器上。计数与标注在同一事务中写入，回滚时一同回滚。
+
+计数器为空（新数据库或升级前的数据）时，首次读取会从数据表重新统计；
+数据被其他途径修改后可用 flask rebuild-stats 重新统计。
+"""
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event, inspect
+
+from app import db
+from app.models import TextFile, EntityAnnotation, StatCounter, FileStatus
+from app.storage import upsert_insert
+from app.token_store import file_pos_counts, pos_distribution
+
+FILE_STATUS = 'file_status'
+ENTITY_LABEL = 'entity_label'
+WORD_POS = 'word_pos'
+
+# 标记计数器已完成初始统计
+META = 'meta'
+BUILT_KEY = 'built'
+
+
+def _status_key(status):
+    status = status or FileStatus.PENDING
+    return getattr(status, 'value', status)
+
+
+# ---------- 写入 ----------
+
+def adjust_counters(deltas, connection=None):
+    """
+    把 {(scope, key): 增量} 加到计数器上（不提交事务）
+    connection: 在 ORM flush 事件中调用时传入事件的连接
+    """
+    rows = [
+        {'scope': scope, 'key': key, 'value': delta}
+        for (scope, key), delta in deltas.items() if delta
+    ]
+    if not rows:
+        return
+
+    conn = connection if connection is not None else db.session.connection()
+    table = StatCounter.__table__
+
+    insert = upsert_insert(conn.dialect.name)
+    if insert is not None:
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.scope, table.c.key],
+            set_={'value': table.c.value + stmt.excluded.value}
+        )
+        conn.execute(stmt, rows)
+        return
+
+    for row in rows:
+        result = conn.execute(
+            db.update(table)
+            .where(table.c.scope == row['scope'], table.c.key == row['key'])
+            .values(value=table.c.value + row['value'])
+        )
+        if result.rowcount == 0:
+            conn.execute(db.insert(table), [row])
+
+
+def annotation_counts(file_id):
+    """单个文件的实体类型和词性分布，返回 Counter({(scope, key): 数量})"""
+    counts = Counter()
+    for label, count in db.session.query(
+        EntityAnnotation.label, db.func.count(EntityAnnotation.id)
+    ).filter(EntityAnnotation.file_id == file_id).group_by(EntityAnnotation.label):
+        counts[(ENTITY_LABEL, label)] += count
+    for pos_cn, count in file_pos_counts(file_id).items():
+        counts[(WORD_POS, pos_cn)] += count
+    return counts
+
+
+@contextmanager
+def track_annotation_counts(file_id):
+    """
+    包住对某个文件标注的修改（整体替换、增量保存、清空、删除文件），
+    退出时按修改前后的分布差值更新计数器（不提交事务）
+    """
+    before = annotation_counts(file_id)
+    yield
+    db.session.flush()
+    after = annotation_counts(file_id)
+
+    deltas = {key: after[key] - before[key] for key in before.keys() | after.keys()}
+    adjust_counters(deltas)
+
+
+# ---------- 文件状态 ----------
+
+def _current_status(connection, file_id):
+    table = TextFile.__table__
+    return connection.scalar(db.select(table.c.status).where(table.c.id == file_id))
+
+
+@event.listens_for(TextFile, 'after_insert')
+def _count_inserted_file(mapper, connection, target):
+    adjust_counters({(FILE_STATUS, _status_key(target.status)): 1}, connection)
+
+
+@event.listens_for(TextFile, 'before_update')
+def _count_status_change(mapper, connection, target):
+    if not inspect(target).attrs.status.history.has_changes():
+        return
+    old = _status_key(_current_status(connection, target.id))
+    new = _status_key(target.status)
+    if old != new:
+        adjust_counters({(FILE_STATUS, old): -1, (FILE_STATUS, new): 1}, connection)
+
+
+@event.listens_for(TextFile, 'before_delete')
+def _count_deleted_file(mapper, connection, target):
+    adjust_counters({(FILE_STATUS, _status_key(_current_status(connection, target.id))): -1}, connection)
+
+
+# ---------- 读取与重建 ----------
+
+def rebuild_counters():
+    """从数据表重新统计全部计数器（不提交事务），返回写入的计数器数"""
+    StatCounter.query.delete()
+
+    counts = Counter()
+    for status, count in db.session.query(TextFile.status, db.func.count(TextFile.id)).group_by(TextFile.status):
+        counts[(FILE_STATUS, _status_key(status))] += count
+    for label, count in db.session.query(
+        EntityAnnotation.label, db.func.count(EntityAnnotation.id)
+    ).group_by(EntityAnnotation.label):
+        counts[(ENTITY_LABEL, label)] += count
+    for pos_cn, count in pos_distribution().items():
+        counts[(WORD_POS, pos_cn)] += count
+    counts[(META, BUILT_KEY)] = 1
+
+    adjust_counters(counts)
+    return len(counts) - 1
+
+
+def get_counters():
+    """返回 {scope: {key: 数量}}（不含为 0 的项）"""
+    rows = db.session.execute(db.select(StatCounter.scope, StatCounter.key, StatCounter.value)).all()
+    if not any(scope == META and key == BUILT_KEY for scope, key, _ in rows):
+        rebuild_counters()
+        db.session.commit()
+        rows = db.session.execute(db.select(StatCounter.scope, StatCounter.key, StatCounter.value)).all()
+
+    counters = {FILE_STATUS: {}, ENTITY_LABEL: {}, WORD_POS: {}}
+    for scope, key, value in rows:
+        if scope in counters and value:
+            counters[scope][key] = value
+    return counters
+
+
+def get_stats_summary():
+    """统计页和 /api/stats 使用的汇总"""
+    counters = get_counters()
+    status_counts = counters[FILE_STATUS]
+    return {
+        'total_files': sum(status_counts.values()),
+        'status_counts': {status.value: status_counts.get(status.value, 0) for status in FileStatus},
+        'total_words': sum(counters[WORD_POS].values()),
+        'total_entities': sum(counters[ENTITY_LABEL].values()),
+        'entity_distribution': counters[ENTITY_LABEL],
+        'pos_distribution': counters[WORD_POS]
+    }
@@ -0,0 +1,128 @@
+# app/storage.py
+"""
+存储配置方案
+
+SQLite 在多人同时标注时，默认的回滚日志模式下写操作会阻塞所有读操作，
+并发保存容易出现 "database is locked"。这里按方案在每个连接建立时设置 PRAGMA：
+
+- concurrent: WAL 日志（读写互不阻塞）、忙等待超时、synchronous=NORMAL、
+  较大的页缓存和内存映射，连接池按并发标注人数配置；
+- legacy: 回滚日志 + synchronous=FULL，与 SQLite 默认行为一致。
+
+非 SQLite 数据库只应用连接池设置。
+"""
+from sqlalchemy import event
+
+STORAGE_PROFILES = {
+    'concurrent': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,          # 毫秒，等待写锁的最长时间
+        'synchronous': 'NORMAL',       # WAL 模式下 NORMAL 已能保证一致性
+        'cache_size': -64 * 1024,      # 负数表示 KiB，即 64MB 页缓存
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 30,
+    },
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'busy_timeout': 5000,
+        'synchronous': 'FULL',
+        'cache_size': -2000,
+        'mmap_size': 0,
+        'temp_store': 'DEFAULT',
+        'pool_size': 5,
+        'max_overflow': 10,
+        'pool_timeout': 30,
+    },
+}
+
+# 每个连接上执行的 PRAGMA（journal_mode 单独处理）
+CONNECTION_PRAGMAS = ('busy_timeout', 'synchronous', 'cache_size', 'mmap_size', 'temp_store')
+
+
+def resolve_profile(name, overrides=None):
+    """返回方案设置，overrides 中的项覆盖方案默认值"""
+    if name not in STORAGE_PROFILES:
+        raise ValueError(f'未知的存储方案: {name}（可选 {", ".join(STORAGE_PROFILES)}）')
+    profile = dict(STORAGE_PROFILES[name])
+    profile.update(overrides or {})
+    return profile
+
+
+def is_sqlite(uri):
+    return (uri or '').startswith('sqlite')
+
+
+def upsert_insert(dialect_name):
+    """返回支持 ON CONFLICT 的 insert 构造函数，数据库不支持时返回 None"""
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    return None
+
+
+def engine_options(uri, profile):
+    """生成 SQLALCHEMY_ENGINE_OPTIONS（连接池设置）"""
+    options = {
+        'pool_size': profile['pool_size'],
+        'max_overflow': profile['max_overflow'],
+        'pool_timeout': profile['pool_timeout'],
+    }
+    if is_sqlite(uri):
+        # 内存数据库只能使用单连接池
+        if ':memory:' in uri or uri.rstrip('/') == 'sqlite:':
+            return {}
+        # sqlite3 驱动自身的锁等待（秒），与 busy_timeout 一致
+        options['connect_args'] = {'timeout': profile['busy_timeout'] / 1000}
+    return options
+
+
+def configure_storage(app):
+    """在 db.init_app 之前调用：根据方案合并连接池设置"""
+    profile = resolve_profile(app.config['STORAGE_PROFILE'], app.config.get('STORAGE_OPTIONS'))
+    options = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], profile)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    app.extensions['storage_profile'] = profile
+    return profile
+
+
+def install_pragmas(engine, profile):
+    """注册连接事件，每个新连接建立时设置 PRAGMA"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA journal_mode={profile['journal_mode']}")
+            for name in CONNECTION_PRAGMAS:
+                cursor.execute(f'PRAGMA {name}={profile[name]}')
+        finally:
+            cursor.close()
+
+
+def ensure_indexes(metadata, engine):
+    """
+    创建模型中声明但数据库中缺少的索引
+    create_all 不会为已存在的表补建索引，升级后的旧数据库需要在这里补上
+    """
+    for table in metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+
+def storage_info(engine):
+    """当前连接上实际生效的设置"""
+    info = {'dialect': engine.dialect.name, 'pool': engine.pool.status()}
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            for name in ('journal_mode',) + CONNECTION_PRAGMAS:
+                info[name] = conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+    return info
@@ -0,0 +1,178 @@
+# app/text_decoding.py
+"""
+上传文件的编码识别与解码
+
+整篇文件交给 chardet 检测非常慢（16MB 文件需要数十秒），而上传的文件绝大多数是 UTF-8。
+这里按以下顺序处理，只读一遍文件：
+
+1. 按块严格解码 UTF-8（允许开头的 BOM），全部成功即为 UTF-8，不调用 chardet；
+2. 遇到非法 UTF-8 字节时，用 chardet 的增量检测器只检测开头 sample_bytes 字节
+   （检测器提前确定时更早停止）；
+3. 回到文件开头，按块用检测到的编码解码（忽略非法字节）。
+
+置信度低于 MIN_CONFIDENCE 时（短文本、重复内容较多时常见）：样本能按 GB18030
+（GBK 的超集）严格解码、且其中的非 ASCII 字符大多是 GB2312 常用字符（常用汉字和全角标点）
+时按 GB18030 解码；否则使用能严格解码样本的检测结果；都不行时按 UTF-8 解码。
+只看能否解码是不够的：西文单字节文本中重音字母后接 ASCII 字母（如 "ün"）
+也是合法的 GB18030 双字节字符，但解出的是生僻字。
+
+超大文件（分块上传）用 choose_encoding 只确定编码、不保留解码结果，
+再用 iter_decoded 逐段解码写入，整篇正文不会出现在内存中。
+"""
+import codecs
+
+from chardet.universaldetector import UniversalDetector
+
+# 每次读取的字节数
+READ_CHUNK_BYTES = 1024 * 1024
+
+# 编码检测最多读取的字节数
+DEFAULT_SAMPLE_BYTES = 64 * 1024
+
+MIN_CONFIDENCE = 0.5
+
+# 置信度不足时推测为 GB18030 所需的常用字符比例（占样本中非 ASCII 字符）
+MIN_COMMON_CJK_RATIO = 0.9
+
+# chardet 结果的别名（GB2312 检测结果按其超集 GBK 解码）
+ENCODING_ALIASES = {
+    'gb2312': 'gbk',
+    'iso-8859-1': 'latin-1',
+    'windows-1252': 'latin-1',
+    'ascii': 'utf-8',
+}
+
+
+def normalize_encoding(encoding):
+    encoding = (encoding or 'utf-8').lower()
+    return ENCODING_ALIASES.get(encoding, encoding)
+
+
+def _iter_chunks(stream, size=READ_CHUNK_BYTES):
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def _decode_chunks(chunks, encoding, errors):
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    parts = [decoder.decode(chunk) for chunk in chunks]
+    parts.append(decoder.decode(b'', final=True))
+    return ''.join(parts)
+
+
+def detect_encoding(stream, sample_bytes=DEFAULT_SAMPLE_BYTES):
+    """用开头最多 sample_bytes 字节检测编码，返回 (编码, 置信度, 样本)"""
+    detector = UniversalDetector()
+    sample = bytearray()
+    while len(sample) < sample_bytes and not detector.done:
+        chunk = stream.read(min(sample_bytes - len(sample), 16 * 1024))
+        if not chunk:
+            break
+        detector.feed(chunk)
+        sample += chunk
+    result = detector.close()
+    return result['encoding'], result['confidence'] or 0.0, bytes(sample)
+
+
+def _is_known(encoding):
+    try:
+        codecs.lookup(encoding)
+        return True
+    except LookupError:
+        return False
+
+
+def _decodes_cleanly(sample, encoding):
+    """样本能否按 encoding 严格解码（末尾被截断的多字节字符不算错误）"""
+    try:
+        codecs.getincrementaldecoder(encoding)(errors='strict').decode(sample, final=False)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+
+def _in_gb2312(char):
+    try:
+        return len(char.encode('gb2312')) == 2
+    except UnicodeEncodeError:
+        return False
+
+
+def _looks_like_gb18030(sample):
+    """样本能按 GB18030 严格解码，且非 ASCII 字符中 GB2312 常用字符的比例不低于 MIN_COMMON_CJK_RATIO"""
+    try:
+        text = codecs.getincrementaldecoder('gb18030')(errors='strict').decode(sample, final=False)
+    except UnicodeDecodeError:
+        return False
+    others = [char for char in text if ord(char) >= 0x80]
+    if not others:
+        return False
+    return sum(1 for char in others if _in_gb2312(char)) >= MIN_COMMON_CJK_RATIO * len(others)
+
+
+def choose_encoding(stream, sample_bytes=DEFAULT_SAMPLE_BYTES):
+    """
+    只确定编码、不保留解码结果（内存占用与文件大小无关），用于超大文件
+    返回 {'encoding', 'confidence', 'method'}，UTF-8 的 encoding 为 'utf-8-sig'（去掉 BOM）
+    """
+    stream.seek(0)
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='strict')
+    try:
+        for chunk in _iter_chunks(stream):
+            decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+        return {'encoding': 'utf-8-sig', 'confidence': 1.0, 'method': 'utf-8'}
+    except UnicodeDecodeError:
+        pass
+    return _detect_fallback(stream, sample_bytes)
+
+
+def _detect_fallback(stream, sample_bytes):
+    """UTF-8 解码失败后：采样检测编码，置信度不足时按候选编码推测"""
+    stream.seek(0)
+    detected, confidence, sample = detect_encoding(stream, sample_bytes)
+    detected = normalize_encoding(detected) if detected else None
+    if detected and confidence >= MIN_CONFIDENCE and _is_known(detected):
+        encoding, method = detected, 'detected'
+    elif _looks_like_gb18030(sample):
+        # 低置信度的检测结果常是把重复较多的中文误判为单字节编码
+        encoding, method = 'gb18030', 'guessed'
+    elif detected and _decodes_cleanly(sample, detected):
+        encoding, method = detected, 'guessed'
+    else:
+        encoding, method = 'utf-8', 'fallback'
+    return {'encoding': encoding, 'confidence': round(confidence, 2), 'method': method}
+
+
+def iter_decoded(stream, encoding, chunk_bytes=READ_CHUNK_BYTES):
+    """从头按块解码文件流（忽略非法字节），逐段产出文本"""
+    stream.seek(0)
+    decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+    for chunk in _iter_chunks(stream, chunk_bytes):
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def decode_upload(stream, sample_bytes=DEFAULT_SAMPLE_BYTES):
+    """
+    识别编码并解码上传的文件流（需支持 seek）
+    返回 (正文, {'encoding': 编码, 'confidence': 置信度, 'method': 'utf-8' / 'detected' / 'guessed' / 'fallback'})
+    """
+    stream.seek(0)
+    try:
+        content = _decode_chunks(_iter_chunks(stream), 'utf-8-sig', 'strict')
+        return content, {'encoding': 'utf-8', 'confidence': 1.0, 'method': 'utf-8'}
+    except UnicodeDecodeError:
+        pass
+
+    info = _detect_fallback(stream, sample_bytes)
+    stream.seek(0)
+    content = _decode_chunks(_iter_chunks(stream), info['encoding'], 'ignore')
+    return content, info
@@ -0,0 +1,241 @@
+# app/token_store.py
+"""
+词语标注的紧凑存储
+
+行存储（WordAnnotation）每个词一行；紧凑存储（WordAnnotationPack）每个文件一行：
+
+- offsets: int32 数组 [start0, end0, start1, end1, ...]
+- pos_codes: 词性编码数组（uint8，词性种类超过 256 时为 uint16），编码为 pos_vocab 的下标
+- pos_vocab: 本文件出现过的 (pos, pos_cn) 组合
+- word_overrides: 词本身可由原文切片 content[start:end] 还原，只记录不一致的词
+
+数组按小端序保存并经 zlib 压缩。读取时按需还原为与 WordAnnotation.to_dict() 相同的字典
+（紧凑存储没有行 id，不含 id 键，词语一律按 word_index 定位），
+两种格式可以共存（迁移过程中），读取时优先使用紧凑存储。
+"""
+import json
+import sys
+import zlib
+from array import array
+from collections import Counter
+
+from flask import current_app
+
+from app import db
+from app.content_store import get_content
+from app.models import WordAnnotation, WordAnnotationPack
+
+WORD_STORAGE_FORMATS = ('packed', 'rows')
+
+
+def get_word_storage():
+    """新保存的词语标注使用的格式"""
+    return current_app.config.get('WORD_STORAGE', 'packed')
+
+
+# ---------- 编解码 ----------
+
+def _pack_array(values):
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.typecode.encode('ascii') + zlib.compress(values.tobytes())
+
+
+def _unpack_array(blob):
+    values = array(blob[:1].decode('ascii'))
+    values.frombytes(zlib.decompress(blob[1:]))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def pack_words(word_annotations, content):
+    """按顺序打包词语列表，返回 WordAnnotationPack 的列值"""
+    offsets = array('i')
+    codes = []
+    vocab = {}
+    overrides = {}
+
+    for idx, word_data in enumerate(word_annotations):
+        word = word_data.get('word', '')
+        start = int(word_data.get('start_pos', 0) or 0)
+        end = int(word_data.get('end_pos', 0) or 0)
+        offsets.append(start)
+        offsets.append(end)
+
+        key = (word_data.get('pos', 'n'), word_data.get('pos_cn', '名词'))
+        code = vocab.get(key)
+        if code is None:
+            code = vocab[key] = len(vocab)
+        codes.append(code)
+
+        if content[start:end] != word:
+            overrides[str(idx)] = word
+
+    return {
+        'token_count': len(codes),
+        'offsets': _pack_array(offsets),
+        'pos_codes': _pack_array(array('B' if len(vocab) <= 256 else 'H', codes)),
+        'pos_vocab': json.dumps(list(vocab), ensure_ascii=False),
+        'word_overrides': json.dumps(overrides, ensure_ascii=False) if overrides else None
+    }
+
+
+def unpack_words(pack, content, file_id=None):
+    """还原为 WordAnnotation.to_dict() 格式的列表（不含 id，按 word_index 定位）"""
+    offsets = _unpack_array(pack.offsets).tolist()
+    codes = _unpack_array(pack.pos_codes).tolist()
+    vocab = json.loads(pack.pos_vocab)
+    overrides = json.loads(pack.word_overrides) if pack.word_overrides else {}
+    file_id = pack.file_id if file_id is None else file_id
+
+    words = []
+    for idx, code in enumerate(codes):
+        start, end = offsets[2 * idx], offsets[2 * idx + 1]
+        pos, pos_cn = vocab[code]
+        override = overrides.get(str(idx))
+        words.append({
+            'file_id': file_id,
+            'word_index': idx,
+            'word': content[start:end] if override is None else override,
+            'pos': pos,
+            'pos_cn': pos_cn,
+            'start_pos': start,
+            'end_pos': end
+        })
+    return words
+
+
+# ---------- 读写 ----------
+
+def load_word_annotations(file_id, content=None):
+    """读取文件的词语标注（紧凑存储优先，其次行存储），按 word_index 排序"""
+    pack = db.session.get(WordAnnotationPack, file_id)
+    if pack is not None:
+        if content is None:
+            content = get_content(file_id)
+        return unpack_words(pack, content, file_id)
+
+    rows = WordAnnotation.query.filter_by(file_id=file_id).order_by(WordAnnotation.word_index).all()
+    return [w.to_dict() for w in rows]
+
+
+def iter_word_annotations(file_id, content=None, batch_size=1000):
+    """逐个产出文件的词语标注（行存储按 batch_size 分批读取），按 word_index 排序"""
+    pack = db.session.get(WordAnnotationPack, file_id)
+    if pack is not None:
+        if content is None:
+            content = get_content(file_id)
+        yield from unpack_words(pack, content, file_id)
+        return
+
+    rows = db.session.scalars(
+        db.select(WordAnnotation).where(WordAnnotation.file_id == file_id)
+        .order_by(WordAnnotation.word_index)
+        .execution_options(yield_per=batch_size)
+    )
+    for row in rows:
+        yield row.to_dict()
+
+
+def write_pack(file_id, word_annotations, content=None):
+    """写入（替换）文件的紧凑存储"""
+    if content is None:
+        content = get_content(file_id)
+    values = pack_words(word_annotations, content)
+
+    pack = db.session.get(WordAnnotationPack, file_id)
+    if pack is None:
+        db.session.add(WordAnnotationPack(file_id=file_id, **values))
+    else:
+        for name, value in values.items():
+            setattr(pack, name, value)
+    return values['token_count']
+
+
+def delete_word_annotations(file_id):
+    """删除文件的词语标注（两种格式）"""
+    WordAnnotation.query.filter_by(file_id=file_id).delete()
+    WordAnnotationPack.query.filter_by(file_id=file_id).delete()
+
+
+def has_pack(file_id):
+    return db.session.scalar(
+        db.select(WordAnnotationPack.file_id).where(WordAnnotationPack.file_id == file_id)
+    ) is not None
+
+
+# ---------- 统计 ----------
+
+def count_words():
+    rows = WordAnnotation.query.count()
+    packed = db.session.query(db.func.coalesce(db.func.sum(WordAnnotationPack.token_count), 0)).scalar()
+    return rows + packed
+
+
+def pos_distribution():
+    """各词性（中文名）的词语数"""
+    counts = Counter(dict(
+        db.session.query(WordAnnotation.pos_cn, db.func.count(WordAnnotation.id))
+        .group_by(WordAnnotation.pos_cn).all()
+    ))
+    for pos_codes, pos_vocab in db.session.query(WordAnnotationPack.pos_codes, WordAnnotationPack.pos_vocab):
+        vocab = json.loads(pos_vocab)
+        for code, count in Counter(_unpack_array(pos_codes)).items():
+            counts[vocab[code][1]] += count
+    return dict(counts)
+
+
+def file_pos_counts(file_id):
+    """单个文件各词性（中文名）的词语数"""
+    pack = db.session.get(WordAnnotationPack, file_id)
+    if pack is not None:
+        vocab = json.loads(pack.pos_vocab)
+        counts = Counter()
+        for code, count in Counter(_unpack_array(pack.pos_codes)).items():
+            counts[vocab[code][1]] += count
+        return counts
+    return Counter(dict(
+        db.session.query(WordAnnotation.pos_cn, db.func.count(WordAnnotation.id))
+        .filter(WordAnnotation.file_id == file_id)
+        .group_by(WordAnnotation.pos_cn).all()
+    ))
+
+
+# ---------- 迁移 ----------
+
+def migrate_word_storage(target, batch_size=50):
+    """
+    把词语标注迁移为 target 格式（'packed' 或 'rows'），每 batch_size 个文件提交一次
+    返回 (迁移的文件数, 迁移的词语数)
+    """
+    if target not in WORD_STORAGE_FORMATS:
+        raise ValueError(f'未知的存储格式: {target}')
+
+    if target == 'packed':
+        file_ids = [row[0] for row in db.session.query(WordAnnotation.file_id).distinct().order_by(WordAnnotation.file_id)]
+    else:
+        file_ids = [row[0] for row in db.session.query(WordAnnotationPack.file_id).order_by(WordAnnotationPack.file_id)]
+
+    migrated_words = 0
+    for i, file_id in enumerate(file_ids, 1):
+        content = get_content(file_id)
+        words = load_word_annotations(file_id, content)
+        delete_word_annotations(file_id)
+
+        if target == 'packed':
+            write_pack(file_id, words, content)
+        else:
+            rows = [
+                {key: w[key] for key in ('file_id', 'word_index', 'word', 'pos', 'pos_cn', 'start_pos', 'end_pos')}
+                for w in words
+            ]
+            for j in range(0, len(rows), 5000):
+                db.session.execute(db.insert(WordAnnotation), rows[j:j + 5000])
+        migrated_words += len(words)
+
+        if i % batch_size == 0:
+            db.session.commit()
+
+    db.session.commit()
+    return len(file_ids), migrated_words
@@ -2,6 +2,13 @@
 import jieba.posseg as pseg
 from snownlp import SnowNLP
 import re
+from collections import namedtuple
+
+from app.matcher import AhoCorasick, PrefixTrie
+from app.spans import SpanSet
+
+# 分析器版本：识别规则或分词逻辑变化时递增，使旧的智能标注缓存失效
+ANALYZER_VERSION = '1'
 
 # ========== 词性映射 ==========
 POS_12 = {
@@ -226,55 +233,42 @@ def get_sentiment(content):
         return '中性', 0.5
 
 
-def segment_text(content):
-    """分词和词性标注，返回包含位置信息的结果"""
-    words = list(pseg.cut(content))
-    results = []
+# 分词结果（偏移量为字符位置，左闭右开）
+Segment = namedtuple('Segment', ['word', 'pos', 'pos_cn', 'start_pos', 'end_pos'])
+
+
+def iter_segments(content):
+    """
+    流式分词和词性标注，逐个产出 Segment
     
+    jieba 的切分结果首尾相接、完整覆盖原文，偏移量由累计长度直接得到，
+    无需在原文中重新查找；空白词只推进偏移量，不产出。
+    """
     current_pos = 0
     
-    for word, flag in words:
+    for word, flag in pseg.cut(content):
+        start = current_pos
+        if not content.startswith(word, start):
+            # 防御：切分结果与原文不一致时回退到查找
+            found = content.find(word, start)
+            if found != -1:
+                start = found
+        end = start + len(word)
+        current_pos = end
+        
         if not word.strip():
-            current_pos += len(word)
             continue
         
-        actual_pos = content.find(word, current_pos)
-        if actual_pos == -1:
-            actual_pos = current_pos
-        
         pos, pos_cn = map_pos_to_12(flag, word)
-        
-        results.append({
-            'word': word,
-            'pos': pos,
-            'pos_cn': pos_cn,
-            'start_pos': actual_pos,
-            'end_pos': actual_pos + len(word)
-        })
-        
-        current_pos = actual_pos + len(word)
-    
-    return results
+        yield Segment(word, pos, pos_cn, start, end)
 
 
-# ========== 辅助函数 ==========
-
-def check_overlap(new_entity, existing_entities):
-    """检查新实体是否与已有实体重叠"""
-    for e in existing_entities:
-        if not (new_entity['end_pos'] <= e['start_pos'] or new_entity['start_pos'] >= e['end_pos']):
-            return True, e
-    return False, None
-
+def segment_text(content):
+    """分词和词性标注，返回包含位置信息的结果"""
+    return [seg._asdict() for seg in iter_segments(content)]
 
-def add_entity_if_no_overlap(entity, entities):
-    """如果不重叠则添加实体"""
-    overlap, _ = check_overlap(entity, entities)
-    if not overlap:
-        entities.append(entity)
-        return True
-    return False
 
+# ========== 辅助函数 ==========
 
 def get_char_before(content, pos, count=1):
     """获取指定位置前的字符"""
@@ -313,126 +307,154 @@ def is_valid_entity_boundary(content, start, end):
 
 # ========== 实体识别核心算法 ==========
 
-def recognize_time_entities(content):
-    """识别时间日期实体"""
-    entities = []
+def compile_scanner(patterns, first_chars):
+    """
+    将多个正则编译为单个扫描器
     
-    time_patterns = [
-        r'\d{4}年\d{1,2}月\d{1,2}[日号]',
-        r'\d{4}[-/\.]\d{1,2}[-/\.]\d{1,2}',
-        r'\d{1,2}月\d{1,2}[日号]?[至到\-－]\d{1,2}[日号]',
-        r'\d{4}年\d{1,2}月[至到\-－]\d{1,2}月',
-        r'\d{4}年\d{1,2}月',
-        r'\d{1,2}月\d{1,2}[日号]',
-        r'当地时间\d{1,2}[日号]',
-        r'当地时间\d{1,2}月\d{1,2}[日号]',
-        r'北京时间\d{1,2}[日号]',
-        r'北京时间\d{1,2}月\d{1,2}[日号]',
-        r'\d{4}年(?:代|初|末|底|中期)?',
-        r'公元前?\d{1,4}年',
-        r'(?:今|明|昨|前|后|大前|大后)天',
-        r'(?:今|明|去|前|后)年',
-        r'(?:这|那|本|上|下)个?月',
-        r'(?:周|星期)[一二三四五六日天]',
-        r'(?:过去|近|未来|今后)\d{1,2}年',
-        r'["""]?十[一二三四五六七八九]五["""]?',
-    ]
+    每个模式放在独立的前瞻捕获组中，一次 finditer 即可得到每个位置上
+    所有模式的匹配；外层前瞻保证只在至少一个模式能匹配的位置停下。
+    first_chars 为所有模式可能的首字符（字符类），其余位置只做一次字符类判断即跳过；
+    首字符命中的位置上仍会逐个尝试全部模式，新增模式时须同步更新 first_chars。
+    """
+    alternation = '|'.join(f'(?:{p})' for p in patterns)
+    captures = ''.join(f'(?=({p})|)' for p in patterns)
+    return re.compile(f'(?={first_chars})(?=(?:{alternation})){captures}')
+
+
+def scan_candidates(scanner, pattern_count, content):
+    """
+    单次扫描找出所有模式的候选匹配
     
-    for pattern in time_patterns:
-        try:
-            for match in re.finditer(pattern, content):
-                text = match.group().strip()
-                start = match.start()
-                end = match.end()
-                
-                overlap = False
-                to_remove = None
-                for e in entities:
-                    if not (end <= e['start_pos'] or start >= e['end_pos']):
-                        if len(text) > len(e['text']):
-                            to_remove = e
-                        else:
-                            overlap = True
-                        break
-                
-                if to_remove:
-                    entities.remove(to_remove)
-                
-                if not overlap and len(text) >= 2:
-                    entities.append({
-                        'text': text,
-                        'label': '时间日期',
-                        'start_pos': start,
-                        'end_pos': end
-                    })
-        except re.error:
+    同一模式内部不重叠（与逐模式 re.finditer 的结果完全一致），
+    返回按 (模式序号, 起始位置) 排序的 (pattern_index, start, end, text) 列表
+    """
+    last_end = [0] * pattern_count
+    candidates = []
+    
+    for match in scanner.finditer(content):
+        for k in range(pattern_count):
+            start, end = match.span(k + 1)
+            if start < 0 or start < last_end[k]:
+                continue
+            last_end[k] = end
+            candidates.append((k, start, end, match.group(k + 1)))
+    
+    candidates.sort(key=lambda c: (c[0], c[1]))
+    return candidates
+
+
+def resolve_longest_candidates(candidates, label, min_length=2):
+    """
+    按候选顺序逐个加入实体：与最早加入的重叠实体比较，更长则替换，否则丢弃
+    
+    candidates: [(start, end, text), ...]
+    """
+    spans = SpanSet()
+    
+    for start, end, text in candidates:
+        if len(text) < min_length:
             continue
+        spans.replace_if_longer({
+            'text': text,
+            'label': label,
+            'start_pos': start,
+            'end_pos': end
+        })
     
-    return sorted(entities, key=lambda x: x['start_pos'])
+    return spans.to_list()
+
+
+TIME_PATTERNS = [
+    r'\d{4}年\d{1,2}月\d{1,2}[日号]',
+    r'\d{4}[-/\.]\d{1,2}[-/\.]\d{1,2}',
+    r'\d{1,2}月\d{1,2}[日号]?[至到\-－]\d{1,2}[日号]',
+    r'\d{4}年\d{1,2}月[至到\-－]\d{1,2}月',
+    r'\d{4}年\d{1,2}月',
+    r'\d{1,2}月\d{1,2}[日号]',
+    r'当地时间\d{1,2}[日号]',
+    r'当地时间\d{1,2}月\d{1,2}[日号]',
+    r'北京时间\d{1,2}[日号]',
+    r'北京时间\d{1,2}月\d{1,2}[日号]',
+    r'\d{4}年(?:代|初|末|底|中期)?',
+    r'公元前?\d{1,4}年',
+    r'(?:今|明|昨|前|后|大前|大后)天',
+    r'(?:今|明|去|前|后)年',
+    r'(?:这|那|本|上|下)个?月',
+    r'(?:周|星期)[一二三四五六日天]',
+    r'(?:过去|近|未来|今后)\d{1,2}年',
+    r'["""]?十[一二三四五六七八九]五["""]?',
+]
+
+# 时间模式可能的首字符
+TIME_FIRST_CHARS = r'[\d当北公今明昨前后大去这那本上下周星过近未来"十]'
+
+TIME_SCANNER = compile_scanner(TIME_PATTERNS, TIME_FIRST_CHARS)
+
+
+def recognize_time_entities(content):
+    """识别时间日期实体"""
+    candidates = [
+        (start, end, text.strip())
+        for _, start, end, text in scan_candidates(TIME_SCANNER, len(TIME_PATTERNS), content)
+    ]
+    return resolve_longest_candidates(candidates, '时间日期')
+
+
+CN_NUM = '[零一二三四五六七八九十百千万亿两]+'
+
+AMOUNT_PATTERNS = [
+    (r'[¥￥$€£]\s*\d+(?:[,，]\d{3})*(?:\.\d+)?(?:万|亿)?元?', 'money'),
+    (r'\d+(?:[,，]\d{3})*(?:\.\d+)?(?:万亿|千亿|百亿|十亿|亿|千万|百万|十万|万|千)?(?:多|余|来|左右)?\s*(?:元|美元|美金|欧元|英镑|日元|港币|人民币)', 'money'),
+    (rf'{CN_NUM}(?:多|余|来|左右)?\s*(?:元|块钱|块|美元|欧元|英镑|日元|港币|人民币)', 'money'),
+    (r'\d+(?:\.\d+)?[%％]', 'percent'),
+    (r'百分之' + CN_NUM, 'percent'),
+    (r'\d{2,}(?:\.\d+)?(?:万|千|百)?(?:多|余|来)?\s*(?:亩|公顷|平方米|平方公里|平米|㎡)', 'area'),
+    (rf'{CN_NUM}(?:多|余|来)?\s*(?:亩|公顷|平方米|平方公里|平米)', 'area'),
+    (r'\d+(?:\.\d+)?(?:万亿|亿|万|千|百)?(?:多|余)?\s*(?:桶|升|毫升|立方米|加仑|吨)', 'volume'),
+    (rf'{CN_NUM}(?:多|余)?\s*(?:桶|升|毫升|立方米|加仑|吨)', 'volume'),
+    (r'\d+(?:\.\d+)?(?:万|千|百)?(?:多|余)?\s*(?:吨|千克|公斤|斤|克|kg|g)', 'weight'),
+    (r'\d+(?:\.\d+)?(?:万|千|百)?(?:多|余)?\s*(?:千米|公里|米|厘米|毫米|km|m)', 'length'),
+    (r'\d{2,}(?:\.\d+)?(?:多|余|来|几)?\s*(?:人|位|名|个|只|条|头|支|把|件|套|台|辆|架|艘|座|栋|家|户|所|处|项|笔|批|次|届|倍|股)', 'quantity'),
+    (r'\d+(?:万|千|百)(?:多|余|来|几)?\s*(?:人|位|名|个|只|条|头|支|把|件|套|台|辆|架|艘|座|栋|家|户|所|处|项|笔|批|次|届|倍|股)', 'quantity'),
+    (rf'{CN_NUM}(?:多|余|来|几)?\s*(?:人|位|名|个|件|套|台|辆|架|艘|座|栋|家|户|所|处|项|笔|批|次|届|倍|股)', 'quantity'),
+]
+
+# 数值金额模式可能的首字符（"百分之"的"百"已包含在中文数字中）
+AMOUNT_FIRST_CHARS = r'[¥￥$€£\d零一二三四五六七八九十百千万亿两]'
+
+AMOUNT_SCANNER = compile_scanner([p for p, _ in AMOUNT_PATTERNS], AMOUNT_FIRST_CHARS)
+
+# 个位数量词（如"3人"）不作为数值实体
+SINGLE_DIGIT_QUANTITY = re.compile(r'^[1-9]\s*[人位名个只条头支把件套台辆架艘座栋家户所处项笔批次届倍股]$')
 
 
 def recognize_amount_entities(content):
     """识别数值金额实体"""
-    entities = []
-    CN_NUM = '[零一二三四五六七八九十百千万亿两]+'
-    
-    amount_patterns = [
-        (r'[¥￥$€£]\s*\d+(?:[,，]\d{3})*(?:\.\d+)?(?:万|亿)?元?', 'money'),
-        (r'\d+(?:[,，]\d{3})*(?:\.\d+)?(?:万亿|千亿|百亿|十亿|亿|千万|百万|十万|万|千)?(?:多|余|来|左右)?\s*(?:元|美元|美金|欧元|英镑|日元|港币|人民币)', 'money'),
-        (rf'{CN_NUM}(?:多|余|来|左右)?\s*(?:元|块钱|块|美元|欧元|英镑|日元|港币|人民币)', 'money'),
-        (r'\d+(?:\.\d+)?[%％]', 'percent'),
-        (r'百分之' + CN_NUM, 'percent'),
-        (r'\d{2,}(?:\.\d+)?(?:万|千|百)?(?:多|余|来)?\s*(?:亩|公顷|平方米|平方公里|平米|㎡)', 'area'),
-        (rf'{CN_NUM}(?:多|余|来)?\s*(?:亩|公顷|平方米|平方公里|平米)', 'area'),
-        (r'\d+(?:\.\d+)?(?:万亿|亿|万|千|百)?(?:多|余)?\s*(?:桶|升|毫升|立方米|加仑|吨)', 'volume'),
-        (rf'{CN_NUM}(?:多|余)?\s*(?:桶|升|毫升|立方米|加仑|吨)', 'volume'),
-        (r'\d+(?:\.\d+)?(?:万|千|百)?(?:多|余)?\s*(?:吨|千克|公斤|斤|克|kg|g)', 'weight'),
-        (r'\d+(?:\.\d+)?(?:万|千|百)?(?:多|余)?\s*(?:千米|公里|米|厘米|毫米|km|m)', 'length'),
-        (r'\d{2,}(?:\.\d+)?(?:多|余|来|几)?\s*(?:人|位|名|个|只|条|头|支|把|件|套|台|辆|架|艘|座|栋|家|户|所|处|项|笔|批|次|届|倍|股)', 'quantity'),
-        (r'\d+(?:万|千|百)(?:多|余|来|几)?\s*(?:人|位|名|个|只|条|头|支|把|件|套|台|辆|架|艘|座|栋|家|户|所|处|项|笔|批|次|届|倍|股)', 'quantity'),
-        (rf'{CN_NUM}(?:多|余|来|几)?\s*(?:人|位|名|个|件|套|台|辆|架|艘|座|栋|家|户|所|处|项|笔|批|次|届|倍|股)', 'quantity'),
-    ]
+    candidates = []
     
-    for pattern, amt_type in amount_patterns:
-        try:
-            for match in re.finditer(pattern, content):
-                text = match.group().strip()
-                start = match.start()
-                end = match.end()
-                
-                if amt_type == 'quantity':
-                    if re.match(r'^[1-9]\s*[人位名个只条头支把件套台辆架艘座栋家户所处项笔批次届倍股]$', text):
-                        continue
-                
-                overlap = False
-                to_remove = None
-                for e in entities:
-                    if not (end <= e['start_pos'] or start >= e['end_pos']):
-                        if len(text) > len(e['text']):
-                            to_remove = e
-                        else:
-                            overlap = True
-                        break
-                
-                if to_remove:
-                    entities.remove(to_remove)
-                
-                if not overlap and len(text) >= 2:
-                    entities.append({
-                        'text': text,
-                        'label': '数值金额',
-                        'start_pos': start,
-                        'end_pos': end
-                    })
-        except re.error:
+    for k, start, end, text in scan_candidates(AMOUNT_SCANNER, len(AMOUNT_PATTERNS), content):
+        text = text.strip()
+        if AMOUNT_PATTERNS[k][1] == 'quantity' and SINGLE_DIGIT_QUANTITY.match(text):
             continue
+        candidates.append((start, end, text))
     
-    return sorted(entities, key=lambda x: x['start_pos'])
+    return resolve_longest_candidates(candidates, '数值金额')
+
+
+# 已知公众人物（高置信度）
+KNOWN_PERSONS = [
+    '习近平', '李强', '赵乐际', '王沪宁', '蔡奇', '丁薛祥', '李希',
+    '卢拉', '特朗普', '拜登', '普京', '马克龙', '岸田文雄', '莫迪',
+    '马斯克', '比尔盖茨', '扎克伯格', '贝索斯', '马云', '马化腾',
+    '任正非', '雷军', '刘强东', '李彦宏', '张一鸣',
+]
 
 
-def recognize_person_entities(content):
+def recognize_person_entities(content, whitelist_hits=None):
     """识别人名实体"""
-    entities = []
+    entities = SpanSet()
+    if whitelist_hits is None:
+        whitelist_hits = find_whitelist_matches(content)
     
     # 1. 法律文书中的"某"字人名
     pattern_mou = r'[' + SURNAMES + r']某\d*'
@@ -440,7 +462,7 @@ def recognize_person_entities(content):
         text = match.group()
         start = match.start()
         end = match.end()
-        entities.append({
+        entities.add({
             'text': text,
             'label': '人名',
             'start_pos': start,
@@ -448,25 +470,13 @@ def recognize_person_entities(content):
         })
     
     # 2. 已知公众人物（高置信度）
-    known_persons = [
-        '习近平', '李强', '赵乐际', '王沪宁', '蔡奇', '丁薛祥', '李希',
-        '卢拉', '特朗普', '拜登', '普京', '马克龙', '岸田文雄', '莫迪',
-        '马斯克', '比尔盖茨', '扎克伯格', '贝索斯', '马云', '马化腾',
-        '任正非', '雷军', '刘强东', '李彦宏', '张一鸣',
-    ]
-    for person in known_persons:
-        for match in re.finditer(re.escape(person), content):
-            overlap, _ = check_overlap({
-                'start_pos': match.start(),
-                'end_pos': match.end()
-            }, entities)
-            if not overlap:
-                entities.append({
-                    'text': person,
-                    'label': '人名',
-                    'start_pos': match.start(),
-                    'end_pos': match.end()
-                })
+    for start, end, person in whitelist_hits['人名']:
+        entities.add_if_no_overlap({
+            'text': person,
+            'label': '人名',
+            'start_pos': start,
+            'end_pos': end
+        })
     
     # 3. 姓+两个字的名（需要上下文验证）
     pattern_3char = r'[' + SURNAMES + r'][' + NAME_CHARS + r']{2}'
@@ -478,16 +488,14 @@ def recognize_person_entities(content):
         if text in EXCLUDE_NAMES:
             continue
         
-        overlap, _ = check_overlap({'start_pos': start, 'end_pos': end}, entities)
-        
-        if not overlap:
+        if not entities.overlaps(start, end):
             # 检查边界
             if start > 0 and content[start-1] in NAME_CHARS:
                 continue
             if end < len(content) and content[end] in NAME_CHARS:
                 continue
             
-            entities.append({
+            entities.add({
                 'text': text,
                 'label': '人名',
                 'start_pos': start,
@@ -512,9 +520,7 @@ def recognize_person_entities(content):
         if text in EXCLUDE_NAMES:
             continue
         
-        overlap, _ = check_overlap({'start_pos': start, 'end_pos': end}, entities)
-        
-        if overlap:
+        if entities.overlaps(start, end):
             continue
         
         if start > 0 and content[start-1] in NAME_CHARS + SURNAMES:
@@ -537,14 +543,14 @@ def recognize_person_entities(content):
                 break
         
         if has_indicator:
-            entities.append({
+            entities.add({
                 'text': text,
                 'label': '人名',
                 'start_pos': start,
                 'end_pos': end
             })
     
-    return sorted(entities, key=lambda x: x['start_pos'])
+    return entities.to_list()
 
 
 # ========== 地名识别（严格模式）==========
@@ -608,50 +614,41 @@ LOCATION_EXCLUDE = {
 LOCATION_SUFFIXES = {'省', '市', '县', '区', '镇', '乡', '村', '街道'}
 
 
-def recognize_location_entities(content):
+def recognize_location_entities(content, whitelist_hits=None):
     """识别地名实体（严格模式）"""
-    entities = []
+    entities = SpanSet()
+    if whitelist_hits is None:
+        whitelist_hits = find_whitelist_matches(content)
     
     # 1. 只匹配已知地名白名单
-    for loc in KNOWN_LOCATIONS:
-        if loc in LOCATION_EXCLUDE:
-            continue
-        for match in re.finditer(re.escape(loc), content):
-            start = match.start()
-            end = match.end()
+    for start, end, loc in whitelist_hits['地名']:
+        # 检查是否已被更长的实体覆盖
+        if not entities.overlaps(start, end):
+            # 检查边界：确保不是更长词语的一部分
+            if start > 0:
+                char_before = content[start - 1]
+                # 如果前面是中文字符，检查是否构成其他词
+                if '\u4e00' <= char_before <= '\u9fff':
+                    # 允许的前缀
+                    allowed_prefix = {'在', '到', '去', '来', '从', '经', '由', '往', '赴', '回', '离'}
+                    if char_before not in allowed_prefix:
+                        # 检查前两个字是否构成排除词
+                        prefix_word = content[max(0, start-2):end]
+                        if prefix_word in LOCATION_EXCLUDE:
+                            continue
             
-            # 检查是否已被更长的实体覆盖
-            overlap, existing = check_overlap({
+            if end < len(content):
+                char_after = content[end]
+                # 如果后面紧跟地名后缀，说明当前匹配不完整
+                if char_after in LOCATION_SUFFIXES:
+                    continue
+            
+            entities.add({
+                'text': loc,
+                'label': '地名',
                 'start_pos': start,
                 'end_pos': end
-            }, entities)
-            
-            if not overlap:
-                # 检查边界：确保不是更长词语的一部分
-                if start > 0:
-                    char_before = content[start - 1]
-                    # 如果前面是中文字符，检查是否构成其他词
-                    if '\u4e00' <= char_before <= '\u9fff':
-                        # 允许的前缀
-                        allowed_prefix = {'在', '到', '去', '来', '从', '经', '由', '往', '赴', '回', '离'}
-                        if char_before not in allowed_prefix:
-                            # 检查前两个字是否构成排除词
-                            prefix_word = content[max(0, start-2):end]
-                            if prefix_word in LOCATION_EXCLUDE:
-                                continue
-                
-                if end < len(content):
-                    char_after = content[end]
-                    # 如果后面紧跟地名后缀，说明当前匹配不完整
-                    if char_after in LOCATION_SUFFIXES:
-                        continue
-                
-                entities.append({
-                    'text': loc,
-                    'label': '地名',
-                    'start_pos': start,
-                    'end_pos': end
-                })
+            })
     
     # 2. 匹配带有明确后缀的完整地名（如 XX省、XX市）
     # 只匹配那些前面有明确边界的
@@ -682,32 +679,17 @@ def recognize_location_entities(content):
                 if any(c in text for c in invalid_chars):
                     continue
                 
-                overlap, existing = check_overlap({
+                # 如果新实体更长，替换旧的
+                entities.replace_if_longer({
+                    'text': text,
+                    'label': '地名',
                     'start_pos': start,
                     'end_pos': end
-                }, entities)
-                
-                if overlap:
-                    # 如果新实体更长，替换旧的
-                    if existing and len(text) > len(existing['text']):
-                        entities.remove(existing)
-                        entities.append({
-                            'text': text,
-                            'label': '地名',
-                            'start_pos': start,
-                            'end_pos': end
-                        })
-                else:
-                    entities.append({
-                        'text': text,
-                        'label': '地名',
-                        'start_pos': start,
-                        'end_pos': end
-                    })
+                })
         except re.error:
             continue
     
-    return sorted(entities, key=lambda x: x['start_pos'])
+    return entities.to_list()
 
 
 # ========== 组织机构识别（严格模式）==========
@@ -782,6 +764,42 @@ ORG_VALID_PREFIXES = {
 }
 
 
+# ========== 白名单匹配 ==========
+
+def whitelist_order(words):
+    """白名单词条的匹配顺序：长词优先，同长按字典序（与集合的哈希顺序无关）"""
+    return sorted(words, key=lambda w: (-len(w), w))
+
+
+def build_whitelist_matcher():
+    """将内置的人名、地名、机构白名单编译为一个共享的多模式匹配自动机"""
+    matcher = AhoCorasick()
+    for person in KNOWN_PERSONS:
+        matcher.add(person, ('人名', person))
+    for loc in whitelist_order(KNOWN_LOCATIONS - LOCATION_EXCLUDE):
+        matcher.add(loc, ('地名', loc))
+    for org in whitelist_order(KNOWN_ORGANIZATIONS):
+        matcher.add(org, ('组织机构', org))
+    return matcher.build()
+
+
+# 导入时编译一次，所有请求共享
+WHITELIST_MATCHER = build_whitelist_matcher()
+LOCATION_PREFIX_TRIE = PrefixTrie(KNOWN_LOCATIONS)
+
+
+def find_whitelist_matches(content):
+    """
+    一次扫描找出所有白名单词条
+    返回 {类别: [(start, end, text), ...]}，类别内按 (词条顺序, 起始位置) 排列
+    """
+    hits = {'人名': [], '地名': [], '组织机构': []}
+    for start, end, index in WHITELIST_MATCHER.find_all(content):
+        label, text = WHITELIST_MATCHER.payload(index)
+        hits[label].append((start, end, text))
+    return hits
+
+
 def is_valid_org_name(text, content, start):
     """验证是否是有效的机构名"""
     # 长度检查
@@ -825,12 +843,7 @@ def is_valid_org_name(text, content, start):
             # 如果前面不是允许的前缀，也不是标点，则拒绝
             if prefix_1 not in allowed_prefix and prefix_1 not in PUNCTUATION_SET:
                 # 检查是否是地名前缀的一部分
-                is_location_prefix = False
-                for loc in KNOWN_LOCATIONS:
-                    if text.startswith(loc):
-                        is_location_prefix = True
-                        break
-                if not is_location_prefix:
+                if not LOCATION_PREFIX_TRIE.has_prefix(text):
                     # 再检查前两个字是否构成有效前缀
                     if prefix_2 not in ORG_VALID_PREFIXES:
                         return False
@@ -838,28 +851,20 @@ def is_valid_org_name(text, content, start):
     return True
 
 
-def recognize_organization_entities(content):
+def recognize_organization_entities(content, whitelist_hits=None):
     """识别组织机构实体（严格模式）"""
-    entities = []
+    entities = SpanSet()
+    if whitelist_hits is None:
+        whitelist_hits = find_whitelist_matches(content)
     
     # 1. 只匹配已知机构白名单
-    for org in KNOWN_ORGANIZATIONS:
-        for match in re.finditer(re.escape(org), content):
-            start = match.start()
-            end = match.end()
-            
-            overlap, _ = check_overlap({
-                'start_pos': start,
-                'end_pos': end
-            }, entities)
-            
-            if not overlap:
-                entities.append({
-                    'text': org,
-                    'label': '组织机构',
-                    'start_pos': start,
-                    'end_pos': end
-                })
+    for start, end, org in whitelist_hits['组织机构']:
+        entities.add_if_no_overlap({
+            'text': org,
+            'label': '组织机构',
+            'start_pos': start,
+            'end_pos': end
+        })
     
     # 2. 严格的模式匹配（只匹配高置信度的）
     # 要求前面必须是标点、空格或特定动词
@@ -894,27 +899,12 @@ def recognize_organization_entities(content):
                 if text in ORG_EXCLUDE:
                     continue
                 
-                overlap, existing = check_overlap({
+                entities.replace_if_longer({
+                    'text': text,
+                    'label': '组织机构',
                     'start_pos': start,
                     'end_pos': end
-                }, entities)
-                
-                if overlap:
-                    if existing and len(text) > len(existing['text']):
-                        entities.remove(existing)
-                        entities.append({
-                            'text': text,
-                            'label': '组织机构',
-                            'start_pos': start,
-                            'end_pos': end
-                        })
-                else:
-                    entities.append({
-                        'text': text,
-                        'label': '组织机构',
-                        'start_pos': start,
-                        'end_pos': end
-                    })
+                })
         except re.error:
             continue
     
@@ -936,66 +926,68 @@ def recognize_organization_entities(content):
             if text.startswith(('这', '那', '某', '该', '本', '一家', '一个')):
                 continue
             
-            overlap, existing = check_overlap({
+            entities.add_if_no_overlap({
+                'text': text,
+                'label': '组织机构',
                 'start_pos': start,
                 'end_pos': end
-            }, entities)
-            
-            if not overlap:
-                entities.append({
-                    'text': text,
-                    'label': '组织机构',
-                    'start_pos': start,
-                    'end_pos': end
-                })
+            })
     except re.error:
         pass
     
-    return sorted(entities, key=lambda x: x['start_pos'])
+    return entities.to_list()
+
+
+# 短知识库实体的不良前缀
+KNOWLEDGE_BAD_PREFIXES = {'这', '那', '某', '该', '本', '个', '家', '所'}
 
 
-def recognize_entities_from_knowledge(content):
+def build_knowledge_matcher(knowledge_entities):
+    """由知识库实体 [(text, label), ...] 构建多模式匹配自动机，载荷为 (text, label)"""
+    return AhoCorasick((text, (text, label)) for text, label in knowledge_entities)
+
+
+def recognize_entities_from_knowledge(content, matcher=None):
     """从知识库匹配实体（高优先级）"""
     entities = []
     
     try:
-        from app.models import KnowledgeEntity
-        knowledge_entities = KnowledgeEntity.query.all()
+        if matcher is None:
+            # 进程级缓存，知识库版本变化时才重建
+            from app.knowledge_cache import knowledge_cache
+            matcher = knowledge_cache.get_matcher()
         
-        for ke in knowledge_entities:
-            # 知识库中的实体是可信的，直接匹配
-            for match in re.finditer(re.escape(ke.text), content):
-                start = match.start()
-                end = match.end()
-                
-                # 简单的边界检查
-                # 检查前面是否是中文字符（可能是词语的一部分）
-                if start > 0:
-                    char_before = content[start - 1]
-                    if '\u4e00' <= char_before <= '\u9fff':
-                        # 如果知识库实体较短（2-3字），需要更严格的边界检查
-                        if len(ke.text) <= 3:
-                            # 检查是否有不良前缀
-                            bad_prefixes = {'这', '那', '某', '该', '本', '个', '家', '所'}
-                            if char_before in bad_prefixes:
-                                continue
-                
-                # 检查后面
-                if end < len(content):
-                    char_after = content[end]
-                    # 如果后面还是中文，可能不是完整的实体
-                    if '\u4e00' <= char_after <= '\u9fff':
-                        # 对于人名，检查是否后面跟着名字常用字
-                        if ke.label == '人名' and char_after in NAME_CHARS:
+        # 一次扫描找出所有知识库实体，结果按知识库顺序排列
+        for start, end, index in matcher.find_all(content):
+            text, label = matcher.payload(index)
+            
+            # 简单的边界检查
+            # 检查前面是否是中文字符（可能是词语的一部分）
+            if start > 0:
+                char_before = content[start - 1]
+                if '\u4e00' <= char_before <= '\u9fff':
+                    # 如果知识库实体较短（2-3字），需要更严格的边界检查
+                    if len(text) <= 3:
+                        # 检查是否有不良前缀
+                        if char_before in KNOWLEDGE_BAD_PREFIXES:
                             continue
-                
-                entities.append({
-                    'text': ke.text,
-                    'label': ke.label,
-                    'start_pos': start,
-                    'end_pos': end,
-                    'from_knowledge': True
-                })
+            
+            # 检查后面
+            if end < len(content):
+                char_after = content[end]
+                # 如果后面还是中文，可能不是完整的实体
+                if '\u4e00' <= char_after <= '\u9fff':
+                    # 对于人名，检查是否后面跟着名字常用字
+                    if label == '人名' and char_after in NAME_CHARS:
+                        continue
+            
+            entities.append({
+                'text': text,
+                'label': label,
+                'start_pos': start,
+                'end_pos': end,
+                'from_knowledge': True
+            })
     except Exception:
         # 知识库不可用时静默失败
         pass
@@ -1034,7 +1026,7 @@ def merge_overlapping_entities(entities):
     return merged
 
 
-def recognize_entities(content):
+def recognize_entities(content, knowledge_matcher=None):
     """
     综合实体识别（严格模式）
     
@@ -1045,48 +1037,116 @@ def recognize_entities(content):
     4. 人名识别（需要上下文验证）
     5. 地名识别（严格白名单模式）
     6. 组织机构识别（严格白名单+模式验证）
+    
+    knowledge_matcher: 知识库匹配自动机，为空时使用进程级知识库缓存
     """
     if not content:
         return []
     
-    all_entities = []
+    all_entities = SpanSet()
     
     # 1. 知识库匹配（最高优先级，用户验证过的实体）
-    knowledge_entities = recognize_entities_from_knowledge(content)
+    knowledge_entities = recognize_entities_from_knowledge(content, knowledge_matcher)
     for e in knowledge_entities:
-        add_entity_if_no_overlap(e, all_entities)
+        all_entities.add_if_no_overlap(e)
     
     # 2. 时间日期识别（误识别率低）
     time_entities = recognize_time_entities(content)
     for e in time_entities:
-        add_entity_if_no_overlap(e, all_entities)
+        all_entities.add_if_no_overlap(e)
     
     # 3. 数值金额识别（误识别率低）
     amount_entities = recognize_amount_entities(content)
     for e in amount_entities:
-        add_entity_if_no_overlap(e, all_entities)
+        all_entities.add_if_no_overlap(e)
+    
+    # 人名、地名、机构白名单一次扫描，三个识别器共用
+    whitelist_hits = find_whitelist_matches(content)
     
     # 4. 人名识别
-    person_entities = recognize_person_entities(content)
+    person_entities = recognize_person_entities(content, whitelist_hits)
     for e in person_entities:
-        add_entity_if_no_overlap(e, all_entities)
+        all_entities.add_if_no_overlap(e)
     
     # 5. 地名识别（严格白名单模式）
-    location_entities = recognize_location_entities(content)
+    location_entities = recognize_location_entities(content, whitelist_hits)
     for e in location_entities:
-        add_entity_if_no_overlap(e, all_entities)
+        all_entities.add_if_no_overlap(e)
     
     # 6. 组织机构识别（严格模式）
-    org_entities = recognize_organization_entities(content)
+    org_entities = recognize_organization_entities(content, whitelist_hits)
     for e in org_entities:
-        add_entity_if_no_overlap(e, all_entities)
+        all_entities.add_if_no_overlap(e)
     
     # 最终合并和排序
-    all_entities = merge_overlapping_entities(all_entities)
+    all_entities = merge_overlapping_entities(all_entities.to_list())
     
     # 清理结果，移除 from_knowledge 标记（前端不需要）
     for e in all_entities:
         if 'from_knowledge' in e:
             del e['from_knowledge']
     
-    return sorted(all_entities, key=lambda x: x['start_pos'])
\ No newline at end of file
+    return sorted(all_entities, key=lambda x: x['start_pos'])
+
+
+# ========== 综合分析 ==========
+
+def build_word_annotations(segments, start_index=0):
+    """分词结果 -> 前端词语标注格式（临时ID从 start_index + 1 开始）"""
+    return [
+        {
+            'id': idx + 1,  # 临时ID，前端使用
+            'word_index': idx,
+            'word': seg.word,
+            'pos': seg.pos,
+            'pos_cn': seg.pos_cn,
+            'start_pos': seg.start_pos,
+            'end_pos': seg.end_pos
+        }
+        for idx, seg in enumerate(segments, start_index)
+    ]
+
+
+def build_entity_annotations(entities):
+    """实体识别结果 -> 前端实体标注格式"""
+    return [
+        {
+            'id': idx + 1,  # 临时ID，前端使用
+            'text': entity['text'],
+            'label': entity['label'],
+            'start_pos': entity['start_pos'],
+            'end_pos': entity['end_pos']
+        }
+        for idx, entity in enumerate(entities)
+    ]
+
+
+def analyze_content(content, knowledge_matcher=None, progress=None):
+    """
+    完整的智能标注分析（单进程）：文本分类、情感分析、分词、实体识别
+    返回 {'text_annotation', 'word_annotations', 'entity_annotations'}
+    
+    progress: 可选回调 progress(percent, stage)，在各阶段之间调用；
+              回调抛出异常即可中止分析（用于取消任务）
+    """
+    report = progress or (lambda percent, stage: None)
+    
+    report(0, '文本分类')
+    category = get_text_category(content)
+    report(5, '情感分析')
+    sentiment, sentiment_score = get_sentiment(content)
+    report(30, '分词')
+    word_annotations = build_word_annotations(iter_segments(content))
+    report(60, '实体识别')
+    entity_annotations = build_entity_annotations(recognize_entities(content, knowledge_matcher))
+    report(100, '完成')
+    
+    return {
+        'text_annotation': {
+            'text_category': category,
+            'text_sentiment': sentiment,
+            'sentiment_score': sentiment_score
+        },
+        'word_annotations': word_annotations,
+        'entity_annotations': entity_annotations
+    }
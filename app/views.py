@@ -1,81 +1,72 @@
 # app/views.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
 from werkzeug.utils import secure_filename
 from app import db
-from app.models import TextFile, TextAnnotation, WordAnnotation, EntityAnnotation, KnowledgeEntity, FileStatus
-from sqlalchemy import func
-from datetime import datetime
+from app.models import TextFile, TextAnnotation, EntityAnnotation, FileStatus
+from app.annotation_store import get_revision
+from app.token_store import load_word_annotations
+from app.content_store import create_text_file, get_content, get_summaries
+from app.stats_store import get_stats_summary
+from app.file_list import list_files, FILE_STATUSES
+from app.knowledge_search import list_entities, count_entities
+from app.text_decoding import decode_upload
+from app.ingest import safe_filename, import_csv_tasks, csv_task_options
 import os
-import re
 import csv
 import io
-import chardet
 
 views_bp = Blueprint('views', __name__)
 
 
-def safe_filename(filename):
-    """安全处理文件名，保留中文"""
-    # 移除路径分隔符和空字符
-    filename = filename.replace('/', '_').replace('\\', '_').replace('\x00', '')
-    # 移除其他危险字符但保留中文、字母、数字、下划线、点、横线
-    filename = re.sub(r'[<>:"|?*]', '_', filename)
-    # 确保文件名不为空
-    if not filename or filename.strip() == '' or filename in ['.txt', '.csv']:
-        filename = f'未命名_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
-    return filename.strip()
+def read_upload(file):
+    """识别编码并解码上传的文件，返回 (正文, 编码信息)"""
+    return decode_upload(file.stream, current_app.config['UPLOAD_ENCODING_SAMPLE_BYTES'])
 
 
-def detect_file_encoding(file_bytes):
-    """检测文件编码"""
-    result = chardet.detect(file_bytes)
-    encoding = result['encoding']
-    confidence = result['confidence']
-    
-    # 如果置信度太低，使用默认编码
-    if confidence < 0.5:
-        encoding = 'utf-8'
-    
-    # 处理一些常见编码别名
-    encoding_map = {
-        'GB2312': 'gbk',
-        'ISO-8859-1': 'latin-1',
-        'Windows-1252': 'latin-1'
-    }
-    
-    return encoding_map.get(encoding, encoding).lower()
+def describe_encoding(info):
+    if info['method'] == 'utf-8':
+        return '编码: utf-8'
+    if info['method'] == 'fallback':
+        return '编码无法识别，按 utf-8 解码'
+    if info['method'] == 'guessed':
+        return f'编码: {info["encoding"]}（推测）'
+    return f'编码: {info["encoding"]}，置信度 {info["confidence"]:.0%}'
 
 
 @views_bp.route('/')
 def index():
-    """首页 - 文件列表"""
-    page = request.args.get('page', 1, type=int)
+    """首页 - 文件列表（按上传时间倒序游标分页，可按状态筛选）"""
     per_page = 10
-    
-    pagination = TextFile.query.order_by(TextFile.upload_time.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-    
-    files = pagination.items
-    
-    # 统计信息
-    total_files = TextFile.query.count()
-    pending_files = TextFile.query.filter_by(status=FileStatus.PENDING).count()
-    processing_files = TextFile.query.filter_by(status=FileStatus.PROCESSING).count()
-    completed_files = TextFile.query.filter_by(status=FileStatus.COMPLETED).count()
-    
-    stats = {
-        'total': total_files,
-        'pending': pending_files,
-        'processing': processing_files,
-        'completed': completed_files
-    }
+    status = request.args.get('status') or None
+    if status not in FILE_STATUSES:
+        status = None
+    
+    try:
+        page = list_files(
+            status=status,
+            after=request.args.get('cursor') or None,
+            before=request.args.get('before') or None,
+            limit=per_page
+        )
+    except ValueError:
+        # 游标无效时回到第一页
+        page = list_files(status=status, limit=per_page)
+    
+    files = page['files']
+    summaries = get_summaries(f.id for f in files)
+    
+    # 统计信息（各状态文件数，读取统计计数器）
+    status_counts = get_stats_summary()['status_counts']
+    stats = {'total': sum(status_counts.values()), **status_counts}
     
     return render_template('index.html', 
                          files=files, 
-                         pagination=pagination,
+                         summaries=summaries,
+                         status_filter=status,
+                         next_cursor=page['next_cursor'],
+                         prev_cursor=page['prev_cursor'],
                          stats=stats,
-                         total=total_files)
+                         total=stats['total'])
 
 
 @views_bp.route('/upload', methods=['POST'])
@@ -94,27 +85,39 @@ def upload_file():
         filename = safe_filename(file.filename)
         
         try:
-            file_bytes = file.read()
-            encoding = detect_file_encoding(file_bytes)
-            content = file_bytes.decode(encoding, errors='ignore')
+            content, encoding_info = read_upload(file)
         except Exception as e:
             flash(f'文件解码失败: {str(e)}', 'error')
             return redirect(url_for('views.index'))
         
-        text_file = TextFile(filename=filename, content=content, status=FileStatus.PENDING)
-        db.session.add(text_file)
+        create_text_file(filename, content, status=FileStatus.PENDING)
         db.session.commit()
         
-        flash('文件上传成功', 'success')
+        flash(f'文件上传成功（{describe_encoding(encoding_info)}）', 'success')
+        return redirect(url_for('views.index'))
+    
+    if file and file.filename.endswith('.csv') and request.form.get('csv_mode') == 'rows':
+        # 每行（或每 N 行）一个任务，批量插入
+        filename = safe_filename(file.filename)
+        
+        try:
+            file_content, encoding_info = read_upload(file)
+            imported = import_csv_tasks(file_content, filename, **csv_task_options(request.form))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            flash(f'CSV文件导入失败: {str(e)}', 'error')
+            return redirect(url_for('views.index'))
+        
+        flash(f'CSV文件导入成功（{describe_encoding(encoding_info)}），'
+              f'共{imported["rows"]}行数据，创建{imported["tasks"]}个任务', 'success')
         return redirect(url_for('views.index'))
     
     if file and file.filename.endswith('.csv'):
         filename = safe_filename(file.filename)
         
         try:
-            file_bytes = file.read()
-            encoding = detect_file_encoding(file_bytes)
-            file_content = file_bytes.decode(encoding, errors='ignore')
+            file_content, encoding_info = read_upload(file)
             
             csv_reader = csv.reader(io.StringIO(file_content))
             rows = list(csv_reader)
@@ -129,11 +132,10 @@ def upload_file():
             
             content = '\n'.join(content_lines)
             
-            text_file = TextFile(filename=filename, content=content, status=FileStatus.PENDING)
-            db.session.add(text_file)
+            create_text_file(filename, content, status=FileStatus.PENDING)
             db.session.commit()
             
-            flash(f'CSV文件上传成功（编码: {encoding}），共{len(rows)}行数据', 'success')
+            flash(f'CSV文件上传成功（{describe_encoding(encoding_info)}），共{len(rows)}行数据', 'success')
             return redirect(url_for('views.index'))
         except Exception as e:
             flash(f'CSV文件解析失败: {str(e)}', 'error')
@@ -158,8 +160,7 @@ def manual_input():
     if not filename.endswith('.txt'):
         filename += '.txt'
     
-    text_file = TextFile(filename=filename, content=text_content, status=FileStatus.PENDING)
-    db.session.add(text_file)
+    create_text_file(filename, text_content, status=FileStatus.PENDING)
     db.session.commit()
     
     flash('任务创建成功', 'success')
@@ -170,36 +171,36 @@ def manual_input():
 def annotate(file_id):
     """标注页面"""
     file_data = TextFile.query.get_or_404(file_id)
+    content = get_content(file_id)
     text_ann = TextAnnotation.query.filter_by(file_id=file_id).first()
-    word_anns = WordAnnotation.query.filter_by(file_id=file_id).order_by(WordAnnotation.word_index).all()
+    word_anns = load_word_annotations(file_id, content)
     entity_anns = EntityAnnotation.query.filter_by(file_id=file_id).order_by(EntityAnnotation.start_pos).all()
     
     return render_template('annotate.html',
                          file=file_data,
+                         content=content,
                          text_ann=text_ann,
-                         word_anns=[w.to_dict() for w in word_anns],
-                         entity_anns=[e.to_dict() for e in entity_anns])
+                         word_anns=word_anns,
+                         entity_anns=[e.to_dict() for e in entity_anns],
+                         revision=get_revision(file_id))
 
 
 @views_bp.route('/stats')
 def statistics():
-    """数据统计页面"""
-    total_files = TextFile.query.count()
+    """数据统计页面（读取统计计数器）"""
+    summary = get_stats_summary()
+    total_files = summary['total_files']
     
     # 已标注任务数（进行中 + 已完成）
-    annotated_files = TextFile.query.filter(
-        TextFile.status.in_([FileStatus.PROCESSING, FileStatus.COMPLETED])
-    ).count()
+    annotated_files = (summary['status_counts'][FileStatus.PROCESSING.value]
+                       + summary['status_counts'][FileStatus.COMPLETED.value])
     
-    total_anns = EntityAnnotation.query.count()
+    total_anns = summary['total_entities']
     
     # 平均标注数的分母改为已标注任务数
     avg_anns = round(total_anns / annotated_files, 1) if annotated_files > 0 else 0
     
-    entity_distribution = db.session.query(
-        EntityAnnotation.label,
-        func.count(EntityAnnotation.id)
-    ).group_by(EntityAnnotation.label).all()
+    entity_distribution = sorted(summary['entity_distribution'].items())
     
     labels = [item[0] for item in entity_distribution]
     counts = [item[1] for item in entity_distribution]
@@ -216,26 +217,18 @@ def statistics():
 
 @views_bp.route('/knowledge_base')
 def knowledge():
-    """知识库管理页面"""
+    """知识库管理页面（第一页实体，其余通过 /api/knowledge/entities 按需加载）"""
+    per_page = 60
     search = request.args.get('search', '').strip()
     label_filter = request.args.get('label', '').strip()
     
-    query = KnowledgeEntity.query
-    
-    if search:
-        query = query.filter(KnowledgeEntity.text.like(f'%{search}%'))
-    
-    if label_filter:
-        query = query.filter_by(label=label_filter)
-    
-    # 获取总数
-    total_entities = query.count()
-    
-    # 获取所有实体（不分页）
-    entities = query.order_by(KnowledgeEntity.frequency.desc()).all()
+    page = list_entities(search=search, label=label_filter or None, limit=per_page)
+    total_entities = count_entities(search=search, label=label_filter or None)
     
     return render_template('knowledge_base.html',
-                         entities=entities,
+                         entities=page['entities'],
+                         next_cursor=page['next_cursor'],
+                         page_size=per_page,
                          total=total_entities,
                          search=search,
                          label_filter=label_filter)
\ No newline at end of file
@@ -3,9 +3,28 @@
 文本标注系统 - 启动文件
 支持5种命名实体类型：人名、地名、组织机构、时间日期、数值金额
 """
+import io
 import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import chardet
+import click
 from app import create_app, db
 from app.models import TextFile, TextAnnotation, WordAnnotation, EntityAnnotation, KnowledgeEntity
+from app.knowledge_cache import bump_knowledge_version
+from app.content_store import create_text_file, get_content, get_content_hashes, release_unused_content, migrate_inline_contents
+from app.stats_store import track_annotation_counts, rebuild_counters, get_stats_summary
+from app.search_index import ensure_search_table, drop_search_table, rebuild_search_index as rebuild_search
+from app.annotation_store import save_annotations
+from app.token_store import migrate_word_storage as migrate_words
+from app.ingest import ingest_text_files
+from app.storage import storage_info as get_storage_info
+from app.text_decoding import decode_upload
+from app.utils import build_knowledge_matcher, recognize_entities_from_knowledge
 
 # 创建应用实例
 app = create_app()
@@ -24,10 +43,41 @@ def make_shell_context():
     }
 
 
+def delete_bench_files(file_ids):
+    """删除基准测试创建的文件：同步统计计数器并释放不再被引用的正文"""
+    hashes = get_content_hashes(file_ids)
+    for file_id in file_ids:
+        with track_annotation_counts(file_id):
+            db.session.delete(db.session.get(TextFile, file_id))
+    release_unused_content(hashes)
+    db.session.commit()
+
+
+@contextmanager
+def temp_bench_files(name, contents):
+    """为每份正文创建一个临时文件并提交，产出文件ID列表，结束时（包括出错时）删除"""
+    text_files = [
+        create_text_file(f'__bench_{name}_{i}__.txt', content)
+        for i, content in enumerate(contents)
+    ]
+    db.session.commit()
+    file_ids = [f.id for f in text_files]
+    try:
+        yield file_ids
+    finally:
+        db.session.rollback()
+        delete_bench_files(file_ids)
+
+
 @app.cli.command()
-def init_db():
+@click.option('--rebuild-search', 'rebuild_index', is_flag=True, help='同时清空并重建全文检索索引')
+def init_db(rebuild_index):
     """初始化数据库"""
     db.create_all()
+    ensure_search_table(db.engine)
+    if rebuild_index:
+        blobs, segments = rebuild_search()
+        print(f'已为 {blobs} 份正文建立 {segments} 个索引段')
     print('✅ 数据库初始化完成！')
 
 
@@ -35,8 +85,11 @@ def init_db():
 def reset_db():
     """重置数据库（危险操作）"""
     if input('⚠️  确定要重置数据库吗？所有数据将被删除！(yes/no): ').lower() == 'yes':
+        # FTS5 虚拟表不在模型中，drop_all 不会删除
+        drop_search_table(db.engine)
         db.drop_all()
         db.create_all()
+        ensure_search_table(db.engine)
         print('✅ 数据库已重置！')
     else:
         print('❌ 操作已取消')
@@ -70,6 +123,8 @@ def seed_knowledge():
             db.session.add(entity)
             added += 1
     
+    if added:
+        bump_knowledge_version()
     db.session.commit()
     print(f'✅ 已添加 {added} 个示例实体到知识库！')
 
@@ -77,9 +132,10 @@ def seed_knowledge():
 @app.cli.command()
 def show_stats():
     """显示系统统计信息"""
-    total_files = TextFile.query.count()
-    total_words = WordAnnotation.query.count()
-    total_entities = EntityAnnotation.query.count()
+    summary = get_stats_summary()
+    total_files = summary['total_files']
+    total_words = summary['total_words']
+    total_entities = summary['total_entities']
     total_knowledge = KnowledgeEntity.query.count()
     
     print('\n📊 系统统计信息')
@@ -89,13 +145,7 @@ def show_stats():
     print(f'实体标注总数: {total_entities}')
     print(f'知识库实体总数: {total_knowledge}')
     
-    from sqlalchemy import func
-    entity_stats = db.session.query(
-        EntityAnnotation.label,
-        func.count(EntityAnnotation.id)
-    ).group_by(
-        EntityAnnotation.label
-    ).all()
+    entity_stats = sorted(summary['entity_distribution'].items())
     
     if entity_stats:
         print('\n实体类型分布:')
@@ -105,6 +155,331 @@ def show_stats():
     print('=' * 50 + '\n')
 
 
+@app.cli.command()
+def rebuild_stats():
+    """从数据表重新统计统计计数器"""
+    t0 = time.perf_counter()
+    count = rebuild_counters()
+    db.session.commit()
+    print(f'✅ 已重新统计 {count} 个计数器，耗时 {time.perf_counter() - t0:.3f}s')
+
+
+@app.cli.command()
+@click.option('--entities', default=50000, help='知识库实体数量')
+@click.option('--size', default=200 * 1024, help='文档长度（字符）')
+def bench_knowledge(entities, size):
+    """知识库实体匹配基准测试：逐实体正则 vs AC 自动机"""
+    random.seed(42)
+    chars = [chr(c) for c in range(0x4e00, 0x4e00 + 3000)]
+    labels = ['人名', '地名', '组织机构', '时间日期', '数值金额']
+    
+    texts = set()
+    while len(texts) < entities:
+        texts.add(''.join(random.choices(chars, k=random.randint(2, 6))))
+    kb = [(t, random.choice(labels)) for t in texts]
+    
+    # 文档由随机字符和知识库实体拼接而成
+    parts, length = [], 0
+    while length < size:
+        piece = random.choice(kb)[0] if random.random() < 0.2 else ''.join(random.choices(chars, k=8))
+        parts.append(piece)
+        length += len(piece)
+    content = ''.join(parts)[:size]
+    
+    print(f'\n⏱️  知识库实体: {len(kb)}，文档长度: {len(content)}')
+    
+    # 旧实现：每个实体一次 re.finditer
+    t0 = time.perf_counter()
+    legacy_hits = 0
+    for text, _ in kb:
+        for _ in re.finditer(re.escape(text), content):
+            legacy_hits += 1
+    legacy_time = time.perf_counter() - t0
+    
+    t0 = time.perf_counter()
+    matcher = build_knowledge_matcher(kb)
+    build_time = time.perf_counter() - t0
+    
+    t0 = time.perf_counter()
+    ac_hits = len(matcher.find_all(content))
+    match_time = time.perf_counter() - t0
+    
+    t0 = time.perf_counter()
+    recognize_entities_from_knowledge(content, matcher=matcher)
+    recognize_time = time.perf_counter() - t0
+    
+    print('=' * 50)
+    print(f'逐实体正则扫描: {legacy_time:.3f}s（{legacy_hits} 个匹配）')
+    print(f'AC 自动机构建: {build_time:.3f}s')
+    print(f'AC 自动机扫描: {match_time:.3f}s（{ac_hits} 个匹配）')
+    print(f'知识库识别（含边界检查）: {recognize_time:.3f}s')
+    if match_time > 0:
+        print(f'扫描加速比: {legacy_time / match_time:.1f}x')
+    print('=' * 50 + '\n')
+
+
+@app.cli.command()
+@click.option('--tokens', default='1000,10000,100000', help='词语数量列表（逗号分隔）')
+def bench_save(tokens):
+    """标注保存基准测试：逐行 ORM 对象 vs 批量插入"""
+    counts = [int(n) for n in tokens.split(',') if n.strip()]
+    
+    def make_payload(n):
+        words = [
+            {'word': '测试', 'pos': 'n', 'pos_cn': '名词', 'start_pos': i * 2, 'end_pos': i * 2 + 2}
+            for i in range(n)
+        ]
+        entities = [
+            {'text': '测试', 'label': '人名', 'start_pos': i * 2, 'end_pos': i * 2 + 2}
+            for i in range(0, n, 20)
+        ]
+        return words, entities
+    
+    def legacy_save(file_id, words, entities):
+        with track_annotation_counts(file_id):
+            WordAnnotation.query.filter_by(file_id=file_id).delete()
+            EntityAnnotation.query.filter_by(file_id=file_id).delete()
+            for idx, word_data in enumerate(words):
+                db.session.add(WordAnnotation(file_id=file_id, word_index=idx, **word_data))
+            for entity_data in entities:
+                db.session.add(EntityAnnotation(file_id=file_id, **entity_data))
+        db.session.commit()
+    
+    def bulk_save(file_id, words, entities):
+        save_annotations(file_id, '', '', words, entities)
+        db.session.commit()
+    
+    print(f'\n⏱️  标注保存耗时（含提交，词语存储格式: {app.config["WORD_STORAGE"]}）')
+    print('=' * 60)
+    print(f'{"词语数":>10} {"逐行 ORM":>12} {"批量保存":>12} {"加速比":>8}')
+    # 临时文件，测试结束后删除
+    with temp_bench_files('save', ['测试' * max(counts)]) as (file_id,):
+        for n in counts:
+            words, entities = make_payload(n)
+            
+            t0 = time.perf_counter()
+            legacy_save(file_id, words, entities)
+            legacy_time = time.perf_counter() - t0
+            
+            t0 = time.perf_counter()
+            bulk_save(file_id, words, entities)
+            bulk_time = time.perf_counter() - t0
+            
+            speedup = legacy_time / bulk_time if bulk_time > 0 else 0
+            print(f'{n:>10} {legacy_time:>11.3f}s {bulk_time:>11.3f}s {speedup:>7.1f}x')
+    print('=' * 60 + '\n')
+
+
+@app.cli.command()
+@click.option('--to', 'target', type=click.Choice(['packed', 'rows']), default='packed', help='目标格式')
+@click.option('--batch-size', default=50, help='每批提交的文件数')
+def migrate_word_storage(target, batch_size):
+    """迁移词语标注存储格式（行存储 <-> 紧凑存储）"""
+    def table_bytes():
+        # dbstat 虚拟表不可用时无法统计大小
+        try:
+            return dict(db.session.execute(db.text(
+                "SELECT name, SUM(pgsize) FROM dbstat "
+                "WHERE name IN ('word_annotations', 'word_annotation_packs', 'idx_file_word') GROUP BY name"
+            )).all())
+        except Exception:
+            db.session.rollback()
+            return None
+    
+    before = table_bytes()
+    t0 = time.perf_counter()
+    files, words = migrate_words(target, batch_size)
+    elapsed = time.perf_counter() - t0
+    after = table_bytes()
+    
+    print(f'\n✅ 已迁移 {files} 个文件、{words} 个词语到 {target}，耗时 {elapsed:.2f}s')
+    if before is not None:
+        print(f'迁移前占用: {before}')
+        print(f'迁移后占用: {after}（删除的页需 VACUUM 后才会释放）')
+    print()
+
+
+@app.cli.command()
+@click.option('--batch-size', default=50, help='每批提交的文件数')
+def migrate_content_store(batch_size):
+    """把旧文件的正文移入内容存储（压缩、按哈希去重）"""
+    t0 = time.perf_counter()
+    files, blobs = migrate_inline_contents(batch_size)
+    print(f'\n✅ 已迁移 {files} 个文件的正文，新增 {blobs} 份正文（相同正文只存一份），'
+          f'耗时 {time.perf_counter() - t0:.2f}s\n')
+
+
+@app.cli.command()
+@click.option('--batch-size', default=50, help='每批提交的正文数')
+def rebuild_search_index(batch_size):
+    """重建全文检索索引（升级前已有的正文需执行一次）"""
+    def progress(done, total):
+        print(f'\r  已索引 {done}/{total} 份正文', end='', flush=True)
+    
+    t0 = time.perf_counter()
+    blobs, segments = rebuild_search(batch_size, progress)
+    print(f'\n✅ 已为 {blobs} 份正文建立 {segments} 个索引段，耗时 {time.perf_counter() - t0:.2f}s\n')
+
+
+@app.cli.command()
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--workers', type=int, default=None, help='解码并行数（默认使用配置 INGEST_WORKERS）')
+@click.option('--executor', type=click.Choice(['thread', 'process']), default=None, help='并行方式（默认使用配置 INGEST_EXECUTOR）')
+@click.option('--batch-size', default=1000, help='每批提交的文件数')
+def ingest_archive(path, workers, executor, batch_size):
+    """批量导入压缩包（zip / tar / tar.gz）或目录中的 .txt 文件"""
+    def progress(percent, stage):
+        print(f'  {percent:>3}%  {stage}')
+    
+    summary = ingest_text_files(
+        path,
+        workers=workers or app.config['INGEST_WORKERS'],
+        executor=executor or app.config['INGEST_EXECUTOR'],
+        sample_bytes=app.config['UPLOAD_ENCODING_SAMPLE_BYTES'],
+        batch_size=batch_size,
+        max_entry_bytes=app.config['INGEST_MAX_ENTRY_BYTES'],
+        progress=progress
+    )
+    
+    print(f'\n✅ 已导入 {summary["files"]} 个文件（跳过空文件 {summary["skipped"]} 个，{summary["batches"]} 批）')
+    if summary['oversized']:
+        print(f'   ⚠️ {summary["oversized"]} 个文件超过大小上限已跳过: {", ".join(summary["oversized_files"])}')
+    print(f'   {summary["bytes"] / 1024 / 1024:.1f}MB，{summary["chars"]} 字，'
+          f'耗时 {summary["elapsed"]:.2f}s，{summary["files_per_second"]} 文件/秒')
+    print(f'   编码: {", ".join(f"{name} {count}" for name, count in summary["encodings"].items())}\n')
+
+
+@app.cli.command()
+def storage_info():
+    """显示当前存储方案及实际生效的 SQLite 设置"""
+    print(f'\n💾 存储方案: {app.config["STORAGE_PROFILE"]}')
+    print('=' * 50)
+    for name, value in get_storage_info(db.engine).items():
+        print(f'{name}: {value}')
+    print('=' * 50 + '\n')
+
+
+@app.cli.command()
+@click.option('--readers', default=4, help='读线程数（打开标注页 + 智能标注）')
+@click.option('--writers', default=2, help='写线程数（保存标注）')
+@click.option('--duration', default=10.0, help='持续时间（秒）')
+@click.option('--file-id', default=None, type=int, help='样本文件ID（默认取第一个文件）')
+def bench_concurrency(readers, writers, duration, file_id):
+    """并发基准测试：多个读者与写者同时访问标注和保存接口"""
+    sample = db.session.get(TextFile, file_id) if file_id else TextFile.query.order_by(TextFile.id).first()
+    if sample is None:
+        print('❌ 没有可用的样本文件')
+        return
+    
+    sample_content = get_content(sample.id)
+    sample_id = sample.id
+    
+    result = app.test_client().post(f'/api/smart_annotate/{sample_id}').get_json()
+    payload = {
+        'word_annotations': result['word_annotations'],
+        'entity_annotations': result['entity_annotations']
+    }
+    
+    stats = {}
+    stats_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    
+    def record(op, elapsed, response):
+        with stats_lock:
+            item = stats.setdefault(op, {'latencies': [], 'errors': 0, 'messages': set()})
+            item['latencies'].append(elapsed)
+            if response.status_code != 200:
+                item['errors'] += 1
+                body = response.get_json(silent=True) or {}
+                item['messages'].add(str(body.get('message', response.status_code))[:80])
+    
+    def reader():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            response = client.get(f'/annotate/{sample_id}')
+            record('打开标注页', time.perf_counter() - t0, response)
+            
+            t0 = time.perf_counter()
+            response = client.post(f'/api/smart_annotate/{sample_id}')
+            record('智能标注', time.perf_counter() - t0, response)
+    
+    def writer(target_id):
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            response = client.post('/api/save_all_annotations', json={'file_id': target_id, **payload})
+            record('保存标注', time.perf_counter() - t0, response)
+    
+    print(f'\n⏱️  存储方案: {app.config["STORAGE_PROFILE"]}，读者 {readers}，写者 {writers}，'
+          f'{duration:.0f} 秒，样本 {len(sample_content)} 字 / {len(payload["word_annotations"])} 词')
+    # 每个写者保存到各自的临时文件（与样本共享正文），测试结束后删除
+    with temp_bench_files('concurrency', [sample_content] * writers) as temp_ids:
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads += [threading.Thread(target=writer, args=(target_id,)) for target_id in temp_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    
+    print('=' * 72)
+    print(f'{"操作":<8} {"次数":>6} {"每秒":>8} {"p50":>9} {"p95":>9} {"最大":>9} {"失败":>6}')
+    for op, item in stats.items():
+        latencies = sorted(item['latencies'])
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f'{op:<8} {len(latencies):>6} {len(latencies) / duration:>8.1f} '
+              f'{p50 * 1000:>7.1f}ms {p95 * 1000:>7.1f}ms {latencies[-1] * 1000:>7.1f}ms {item["errors"]:>6}')
+        for message in item['messages']:
+            print(f'    ⚠️  {message}')
+    print('=' * 72 + '\n')
+
+
+@app.cli.command()
+@click.option('--sizes', default='256,1024,4096', help='文件大小（KB），逗号分隔')
+def bench_upload(sizes):
+    """上传解码基准测试：整篇 chardet 检测 vs UTF-8 快速路径 + 开头采样检测"""
+    sample_content = get_content(TextFile.query.order_by(TextFile.id).first().id) if TextFile.count() else ''
+    sample_content = sample_content or '张三在北京大学工作，2024年5月1日发布了新的研究报告。\n'
+    client = app.test_client()
+    
+    def legacy_decode(data):
+        encoding = chardet.detect(data)['encoding'] or 'utf-8'
+        return data.decode({'GB2312': 'gbk'}.get(encoding, encoding), errors='ignore')
+    
+    print(f'\n⏱️  上传解码耗时（采样 {app.config["UPLOAD_ENCODING_SAMPLE_BYTES"] // 1024}KB）')
+    print('=' * 84)
+    print(f'{"编码":<8} {"大小":>8} {"整篇 chardet":>13} {"快速路径":>10} {"加速比":>8} {"上传请求":>10}  识别结果')
+    for size_kb in [int(n) for n in sizes.split(',') if n.strip()]:
+        text = (sample_content * (size_kb * 1024 // len(sample_content.encode('utf-8')) + 1))
+        for encoding in ('utf-8', 'gbk'):
+            data = text.encode(encoding, errors='ignore')[:size_kb * 1024]
+            data = data.decode(encoding, errors='ignore').encode(encoding)
+            
+            t0 = time.perf_counter()
+            legacy_decode(data)
+            legacy_time = time.perf_counter() - t0
+            
+            t0 = time.perf_counter()
+            content, info = decode_upload(io.BytesIO(data), app.config['UPLOAD_ENCODING_SAMPLE_BYTES'])
+            fast_time = time.perf_counter() - t0
+            assert content == data.decode(encoding)
+            
+            t0 = time.perf_counter()
+            client.post('/upload', data={'file': (io.BytesIO(data), '__bench_upload__.txt')},
+                        content_type='multipart/form-data')
+            upload_time = time.perf_counter() - t0
+            
+            delete_bench_files(list(db.session.scalars(
+                db.select(TextFile.id).where(TextFile.filename == '__bench_upload__.txt')
+            )))
+            
+            speedup = legacy_time / fast_time if fast_time > 0 else 0
+            print(f'{encoding:<8} {size_kb:>6}KB {legacy_time:>12.3f}s {fast_time:>9.3f}s {speedup:>7.1f}x '
+                  f'{upload_time:>9.3f}s  {info["encoding"]}（{info["method"]}，{info["confidence"]:.2f}）')
+    print('=' * 84 + '\n')
+
+
 if __name__ == '__main__':
     # 确保数据库已初始化
     with app.app_context():
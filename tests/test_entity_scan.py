@@ -0,0 +1,45 @@
+# tests/test_entity_scan.py
+"""
+时间、金额实体识别的黄金输出测试
+
+golden/entity_scan.json 中的期望结果由改为单次扫描（compile_scanner / scan_candidates /
+resolve_longest_candidates）之前的逐模式实现生成，语料包括 instance/annotation.db 中的
+示例文档、覆盖各类时间和金额写法的句子，以及由它们随机拼接的长文档。
+单次扫描的结果必须与之完全一致（实体、位置和顺序）。
+
+运行: python -m pytest tests  或  python -m unittest discover tests
+"""
+import json
+import os
+import unittest
+
+from app.utils import recognize_time_entities, recognize_amount_entities
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), 'golden', 'entity_scan.json')
+
+
+def load_cases():
+    with open(GOLDEN_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class EntityScanGoldenTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cases = load_cases()
+
+    def check(self, recognize, field):
+        for i, case in enumerate(self.cases):
+            with self.subTest(case=i, text=case['text'][:30]):
+                self.assertEqual(recognize(case['text']), case[field])
+
+    def test_time_entities(self):
+        self.check(recognize_time_entities, 'time')
+
+    def test_amount_entities(self):
+        self.check(recognize_amount_entities, 'amount')
+
+
+if __name__ == '__main__':
+    unittest.main()
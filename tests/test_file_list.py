@@ -0,0 +1,107 @@
+# tests/test_file_list.py
+"""
+文件列表游标分页测试（临时 SQLite 数据库）
+
+大量文件的 upload_time 相同时，按 next_cursor 向后翻页、再按 prev_cursor 向前翻页，
+每一行都必须恰好出现一次，顺序与 (upload_time, id) 倒序一致（含按状态筛选）。
+
+运行: python -m pytest tests  或  python -m unittest discover tests
+"""
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from app import create_app, db
+from app.config import TestingConfig
+from app.file_list import FILE_STATUSES, list_files
+from app.models import TextFile
+
+
+class FileListPaginationTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        uri = 'sqlite:///' + os.path.join(cls.tmpdir, 'file_list.db')
+        with mock.patch.object(TestingConfig, 'SQLALCHEMY_DATABASE_URI', uri):
+            cls.app = create_app('testing')
+        cls.ctx = cls.app.app_context()
+        cls.ctx.push()
+
+        # 只有 4 个不同的上传时间，同一时间的文件很多
+        rng = random.Random(20240504)
+        base = datetime(2024, 5, 1, 12, 0, 0)
+        db.session.add_all(
+            TextFile(
+                filename=f'f{i}.txt',
+                upload_time=base + timedelta(seconds=rng.randrange(4)),
+                status=rng.choice(FILE_STATUSES)
+            )
+            for i in range(137)
+        )
+        db.session.commit()
+        cls.rows = [(f.upload_time, f.id, f.status) for f in TextFile.query.all()]
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        db.engine.dispose()
+        cls.ctx.pop()
+        shutil.rmtree(cls.tmpdir, ignore_errors=True)
+
+    def expected_ids(self, status=None):
+        rows = [row for row in self.rows if status is None or row[2] == status]
+        return [file_id for _, file_id, _ in sorted(rows, reverse=True)]
+
+    def walk(self, status, limit):
+        """向后翻到最后一页，再从最后一页向前翻回第一页，返回两次得到的 id 序列"""
+        forward, pages = [], []
+        page = list_files(status=status, limit=limit)
+        while True:
+            pages.append(page)
+            forward.extend(f.id for f in page['files'])
+            if page['next_cursor'] is None:
+                break
+            page = list_files(status=status, after=page['next_cursor'], limit=limit)
+
+        backward = [f.id for f in pages[-1]['files']]
+        page = pages[-1]
+        while page['prev_cursor'] is not None:
+            page = list_files(status=status, before=page['prev_cursor'], limit=limit)
+            backward[:0] = [f.id for f in page['files']]
+        return forward, backward
+
+    def test_tied_upload_times(self):
+        for status in (None,) + FILE_STATUSES:
+            for limit in (1, 3, 10, 50, 200):
+                with self.subTest(status=status, limit=limit):
+                    expected = self.expected_ids(status)
+                    forward, backward = self.walk(status, limit)
+                    self.assertEqual(forward, expected)
+                    self.assertEqual(backward, expected)
+
+    def test_api_pages(self):
+        client = self.app.test_client()
+        ids, cursor = [], None
+        while True:
+            query = {'limit': 7, **({'cursor': cursor} if cursor else {})}
+            data = client.get('/api/files', query_string=query).get_json()
+            self.assertEqual(data['status'], 'success')
+            ids.extend(f['id'] for f in data['files'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(ids, self.expected_ids())
+
+    def test_invalid_arguments(self):
+        client = self.app.test_client()
+        self.assertEqual(client.get('/api/files?status=archived').status_code, 400)
+        self.assertEqual(client.get('/api/files?cursor=not-a-cursor').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
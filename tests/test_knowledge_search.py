@@ -0,0 +1,99 @@
+# tests/test_knowledge_search.py
+"""
+知识库检索与游标分页测试（临时 SQLite 数据库）
+
+大量实体的 frequency 相同时，按 next_cursor 翻页必须恰好覆盖每个符合条件的实体一次，
+顺序与 (frequency, id) 倒序一致；检索结果与逐个做不区分大小写的子串匹配一致。
+
+运行: python -m pytest tests  或  python -m unittest discover tests
+"""
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from app import create_app, db
+from app.config import TestingConfig
+from app.knowledge_search import count_entities, list_entities
+from app.models import KnowledgeEntity
+
+LABELS = ('PER', 'ORG', 'LOC')
+SEARCHES = ('', '北', '京', '北京', '大学', 'ab', 'A', '北京大学', '%', '不存在')
+
+
+class KnowledgePaginationTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        uri = 'sqlite:///' + os.path.join(cls.tmpdir, 'knowledge.db')
+        with mock.patch.object(TestingConfig, 'SQLALCHEMY_DATABASE_URI', uri):
+            cls.app = create_app('testing')
+        cls.ctx = cls.app.app_context()
+        cls.ctx.push()
+
+        # 频次只有 3 种取值，同频次的实体很多
+        rng = random.Random(20240505)
+        texts = set()
+        while len(texts) < 150:
+            texts.add(''.join(rng.choice('北京大学南aAb%') for _ in range(rng.randint(1, 5))))
+        db.session.add_all(
+            KnowledgeEntity(text=text, label=rng.choice(LABELS), frequency=rng.randint(1, 3))
+            for text in sorted(texts)
+        )
+        db.session.commit()
+        cls.rows = [(e.frequency, e.id, e.text, e.label) for e in KnowledgeEntity.query.all()]
+
+    @classmethod
+    def tearDownClass(cls):
+        db.session.remove()
+        db.engine.dispose()
+        cls.ctx.pop()
+        shutil.rmtree(cls.tmpdir, ignore_errors=True)
+
+    def expected_ids(self, search, label):
+        rows = [
+            row for row in self.rows
+            if search.lower() in row[2].lower() and (label is None or row[3] == label)
+        ]
+        return [entity_id for _, entity_id, _, _ in sorted(rows, reverse=True)]
+
+    def walk(self, search, label, limit):
+        ids, cursor = [], None
+        while True:
+            page = list_entities(search=search, label=label, after=cursor, limit=limit)
+            ids.extend(e.id for e in page['entities'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_tied_frequencies(self):
+        for search in SEARCHES:
+            for label in (None,) + LABELS:
+                expected = self.expected_ids(search, label)
+                self.assertEqual(count_entities(search=search, label=label), len(expected))
+                for limit in (1, 4, 60, 500):
+                    with self.subTest(search=search, label=label, limit=limit):
+                        self.assertEqual(self.walk(search, label, limit), expected)
+
+    def test_api_pages(self):
+        client = self.app.test_client()
+        ids, cursor = [], None
+        while True:
+            query = {'search': '北', 'limit': 5, **({'cursor': cursor} if cursor else {})}
+            data = client.get('/api/knowledge/entities', query_string=query).get_json()
+            self.assertEqual(data['status'], 'success')
+            if cursor is None:
+                self.assertEqual(data['total'], len(self.expected_ids('北', None)))
+            ids.extend(e['id'] for e in data['entities'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(ids, self.expected_ids('北', None))
+        self.assertEqual(client.get('/api/knowledge/entities?cursor=bad').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
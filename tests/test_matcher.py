@@ -0,0 +1,101 @@
+# tests/test_matcher.py
+"""
+多模式匹配（AhoCorasick / PrefixTrie）与朴素 str.find 逐词扫描的对比测试
+
+词条取自小字母表上的随机短串，互相重叠、嵌套（一个词条是另一个的前缀、后缀或中间部分）的情况很多，
+再加上知识库常见的中文嵌套词条。
+
+运行: python -m pytest tests  或  python -m unittest discover tests
+"""
+import random
+import unittest
+
+from app.matcher import AhoCorasick, PrefixTrie
+
+NESTED_WORDS = ['北京', '北京大学', '北京大学医学部', '大学', '学医', '医学', '医学部', '京大']
+NESTED_TEXTS = ['北京大学医学部', '我在北京大学读书，后来去了北京大学医学部学医学', '北京北京大学大学', '']
+
+
+def naive_all_matches(words, text):
+    """逐词逐位置 str.find，包括重叠出现"""
+    matches = set()
+    for index, word in enumerate(words):
+        start = text.find(word)
+        while start != -1:
+            matches.add((start, start + len(word), index))
+            start = text.find(word, start + 1)
+    return matches
+
+
+def naive_find_all(words, text):
+    """逐词 str.find，同一词条内部不重叠（与 re.finditer 一致）"""
+    matches = []
+    for index, word in enumerate(words):
+        start = text.find(word)
+        while start != -1:
+            matches.append((start, start + len(word), index))
+            start = text.find(word, start + len(word))
+    return matches
+
+
+def random_cases(count=200, seed=20240501):
+    rng = random.Random(seed)
+    for _ in range(count):
+        alphabet = 'ab' if rng.random() < 0.5 else 'abc'
+        words = sorted({
+            ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 5)))
+            for _ in range(rng.randint(1, 12))
+        })
+        rng.shuffle(words)
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 60)))
+        yield words, text
+
+
+def all_cases():
+    for text in NESTED_TEXTS:
+        yield NESTED_WORDS, text
+    yield from random_cases()
+
+
+class AhoCorasickTest(unittest.TestCase):
+
+    def test_iter_matches_equals_naive(self):
+        for i, (words, text) in enumerate(all_cases()):
+            with self.subTest(case=i, words=words, text=text):
+                automaton = AhoCorasick((word, None) for word in words)
+                matches = list(automaton.iter_matches(text))
+                self.assertEqual(len(matches), len(set(matches)))
+                self.assertEqual(set(matches), naive_all_matches(words, text))
+                # 按结束位置递增产出
+                self.assertEqual([m[1] for m in matches], sorted(m[1] for m in matches))
+
+    def test_find_all_equals_naive(self):
+        for i, (words, text) in enumerate(all_cases()):
+            with self.subTest(case=i, words=words, text=text):
+                automaton = AhoCorasick((word, None) for word in words)
+                self.assertEqual(automaton.find_all(text), naive_find_all(words, text))
+
+    def test_add_after_build(self):
+        automaton = AhoCorasick([('北京', 'LOC')])
+        self.assertEqual(automaton.add('北京大学', 'ORG'), 1)
+        self.assertIsNone(automaton.add(''))
+        self.assertEqual(automaton.find_all('北京大学'), [(0, 2, 0), (0, 4, 1)])
+        self.assertEqual([automaton.payload(i) for i in range(len(automaton))], ['LOC', 'ORG'])
+
+
+class PrefixTrieTest(unittest.TestCase):
+
+    def test_longest_prefix_equals_naive(self):
+        for i, (words, text) in enumerate(all_cases()):
+            with self.subTest(case=i, words=words, text=text):
+                trie = PrefixTrie(words)
+                self.assertEqual(len(trie), len(set(words)))
+                for offset in range(len(text) + 1):
+                    suffix = text[offset:]
+                    prefixes = [word for word in words if suffix.startswith(word)]
+                    self.assertEqual(trie.longest_prefix(suffix), max(prefixes, key=len, default=None), suffix)
+                    self.assertEqual(trie.has_prefix(suffix), bool(prefixes), suffix)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# tests/test_spans.py
+"""
+SpanSet 与线性扫描的对比测试
+
+随机加入、删除、按重叠条件加入/替换实体，每一步都用同样的操作维护一个按加入顺序排列的列表，
+重叠查询结果必须与逐个遍历该列表的结果一致（包括多个重叠实体时以最早加入的为准）。
+
+运行: python -m pytest tests  或  python -m unittest discover tests
+"""
+import random
+import unittest
+
+from app.spans import SpanSet
+
+
+def make_entity(rng, text_length=80, max_length=12):
+    start = rng.randrange(text_length)
+    end = min(text_length, start + rng.randint(1, max_length))
+    return {'text': 'x' * (end - start), 'start_pos': start, 'end_pos': end}
+
+
+def remove_identical(entities, entity):
+    """按对象删除（不同实体的字典可能相等）"""
+    del entities[next(i for i, e in enumerate(entities) if e is entity)]
+
+
+def linear_overlapping(entities, start, end):
+    return [e for e in entities if e['start_pos'] < end and e['end_pos'] > start]
+
+
+class SpanSetTest(unittest.TestCase):
+
+    def check_queries(self, spans, entities, rng):
+        self.assertEqual(len(spans), len(entities))
+        self.assertEqual(
+            [id(e) for e in spans],
+            [id(e) for e in sorted(entities, key=lambda e: e['start_pos'])]
+        )
+        for _ in range(20):
+            start = rng.randrange(85)
+            end = start + rng.randint(0, 15)
+            expected = linear_overlapping(entities, start, end)
+            self.assertEqual([id(e) for e in spans.overlapping(start, end)], [id(e) for e in expected])
+            first = spans.first_overlap(start, end)
+            self.assertIs(first, expected[0] if expected else None)
+            self.assertEqual(spans.overlaps(start, end), bool(expected))
+
+    def test_random_operations_equal_linear_scan(self):
+        rng = random.Random(20240502)
+        for case in range(100):
+            with self.subTest(case=case):
+                spans, entities = SpanSet(), []
+                for _ in range(rng.randint(0, 40)):
+                    entity = make_entity(rng)
+                    op = rng.random()
+                    if op < 0.3:
+                        spans.add(entity)
+                        entities.append(entity)
+                    elif op < 0.55:
+                        added = spans.add_if_no_overlap(entity)
+                        expected = not linear_overlapping(entities, entity['start_pos'], entity['end_pos'])
+                        self.assertEqual(added, expected)
+                        if expected:
+                            entities.append(entity)
+                    elif op < 0.85:
+                        overlapping = linear_overlapping(entities, entity['start_pos'], entity['end_pos'])
+                        existing = overlapping[0] if overlapping else None
+                        expected = existing is None or len(entity['text']) > len(existing['text'])
+                        self.assertEqual(spans.replace_if_longer(entity), expected)
+                        if expected:
+                            if existing is not None:
+                                remove_identical(entities, existing)
+                            entities.append(entity)
+                    elif entities:
+                        victim = rng.choice(entities)
+                        spans.remove(victim)
+                        remove_identical(entities, victim)
+                    self.check_queries(spans, entities, rng)
+
+    def test_init_keeps_order(self):
+        rng = random.Random(7)
+        entities = [make_entity(rng) for _ in range(30)]
+        spans = SpanSet(entities)
+        self.check_queries(spans, entities, rng)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# tests/test_token_store.py
+"""
+词语标注紧凑存储（pack_words / unpack_words）的往返测试
+
+打包后再还原，必须得到与原词语列表相同的词、词性和区间（word_index 为列表位置、不含 id），
+覆盖空文件、词与原文切片不一致（word_overrides）、词性种类超过 256（uint16 编码）等情况。
+
+运行: python -m pytest tests  或  python -m unittest discover tests
+"""
+import random
+import unittest
+from types import SimpleNamespace
+
+from app.token_store import pack_words, unpack_words
+
+FILE_ID = 42
+
+
+def round_trip(words, content):
+    values = pack_words(words, content)
+    pack = SimpleNamespace(file_id=FILE_ID, **values)
+    return values, unpack_words(pack, content)
+
+
+def expected_words(words):
+    return [
+        {
+            'file_id': FILE_ID,
+            'word_index': idx,
+            'word': w['word'],
+            'pos': w['pos'],
+            'pos_cn': w['pos_cn'],
+            'start_pos': w['start_pos'],
+            'end_pos': w['end_pos']
+        }
+        for idx, w in enumerate(words)
+    ]
+
+
+def segment(content, rng, pos_tags):
+    """把 content 随机切成连续的词"""
+    words, start = [], 0
+    while start < len(content):
+        end = min(len(content), start + rng.randint(1, 4))
+        pos = rng.choice(pos_tags)
+        words.append({'word': content[start:end], 'pos': pos, 'pos_cn': pos + '_cn', 'start_pos': start, 'end_pos': end})
+        start = end
+    return words
+
+
+class PackRoundTripTest(unittest.TestCase):
+
+    def check(self, words, content):
+        values, unpacked = round_trip(words, content)
+        self.assertEqual(values['token_count'], len(words))
+        self.assertEqual(unpacked, expected_words(words))
+        return values
+
+    def test_empty_file(self):
+        values = self.check([], '')
+        self.assertIsNone(values['word_overrides'])
+        self.check([], '没有分词结果的文本')
+
+    def test_segmented_text(self):
+        content = '北京大学的学生在图书馆读书。2024年5月1日，天气很好！'
+        rng = random.Random(1)
+        values = self.check(segment(content, rng, ['n', 'v', 'ns', 'x', 'm']), content)
+        self.assertIsNone(values['word_overrides'])
+
+    def test_words_differ_from_content(self):
+        content = '北京大学'
+        words = [
+            {'word': '北京', 'pos': 'ns', 'pos_cn': '地名', 'start_pos': 0, 'end_pos': 2},
+            {'word': '大學', 'pos': 'n', 'pos_cn': '名词', 'start_pos': 2, 'end_pos': 4},
+            {'word': '（空）', 'pos': 'x', 'pos_cn': '标点', 'start_pos': 4, 'end_pos': 4}
+        ]
+        values = self.check(words, content)
+        self.assertIsNotNone(values['word_overrides'])
+
+    def test_many_pos_tags(self):
+        rng = random.Random(2)
+        content = ''.join(rng.choice('天地玄黄宇宙洪荒日月盈昃') for _ in range(3000))
+        values = self.check(segment(content, rng, [f'p{i}' for i in range(300)]), content)
+        self.assertEqual(values['pos_codes'][:1], b'H')
+
+    def test_random_round_trip(self):
+        rng = random.Random(3)
+        for case in range(50):
+            content = ''.join(rng.choice('abc的了是，。') for _ in range(rng.randint(0, 200)))
+            with self.subTest(case=case, length=len(content)):
+                self.check(segment(content, rng, ['n', 'v', 'a', 'd']), content)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# tests/test_word_patch.py
+"""
+词语增量保存（merge_word_patch）测试
+
+对分词结果随机做合并、拆分、改词性，按前端 buildAnnotationPatch 的规则（按字符区间对应）生成增量，
+把增量应用到原词语列表后必须得到编辑后的列表。
+
+运行: python -m pytest tests  或  python -m unittest discover tests
+"""
+import random
+import unittest
+
+from app.annotation_store import merge_word_patch
+
+FIELDS = ('word', 'pos', 'pos_cn', 'start_pos', 'end_pos')
+
+
+def build_word_patch(saved, current):
+    """与 annotate.html 中 buildAnnotationPatch 的词语部分一致"""
+    old_words = {}
+    for index, word in enumerate(saved):
+        old_words[(word['start_pos'], word['end_pos'])] = (word, index)
+    patch = {'added': [], 'removed': [], 'modified': []}
+    matched = set()
+    for i, now in enumerate(current):
+        key = (now['start_pos'], now['end_pos'])
+        old = None if key in matched else old_words.get(key)
+        if old is None:
+            patch['added'].append(dict(now, word_index=i))
+            continue
+        matched.add(key)
+        if any(now[field] != old[0][field] for field in ('word', 'pos', 'pos_cn')):
+            patch['modified'].append(dict(now, word_index=i))
+    patch['removed'] = [index for key, (_, index) in old_words.items() if key not in matched]
+    return patch
+
+
+def segment(content, rng):
+    words, start = [], 0
+    while start < len(content):
+        end = min(len(content), start + rng.randint(1, 3))
+        words.append({'word': content[start:end], 'pos': 'n', 'pos_cn': '名词', 'start_pos': start, 'end_pos': end})
+        start = end
+    return words
+
+
+def edit(words, content, rng):
+    """随机合并相邻词、拆分词、修改词性"""
+    words = [dict(w) for w in words]
+    for _ in range(rng.randint(0, 6)):
+        if not words:
+            break
+        op = rng.random()
+        i = rng.randrange(len(words))
+        w = words[i]
+        if op < 0.35 and i + 1 < len(words):
+            nxt = words.pop(i + 1)
+            w.update(word=content[w['start_pos']:nxt['end_pos']], end_pos=nxt['end_pos'], pos='n', pos_cn='名词')
+        elif op < 0.7 and w['end_pos'] - w['start_pos'] > 1:
+            cut = rng.randrange(w['start_pos'] + 1, w['end_pos'])
+            right = {'word': content[cut:w['end_pos']], 'pos': 'v', 'pos_cn': '动词', 'start_pos': cut, 'end_pos': w['end_pos']}
+            w.update(word=content[w['start_pos']:cut], end_pos=cut)
+            words.insert(i + 1, right)
+        else:
+            w.update(pos='a', pos_cn='形容词')
+    return words
+
+
+def project(words):
+    return [tuple(w[field] for field in FIELDS) for w in words]
+
+
+class MergeWordPatchTest(unittest.TestCase):
+
+    def check(self, saved, current):
+        base = [dict(w, word_index=i) for i, w in enumerate(saved)]
+        merged = merge_word_patch(base, build_word_patch(saved, current))
+        self.assertEqual(project(merged), project(current))
+
+    def test_merge_and_split(self):
+        content = '北京大学医学部'
+        saved = [
+            {'word': '北京', 'pos': 'ns', 'pos_cn': '地名', 'start_pos': 0, 'end_pos': 2},
+            {'word': '大学', 'pos': 'n', 'pos_cn': '名词', 'start_pos': 2, 'end_pos': 4},
+            {'word': '医学部', 'pos': 'n', 'pos_cn': '名词', 'start_pos': 4, 'end_pos': 7}
+        ]
+        merged = [
+            {'word': content[0:4], 'pos': 'nt', 'pos_cn': '机构', 'start_pos': 0, 'end_pos': 4},
+            {'word': '医学', 'pos': 'n', 'pos_cn': '名词', 'start_pos': 4, 'end_pos': 6},
+            {'word': '部', 'pos': 'n', 'pos_cn': '名词', 'start_pos': 6, 'end_pos': 7}
+        ]
+        self.check(saved, merged)
+        self.check(merged, saved)
+        self.check(saved, saved)
+        self.check([], [])
+
+    def test_random_edits(self):
+        rng = random.Random(20240503)
+        for case in range(200):
+            content = ''.join(rng.choice('天地玄黄宇宙洪荒') for _ in range(rng.randint(0, 40)))
+            saved = segment(content, rng)
+            current = edit(saved, content, rng)
+            with self.subTest(case=case):
+                self.check(saved, current)
+
+
+if __name__ == '__main__':
+    unittest.main()